@@ -0,0 +1,7 @@
+"""
+成绩计算基准测试：合成成绩表生成器（synthetic）+ 计时运行器（run）。
+在仓库根目录运行：python -m benchmarks.run --help
+"""
+from benchmarks.synthetic import generate_grade_sheet, write_delimited, write_workbook
+
+__all__ = ['generate_grade_sheet', 'write_delimited', 'write_workbook']
@@ -0,0 +1,309 @@
+"""
+成绩计算基准测试：
+    python -m benchmarks.run --students 100 1000 10000 --output bench.json
+    python -m benchmarks.run --students 1000 --compare bench.json
+    python -m benchmarks.run --students 100000 --format csv --only load_data
+
+对每个规模生成合成成绩表并写成工作簿（或CSV/TSV），分别计时 load_data、detect_header_row、auto_detect_columns、
+calculate_all_students、export_to_excel、export_student_calculation_details，
+以及在算过的数据上追加最后一个学期并重新排名（append_records，与对合并后数据整表重新计算的用时对比，
+并逐项核对结果一致），输出吞吐量（行/秒、学生/秒）和峰值内存（tracemalloc）为 JSON，可与之前的结果对比。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import web
+from benchmarks.synthetic import generate_grade_sheet, parse_label_mix, write_delimited, write_workbook
+
+
+def _loaded_calculator(path, major_code):
+    """读入工作簿、换成紧凑数据表并设置专业的计算器（阶段缓存为空），与网页/命令行/服务的用法一致"""
+    calc = web.StudentGradeCalculator(path, reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data()
+    calc.compact()
+    calc.set_major(major_code)
+    return calc
+
+
+def _fresh_calculator(template):
+    """复用已解析的数据表，得到一个阶段缓存为空的新计算器"""
+    calc = web.StudentGradeCalculator(df=template.df, reporter=web.ConsoleReporter(quiet=True))
+    calc.header_row = template.header_row
+    calc.column_mapping = dict(template.column_mapping)
+    calc.set_major(template.current_major['专业代码'])
+    return calc
+
+
+def build_benchmarks(path, template, calc_mode, detail_workers):
+    """基准项：名称 -> (准备函数, 被计时函数)。准备函数的耗时不计入"""
+    raw_head = template.raw_data
+
+    def prepare_detect():
+        calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+        calc.raw_data = raw_head
+        return calc
+
+    def prepare_columns():
+        calc = web.StudentGradeCalculator(df=template.df, reporter=web.ConsoleReporter(quiet=True))
+        return calc
+
+    def prepare_export():
+        # 计算阶段已完成，只计导出
+        calc = _fresh_calculator(template)
+        calc.calculate_all_students(None, calc_mode)
+        return calc
+
+    def prepare_append():
+        # 去掉最后一个学期的记录先算一遍，再把这个学期作为新记录追加
+        sem_col = template.column_mapping['学年学期']
+        semesters = template.df[sem_col].astype(object)
+        new = semesters == max(semesters.dropna())
+        calc = web.StudentGradeCalculator(df=template.df[~new].reset_index(drop=True),
+                                          reporter=web.ConsoleReporter(quiet=True))
+        calc.header_row = template.header_row
+        calc.column_mapping = dict(template.column_mapping)
+        calc.set_major(template.current_major['专业代码'])
+        calc.calculate_all_students(None, calc_mode)
+        return calc, template.df[new]
+
+    def prepare_details():
+        calc = _fresh_calculator(template)
+        calc.calc_mode = calc_mode
+        return calc, tempfile.mkdtemp(prefix='bench-details-')
+
+    def run_details(state):
+        calc, output_dir = state
+        try:
+            calc.export_student_calculation_details(output_dir, workers=detail_workers)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {
+        'load_data': (lambda: web.StudentGradeCalculator(path, reporter=web.ConsoleReporter(quiet=True)),
+                      lambda calc: calc.load_data()),
+        'detect_header_row': (prepare_detect, lambda calc: calc.detect_header_row()),
+        'auto_detect_columns': (prepare_columns, lambda calc: calc.auto_detect_columns()),
+        'calculate_all_students': (lambda: _fresh_calculator(template),
+                                   lambda calc: calc.calculate_all_students(None, calc_mode)),
+        'export_to_excel': (prepare_export, lambda calc: calc.export_to_excel(BytesIO(), None, calc_mode)),
+        'export_student_calculation_details': (prepare_details, run_details),
+        # 计时含默认的抽查核对和追加后的重新排名，即网页/服务追加一个学期的实际开销；整表核对见 check_append
+        'append_records': (prepare_append, lambda state: run_append(state, calc_mode)),
+    }
+
+
+def run_append(state, calc_mode):
+    calc, new_rows = state
+    calc.append_records(new_rows, calc.column_mapping)
+    return calc.calculate_all_students(None, calc_mode)
+
+
+def check_append(benchmarks, calc_mode):
+    """追加后的结果与整表重新计算逐项核对，返回不一致之处的说明列表"""
+    prepare, _ = benchmarks['append_records']
+    calc, new_rows = prepare()
+    calc.append_records(new_rows, calc.column_mapping, verify=False)
+    return calc.check_consistency(None, calc_mode)
+
+
+def measure(prepare, func, repeat):
+    """取 repeat 次中的最短用时；另跑一次 tracemalloc 记录峰值内存（不计入用时）"""
+    best = None
+    for _ in range(repeat):
+        state = prepare()
+        start = time.perf_counter()
+        func(state)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    state = prepare()
+    tracemalloc.start()
+    try:
+        func(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmarks(students=(100, 1000, 10000), courses_per_student=(55, 65), label_mix=None,
+                   makeup_rate=0.03, absence_rate=0.01, junk_rows=2, major_code='23kg', calc_mode='保研',
+                   repeat=3, seed=0, detail_workers=1, details_max_students=500, only=None, file_format='xlsx',
+                   log=None):
+    """按各个学生规模运行全部基准项，返回可序列化为 JSON 的结果字典"""
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        for n_students in students:
+            start = time.perf_counter()
+            df = generate_grade_sheet(n_students, courses_per_student, label_mix, makeup_rate, absence_rate,
+                                      major_code, seed)
+            path = os.path.join(work_dir, f'grades_{n_students}.{file_format}')
+            if file_format == 'xlsx':
+                write_workbook(df, path, junk_rows)
+            else:
+                write_delimited(df, path, junk_rows, sep='\t' if file_format == 'tsv' else ',')
+            if log:
+                log(f"生成 {n_students} 名学生 / {len(df)} 行（{time.perf_counter() - start:.1f} 秒）")
+
+            template = _loaded_calculator(path, major_code)
+            n_rows = len(template.df)
+            benchmarks = build_benchmarks(path, template, calc_mode, detail_workers)
+            for name, (prepare, func) in benchmarks.items():
+                if only and name not in only:
+                    continue
+                entry = {'benchmark': name, 'students': n_students, 'rows': n_rows}
+                if name == 'export_student_calculation_details' and n_students > details_max_students:
+                    entry['skipped'] = f"学生数超过 --details-max-students={details_max_students}"
+                else:
+                    seconds, peak = measure(prepare, func, repeat)
+                    entry.update({
+                        'seconds': seconds,
+                        'rows_per_s': n_rows / seconds if seconds else None,
+                        'students_per_s': n_students / seconds if seconds else None,
+                        'peak_memory_bytes': peak,
+                    })
+                    if name == 'append_records':
+                        # 对照：同样的数据整表重新计算（与 calculate_all_students 基准项相同）
+                        prepare_full, run_full = benchmarks['calculate_all_students']
+                        full_seconds = measure(prepare_full, run_full, repeat)[0]
+                        entry['full_recompute_seconds'] = full_seconds
+                        entry['speedup_vs_full'] = full_seconds / seconds if seconds else None
+                        entry['consistency_problems'] = check_append(benchmarks, calc_mode)
+                results.append(entry)
+                if log:
+                    log(format_entry(entry))
+            del df, template
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'ingestion_version': web.INGESTION_VERSION,
+            'config': {
+                'courses_per_student': list(courses_per_student),
+                'label_mix': label_mix,
+                'makeup_rate': makeup_rate,
+                'absence_rate': absence_rate,
+                'junk_rows': junk_rows,
+                'format': file_format,
+                'major': major_code,
+                'mode': calc_mode,
+                'repeat': repeat,
+                'seed': seed,
+                'detail_workers': detail_workers,
+            },
+        },
+        'results': results,
+    }
+
+
+def format_entry(entry):
+    if 'skipped' in entry:
+        return f"  {entry['benchmark']:<36} {entry['students']:>7} 名学生  跳过（{entry['skipped']}）"
+    line = (f"  {entry['benchmark']:<36} {entry['students']:>7} 名学生  {entry['seconds']:9.4f} 秒  "
+            f"{entry['rows_per_s']:>12,.0f} 行/秒  {entry['students_per_s']:>10,.0f} 学生/秒  "
+            f"峰值 {entry['peak_memory_bytes'] / 1024 / 1024:8.1f} MB")
+    if 'full_recompute_seconds' in entry:
+        line += f"  整表重算 {entry['full_recompute_seconds']:.4f} 秒（{entry['speedup_vs_full']:.2f} 倍）"
+    if 'consistency_problems' in entry:
+        problems = entry['consistency_problems']
+        line += "  与整表计算一致" if not problems else f"  ⚠️ 与整表计算不一致: {'；'.join(problems)}"
+    return line
+
+
+def compare(current, baseline):
+    """与之前的结果对比：按（基准项, 学生数）配对，返回 [(名称, 学生数, 之前用时, 现在用时, 加速比)]"""
+    previous = {(e['benchmark'], e['students']): e for e in baseline['results'] if 'seconds' in e}
+    rows = []
+    for entry in current['results']:
+        old = previous.get((entry['benchmark'], entry['students']))
+        if old is None or 'seconds' not in entry:
+            continue
+        rows.append((entry['benchmark'], entry['students'], old['seconds'], entry['seconds'],
+                     old['seconds'] / entry['seconds'] if entry['seconds'] else None))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='成绩计算基准测试')
+    parser.add_argument('--students', type=int, nargs='+', default=[100, 1000, 10000], help='学生规模（可多个）')
+    parser.add_argument('--courses-per-student', type=int, nargs=2, default=[55, 65], metavar=('MIN', 'MAX'),
+                        help='每人课程数范围')
+    parser.add_argument('--label-mix', default=None, help="成绩构成，如 'numeric=0.8,通过=0.1,优秀=0.05,合格=0.05'")
+    parser.add_argument('--makeup-rate', type=float, default=0.03, help='补考课程比例')
+    parser.add_argument('--absence-rate', type=float, default=0.01, help='旷考比例')
+    parser.add_argument('--junk-rows', type=int, default=2, help='表头上方的标题/空行数')
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'tsv'], default='xlsx', help='合成成绩表的文件格式')
+    parser.add_argument('--major', default='23kg', help='专业代码（决定选修课列表）')
+    parser.add_argument('--mode', choices=['保研', '综测'], default='保研')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数（取最短用时）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--detail-workers', type=int, default=1)
+    parser.add_argument('--details-max-students', type=int, default=500,
+                        help='学生数超过该值时跳过明细导出基准')
+    parser.add_argument('--only', nargs='+', default=None, help='只运行指定的基准项')
+    parser.add_argument('-o', '--output', default=None, help='结果 JSON 文件（默认输出到标准输出）')
+    parser.add_argument('--compare', default=None, help='与之前的结果 JSON 对比')
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr, flush=True)
+    report = run_benchmarks(
+        students=args.students,
+        courses_per_student=tuple(args.courses_per_student),
+        label_mix=parse_label_mix(args.label_mix) if args.label_mix else None,
+        makeup_rate=args.makeup_rate,
+        absence_rate=args.absence_rate,
+        junk_rows=args.junk_rows,
+        major_code=args.major,
+        calc_mode=args.mode,
+        repeat=max(1, args.repeat),
+        seed=args.seed,
+        detail_workers=max(1, args.detail_workers),
+        details_max_students=args.details_max_students,
+        only=args.only,
+        file_format=args.format,
+        log=log,
+    )
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['comparison'] = [
+            {'benchmark': name, 'students': n, 'baseline_seconds': old, 'seconds': new, 'speedup': speedup}
+            for name, n, old, new, speedup in compare(report, baseline)
+        ]
+        log("与基准对比（加速比 >1 表示变快）：")
+        for row in report['comparison']:
+            log(f"  {row['benchmark']:<36} {row['students']:>7} 名学生  "
+                f"{row['baseline_seconds']:9.4f} → {row['seconds']:9.4f} 秒  ×{row['speedup']:.2f}")
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if any(entry.get('consistency_problems') for entry in report['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
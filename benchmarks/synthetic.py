@@ -0,0 +1,177 @@
+"""
+合成成绩表生成器 —— 按教务系统“成绩综合查询”导出的格式生成任意规模的成绩表。
+课程池 = 各专业通用的必修课 + MajorConfig 中该专业的选修课列表，成绩为数字与等级混合，
+并按比例加入补考（初修不及格 + 补考记录）和旷考记录；写出工作簿或CSV/TSV时可在表头上方加标题/空行。
+"""
+import numpy as np
+import pandas as pd
+
+from web import MajorConfig
+
+# 导出表的全部列（与 2023级成绩综合查询.xlsx 一致）
+COLUMNS = ['选课号', '学年学期', '上课院系', '上课年级', '上课专业', '上课班级', '学号', '姓名',
+           '课程编号', '课程名称', '开课单位', '学时', '学分', '授课教师', '总成绩', '绩点',
+           '修读类型', '取得方式', '成绩标志']
+
+SEMESTERS = ['2023秋季学期', '2024春季学期', '2024秋季学期', '2025春季学期', '2025夏季学期', '2025秋季学期']
+
+# 通用必修课（不参与选修课折算）
+COMPULSORY_COURSES = [
+    '高等数学A(1)', '高等数学A(2)', '线性代数', '概率论与数理统计', '大学物理(1)', '大学物理(2)',
+    '大学物理实验', '大学化学', '大学英语(1)', '大学英语(2)', '大学英语(3)', '体育(1)', '体育(2)',
+    '体育(3)', '体育(4)', '思想道德与法治', '中国近现代史纲要', '马克思主义基本原理',
+    '毛泽东思想和中国特色社会主义理论体系概论', '形势与政策', '军事理论', '地球科学概论',
+    '普通地质学', '结晶学与矿物学', '岩石学', '构造地质学', '地球物理学原理', '数字信号处理',
+    '重力与磁法勘探', '地震勘探原理', '电法勘探', '数学物理方程', '复变函数与积分变换',
+    '程序设计基础', '地质旅行I', '地质旅行II', '海洋学', '毕业实习', '毕业论文', '创新创业实践'
+]
+
+DEPARTMENTS = ['地球探测与信息技术系', '数学系', '物理与光电工程学院', '大学外语教学部', '体育系',
+               '马院（开课系）', '海洋地质系', '化学系']
+
+SURNAMES = list('王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢')
+GIVEN_CHARS = list('伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰萍红鹏辉宇浩然子轩欣怡思雨博文佳琪晨阳嘉瑞')
+
+# 默认成绩构成：大部分为数字成绩，其余为常见等级
+DEFAULT_LABEL_MIX = {'numeric': 0.82, '通过': 0.08, '优秀': 0.03, '良好': 0.03, '中等': 0.01, '合格': 0.02, '及格': 0.01}
+
+
+def course_pool(major_code='23kg'):
+    """课程池：[(课程名称, 课程编号, 学分, 开课单位)]，选修课来自 MajorConfig 的选修课列表"""
+    major = MajorConfig().get_major(major_code) or {}
+    electives = [course for courses in major.get('选修课列表', {}).values() for course in courses]
+    names = list(dict.fromkeys(COMPULSORY_COURSES + electives))
+    rng = np.random.default_rng(20230)
+    credits = rng.choice([1.0, 1.5, 2.0, 2.5, 3.0, 4.0], size=len(names))
+    departments = rng.choice(DEPARTMENTS, size=len(names))
+    return [(name, f"{81300000000 + i * 1013:012d}", float(credit), str(dept))
+            for i, (name, credit, dept) in enumerate(zip(names, credits, departments))]
+
+
+def parse_label_mix(text):
+    """命令行成绩构成参数：'numeric=0.8,通过=0.1,优秀=0.1' → 字典"""
+    mix = {}
+    for item in text.split(','):
+        if item.strip():
+            label, weight = item.split('=', 1)
+            mix[label.strip()] = float(weight)
+    return mix
+
+
+def generate_grade_sheet(n_students=1000, courses_per_student=(55, 65), label_mix=None,
+                         makeup_rate=0.03, absence_rate=0.01, major_code='23kg', seed=0):
+    """
+    生成成绩表 DataFrame（列与导出表一致，成绩为文本）。
+    courses_per_student 为每人课程数的 (最少, 最多)，超过课程池大小时按课程池大小截断；
+    label_mix 为 {'numeric' 或等级文本: 权重}；makeup_rate 为补考课程比例，absence_rate 为旷考比例。
+    """
+    rng = np.random.default_rng(seed)
+    pool = course_pool(major_code)
+    low, high = courses_per_student
+    high = min(high, len(pool))
+    low = min(low, high)
+
+    # 每位学生从课程池中不重复地抽取若干门课：随机矩阵按行 argsort 取前 k 个
+    counts = rng.integers(low, high + 1, size=n_students)
+    order = np.argsort(rng.random((n_students, len(pool))), axis=1)
+    mask = np.arange(len(pool))[None, :] < counts[:, None]
+    student_index = np.repeat(np.arange(n_students), counts)
+    course_index = order[mask]
+    n_rows = len(course_index)
+
+    student_ids = np.array([str(23040031000 + i) for i in range(n_students)], dtype=object)
+    names = np.array([rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_CHARS, size=rng.integers(1, 3)))
+                      for _ in range(n_students)], dtype=object)
+
+    course_names = np.array([c[0] for c in pool], dtype=object)
+    course_codes = np.array([c[1] for c in pool], dtype=object)
+    course_credits = np.array([c[2] for c in pool])
+    course_departments = np.array([c[3] for c in pool], dtype=object)
+
+    # 成绩：按构成比例抽取数字成绩或等级文本
+    mix = label_mix or DEFAULT_LABEL_MIX
+    labels = list(mix)
+    weights = np.array([mix[label] for label in labels], dtype=float)
+    kinds = rng.choice(len(labels), size=n_rows, p=weights / weights.sum())
+    numeric = np.clip(rng.normal(80, 9, size=n_rows), 0, 100).round(1)
+    numeric_text = np.where(numeric == np.floor(numeric), numeric.astype(int).astype(str), numeric.astype(str))
+    scores = np.array(labels, dtype=object)[kinds]
+    is_numeric = np.array([label == 'numeric' for label in labels])[kinds]
+    scores[is_numeric] = numeric_text[is_numeric]
+
+    exam_types = np.full(n_rows, '初修取得', dtype=object)
+    study_types = np.full(n_rows, '初修', dtype=object)
+    flags = np.full(n_rows, None, dtype=object)
+
+    # 旷考：成绩记0并标注
+    absent = rng.random(n_rows) < absence_rate
+    scores[absent] = '0'
+    flags[absent] = '旷考'
+
+    # 补考：初修成绩改为不及格，再追加一条补考记录（多数补考通过）
+    makeup = (rng.random(n_rows) < makeup_rate) & ~absent
+    scores[makeup] = rng.integers(30, 60, size=makeup.sum()).astype(str)
+    makeup_rows = np.flatnonzero(makeup)
+
+    semesters = np.array(SEMESTERS, dtype=object)[rng.integers(0, len(SEMESTERS), size=n_rows)]
+
+    frame = {
+        '学年学期': semesters,
+        '学号': student_ids[student_index],
+        '姓名': names[student_index],
+        '课程编号': course_codes[course_index],
+        '课程名称': course_names[course_index],
+        '开课单位': course_departments[course_index],
+        '学分': course_credits[course_index],
+        '总成绩': scores,
+        '修读类型': study_types,
+        '取得方式': exam_types,
+        '成绩标志': flags,
+    }
+    df = pd.DataFrame(frame)
+
+    if len(makeup_rows):
+        retake = df.iloc[makeup_rows].copy()
+        retake['总成绩'] = rng.integers(40, 100, size=len(retake)).astype(str)
+        retake['取得方式'] = '补考取得'
+        retake['成绩标志'] = None
+        # 补考记录紧跟在原记录之后
+        df = pd.concat([df, retake]).sort_index(kind='mergesort').reset_index(drop=True)
+
+    major = MajorConfig().get_major(major_code) or {}
+    major_name = major.get('专业名称', major_code)
+    df['选课号'] = [f"{i % 100000000:08d}" for i in range(len(df))]
+    df['上课院系'] = '海洋地球科学学院'
+    df['上课年级'] = 2023
+    df['上课专业'] = major_name
+    df['上课班级'] = f"{major_name}23"
+    df['学时'] = (df['学分'] * 16).astype(int)
+    df['授课教师'] = np.array([rng.choice(SURNAMES) + rng.choice(GIVEN_CHARS) for _ in range(50)],
+                          dtype=object)[rng.integers(0, 50, size=len(df))]
+    numeric_scores = pd.to_numeric(df['总成绩'], errors='coerce')
+    df['绩点'] = ((numeric_scores.fillna(75) - 50) / 10).clip(lower=0).round(1)
+    return df[COLUMNS]
+
+
+def write_workbook(df, path, junk_rows=2, title='成绩综合查询'):
+    """写出 xlsx：表头上方先写 junk_rows 行（首行为标题，其余为空行），与教务系统导出的格式一致"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    for i in range(junk_rows):
+        sheet.append([title] if i == 0 else [])
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([None if isinstance(value, float) and np.isnan(value) else value for value in row])
+    workbook.save(path)
+    return path
+
+
+def write_delimited(df, path, junk_rows=2, title='成绩综合查询', sep=',', encoding='gbk'):
+    """写出CSV/TSV文本导出（默认GBK编码），表头上方的标题/空行与 write_workbook 相同"""
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        for i in range(junk_rows):
+            f.write((title if i == 0 else '') + '\n')
+        df.to_csv(f, sep=sep, index=False, lineterminator='\n')
+    return path
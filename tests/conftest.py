@@ -0,0 +1,38 @@
+"""
+测试共用的夹具：合成成绩表（按参数缓存）和由成绩表直接构建的计算器。
+"""
+import pytest
+
+import web
+from benchmarks.synthetic import generate_grade_sheet
+
+
+@pytest.fixture(scope='session')
+def grade_sheet():
+    """
+    grade_sheet(学生数, 每人课程数, makeup_rate=..., absence_rate=..., major_code=..., seed=...) 返回合成成绩表，
+    参数与 generate_grade_sheet 相同；同一组参数只生成一次，每次返回副本，测试可以随意修改
+    """
+    sheets = {}
+
+    def make(n_students, courses_per_student=(30, 40), makeup_rate=0.03, absence_rate=0.01, major_code='23kg',
+             seed=0):
+        key = (n_students, courses_per_student, makeup_rate, absence_rate, major_code, seed)
+        if key not in sheets:
+            sheets[key] = generate_grade_sheet(n_students, courses_per_student, makeup_rate=makeup_rate,
+                                               absence_rate=absence_rate, major_code=major_code, seed=seed)
+        return sheets[key].copy()
+    return make
+
+
+@pytest.fixture(scope='session')
+def make_calculator():
+    """make_calculator(df, major='23kg', compact=False)：由成绩表构建已识别列名、已设置专业的计算器（不输出提示）"""
+    def make(df, major='23kg', compact=False):
+        calc = web.StudentGradeCalculator(df=df.reset_index(drop=True), reporter=web.ConsoleReporter(quiet=True))
+        calc.auto_detect_columns()
+        if compact:
+            calc.compact()
+        calc.set_major(major)
+        return calc
+    return make
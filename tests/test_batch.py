@@ -0,0 +1,90 @@
+"""
+多专业批量计算（calculate_batch）的一致性测试：混合多个专业学生的成绩表一次计算，
+每个专业的排名必须与只含该专业学生的成绩表单独计算（calculate_all_students）完全一致；
+按学号前缀、名单、成绩表专业列三种方式分配专业，分不到专业的学生单独报告。
+运行：python -m pytest -q tests
+"""
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+
+# 各专业的学号前缀；'2204003' 开头的学生专业列无法识别，三种分配方式下都分不到专业
+COHORTS = {'23kg': '2304003', '23dz': '2304002', '24kg': '2404003'}
+STRAY_PREFIX = '2204003'
+PREFIX_RULES = {'23': '23dx', **{prefix: major for major, prefix in COHORTS.items()}}
+
+
+@pytest.fixture(scope='module')
+def mixed(grade_sheet):
+    parts = []
+    for seed, (major, prefix) in enumerate(COHORTS.items()):
+        part = grade_sheet(40, makeup_rate=0.05, absence_rate=0.02, major_code=major, seed=seed)
+        part['学号'] = part['学号'].str.replace('2304003', prefix, n=1)
+        parts.append(part)
+    stray = grade_sheet(8, major_code='23kg', seed=9)
+    stray['学号'] = stray['学号'].str.replace('2304003', STRAY_PREFIX, n=1)
+    stray['上课专业'] = '外院专业'
+    parts.append(stray)
+    # 各专业学生的记录交错排列
+    return pd.concat(parts).sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def cohort(mixed, major):
+    return mixed[mixed['学号'].str.startswith(COHORTS[major])]
+
+
+def assignment(calc, mixed, method):
+    if method == 'prefix':
+        return calc.assign_majors_by_prefix(PREFIX_RULES)
+    if method == 'roster':
+        roster = pd.concat([pd.DataFrame({'学号': pd.unique(cohort(mixed, major)['学号']).astype('int64'),
+                                          '专业': code})
+                            for major, code in zip(COHORTS, ['23kg', '23地质', '24勘工'])])
+        return calc.assign_majors_by_roster(roster)
+    return calc.assign_majors_by_column()
+
+
+@pytest.mark.parametrize('calc_mode', ['保研', '综测'])
+@pytest.mark.parametrize('semesters', ['all', 'partial'])
+@pytest.mark.parametrize('method', ['prefix', 'roster', 'column'])
+def test_batch_matches_per_major_runs(mixed, make_calculator, method, calc_mode, semesters):
+    semester_filter = sorted(mixed['学年学期'].unique())[-3:] if semesters == 'partial' else None
+    calc = make_calculator(mixed)
+    results, unassigned = calc.calculate_batch(assignment(calc, mixed, method), semester_filter, calc_mode)
+
+    assert sorted(results) == sorted(COHORTS)
+    for major in COHORTS:
+        expected = make_calculator(cohort(mixed, major), major=major).calculate_all_students(semester_filter, calc_mode)
+        result_df, excellent_count, normal_count = results[major]
+        assert (excellent_count, normal_count) == expected[1:]
+        pd.testing.assert_frame_equal(result_df, expected[0], check_exact=True)
+    assert unassigned == sorted(pd.unique(mixed.loc[mixed['学号'].str.startswith(STRAY_PREFIX), '学号']))
+
+
+def test_longest_prefix_wins(mixed, make_calculator):
+    calc = make_calculator(mixed)
+    assigned = calc.assign_majors_by_prefix(PREFIX_RULES)
+    assert {assigned[sid] for sid in cohort(mixed, '23kg')['学号']} == {'23kg'}
+    assert calc.assign_majors_by_prefix({'23': '23dx'})[cohort(mixed, '23dz')['学号'].iloc[0]] == '23dx'
+
+
+def test_unassigned_students_reported(mixed, make_calculator):
+    calc = make_calculator(mixed)
+    assigned = calc.assign_majors_by_prefix(PREFIX_RULES)
+    # 分配到不存在的专业代码的学生也算作未分配
+    unknown = sorted(pd.unique(cohort(mixed, '24kg')['学号']))
+    assigned.update({sid: 'nope' for sid in unknown})
+    results, unassigned = calc.calculate_batch(assigned)
+
+    stray = sorted(pd.unique(mixed.loc[mixed['学号'].str.startswith(STRAY_PREFIX), '学号']))
+    assert sorted(results) == ['23dz', '23kg']
+    assert sorted(unassigned) == sorted(stray + unknown)
+
+    output = io.BytesIO()
+    calc.export_batch_to_excel(output, results, unassigned)
+    book = openpyxl.load_workbook(output, read_only=True)
+    assert sorted(book.sheetnames) == sorted(['23勘工', '23地质', '批量计算配置'])
+    config = {row[0]: row[1] for row in book['批量计算配置'].iter_rows(values_only=True) if row and row[0]}
+    assert config['未分配专业的学生'] == len(stray) + len(unknown)
@@ -0,0 +1,115 @@
+"""
+课程分类的一致性测试：整列分类（classify_courses，预编译匹配器 + 每个不同课程只分类一次）
+与逐行按选修课清单顺序比对的原实现结果必须完全一致，包括“先匹配先得”的顺序、
+未设置专业时的旧分类方法（_classify_course_legacy），以及选修课清单变化后匹配器的重建。
+运行：python -m pytest -q tests
+"""
+import pandas as pd
+import pytest
+
+import web
+
+MAJORS = list(web.MajorConfig().majors)
+MAPPING = {'课程名称': '课程名称', '课程编号': '课程编号'}
+
+
+def legacy_classify(elective_courses, course_name, course_code):
+    """原逐行分类：按选修课清单的类别顺序、类别内关键词顺序逐个比对，先匹配先得"""
+    for course_type, courses in elective_courses.items():
+        for kw in courses:
+            if kw in course_name or kw in course_code:
+                return course_type
+    return '必修课程'
+
+
+def all_keywords():
+    """所有专业（及旧分类方法）选修课清单中的关键词，按出现顺序去重"""
+    lists = [major.get('选修课列表', {}) for major in web.MajorConfig().majors.values()]
+    lists.append(web.StudentGradeCalculator.LEGACY_ELECTIVE_COURSES)
+    return list(dict.fromkeys(kw for courses in lists for kws in courses.values() for kw in kws))
+
+
+def courses_frame():
+    keywords = all_keywords()
+    names, codes = [], []
+    for kw in keywords:
+        names += [kw, f'{kw}（实验）', '', '高等数学']
+        codes += ['', '', kw, f'MATH{len(names)}']
+    # 一门课同时命中两个类别的关键词：后一个类别的关键词写在前面，仍按清单顺序归入前一个类别
+    for courses in [web.StudentGradeCalculator.LEGACY_ELECTIVE_COURSES] + [
+            major['选修课列表'] for major in web.MajorConfig().majors.values() if any(major['选修课列表'].values())]:
+        first, second = [kws[0] for kws in courses.values() if kws][:2]
+        names += [f'{second}与{first}', f'{second}与{first}']
+        codes += ['', first]
+    names += [None, '形势与政策', '大学英语']
+    codes += [None, None, 'ENG101']
+    df = pd.DataFrame({'课程名称': names, '课程编号': codes})
+    return pd.concat([df, df.iloc[::-1]], ignore_index=True)  # 重复课程：同一课程只分类一次后展开
+
+
+def make_calculator(major):
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.column_mapping = dict(MAPPING)
+    if major is not None:
+        assert calc.set_major(major)
+    return calc
+
+
+def row_wise(calc, df):
+    return pd.Series([calc.classify_course(row) for _, row in df.iterrows()], index=df.index, dtype=object)
+
+
+def expected(elective_courses, df):
+    return pd.Series([legacy_classify(elective_courses, '' if pd.isna(name) else name, '' if pd.isna(code) else code)
+                      for name, code in zip(df['课程名称'], df['课程编号'])], index=df.index, dtype=object)
+
+
+@pytest.mark.parametrize('major', MAJORS + [None])
+def test_matches_row_wise_loop(major):
+    calc = make_calculator(major)
+    df = courses_frame()
+    elective_courses = calc.current_major['选修课列表'] if major else calc.LEGACY_ELECTIVE_COURSES
+
+    classified = calc.classify_courses(df)
+    pd.testing.assert_series_equal(classified, expected(elective_courses, df))
+    pd.testing.assert_series_equal(classified, row_wise(calc, df))
+    if major is None:
+        legacy = [calc._classify_course_legacy('' if pd.isna(name) else name, '' if pd.isna(code) else code)
+                  for name, code in zip(df['课程名称'], df['课程编号'])]
+        assert classified.tolist() == legacy
+
+
+@pytest.mark.parametrize('major', ['23kg', None])
+def test_first_match_wins(major):
+    calc = make_calculator(major)
+    courses = calc.current_major['选修课列表'] if major else calc.LEGACY_ELECTIVE_COURSES
+    basic, skill = courses['学科基础课程'][0], courses['工作技能课程'][0]
+    df = pd.DataFrame({'课程名称': [f'{skill}{basic}', skill], '课程编号': ['', basic]})
+    assert calc.classify_courses(df).tolist() == ['学科基础课程', '学科基础课程']
+
+
+def test_classifier_rebuilt_when_course_lists_change():
+    df = courses_frame()
+    calc = make_calculator('23kg')
+    first = calc.get_course_classifier()
+    calc.classify_courses(df)
+
+    calc.set_major('23dz')
+    assert calc.get_course_classifier() is not first
+    pd.testing.assert_series_equal(calc.classify_courses(df), expected(calc.current_major['选修课列表'], df))
+
+    # 界面加载自定义培养方案时直接替换 current_major（不经过 set_major）
+    custom = {'专业名称': '自定义', '专业代码': 'custom', '有卓越班': False, '学分要求': {'学科基础课程': 2.0},
+              '选修课列表': {'学科基础课程': ['大学英语'], '专业知识课程': [], '工作技能课程': []}}
+    calc.current_major = custom
+    pd.testing.assert_series_equal(calc.classify_courses(df), expected(custom['选修课列表'], df))
+    assert (calc.classify_courses(df) == '学科基础课程').sum() == 2
+
+    # 同一份培养方案的清单原地追加课程后也要重建
+    custom['选修课列表']['工作技能课程'].append('形势与政策')
+    pd.testing.assert_series_equal(calc.classify_courses(df), expected(custom['选修课列表'], df))
+    assert (calc.classify_courses(df) == '工作技能课程').sum() == 2
+
+    # 清空专业后回到旧分类方法
+    calc.current_major = None
+    pd.testing.assert_series_equal(calc.classify_courses(df), expected(calc.LEGACY_ELECTIVE_COURSES, df))
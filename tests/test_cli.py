@@ -0,0 +1,94 @@
+"""
+命令行批量计算（run_cli）的测试：通配符展开、学期筛选、明细压缩包和 --perf-log 输出，
+汇总工作簿与 export_to_excel 的结果一致；有文件失败时返回1并逐个报告。
+运行：python -m pytest -q tests
+"""
+import io
+import json
+import os
+import shutil
+import zipfile
+
+import pandas as pd
+import pytest
+
+import web
+
+MAJOR = '23kg'
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        '2023级勘查技术与工程专业成绩综合查询.xlsx')
+
+
+@pytest.fixture(scope='module')
+def reference():
+    calc = web.StudentGradeCalculator(WORKBOOK, reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data()
+    calc.compact()
+    calc.set_major(MAJOR)
+    semesters = sorted(calc.df[calc.column_mapping['学年学期']].dropna().unique())[-2:]
+    output = io.BytesIO()
+    _, excellent_count, normal_count = calc.export_to_excel(output, semesters, '综测')
+    detail_names = calc.export_student_details_zip(io.BytesIO())[2]
+    return semesters, output, excellent_count + normal_count, sorted(detail_names)
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    folder = tmp_path / 'in'
+    folder.mkdir()
+    for name in ('a.xlsx', 'b.xlsx'):
+        shutil.copy(WORKBOOK, folder / name)
+    return folder
+
+
+def read_sheets(source):
+    """各工作表内容；计算配置去掉计算时间和性能统计（每次运行都不同）"""
+    sheets = pd.read_excel(source, sheet_name=None)
+    config = sheets['计算配置']
+    config = config.iloc[:config['配置项'].isna().idxmax()] if config['配置项'].isna().any() else config
+    sheets['计算配置'] = config[config['配置项'] != '计算时间'].reset_index(drop=True)
+    return sheets
+
+
+def test_batch_run(inputs, tmp_path, reference, capsys):
+    semesters, expected, student_count, detail_names = reference
+    out = tmp_path / 'out'
+    # 通配符和重复给出的文件只处理一次
+    rc = web.run_cli([str(inputs / '*.xlsx'), str(inputs / 'a.xlsx'), '--major', MAJOR, '--mode', '综测',
+                      '--semester', semesters[0], '--semester', semesters[1], '-o', str(out), '-j', '1',
+                      '--details', '--detail-workers', '1', '--perf-log'])
+    captured = capsys.readouterr()
+    assert rc == 0
+    assert captured.out.count('✅') == 2 and '失败 0 个' in captured.out
+
+    expected_sheets = read_sheets(expected)
+    for stem in ('a', 'b'):
+        summary = out / f'{stem}_23勘工_综测_成绩计算结果.xlsx'
+        sheets = read_sheets(summary)
+        assert list(sheets) == list(expected_sheets)
+        for name, frame in expected_sheets.items():
+            pd.testing.assert_frame_equal(sheets[name], frame, check_exact=True)
+        with zipfile.ZipFile(out / f'{stem}_23勘工_计算明细.zip') as archive:
+            assert sorted(archive.namelist()) == detail_names
+
+    logs = [json.loads(line) for line in captured.err.splitlines() if line.startswith('{')]
+    assert sorted(os.path.basename(log['file']) for log in logs) == ['a.xlsx', 'b.xlsx']
+    for log in logs:
+        assert log['event'] == 'grade_calculation' and log['semesters'] == semesters
+        assert log['students'] == student_count and log['details'] is True
+        assert {'成绩换算', '排名', '生成明细压缩包'} <= {stage['stage'] for stage in log['stages']}
+
+
+def test_missing_file_fails(inputs, tmp_path, capsys):
+    missing = str(tmp_path / 'missing.xlsx')
+    rc = web.run_cli([str(inputs / 'a.xlsx'), missing, '--major', MAJOR, '-o', str(tmp_path / 'out'), '-j', '2'])
+    out = capsys.readouterr().out
+    assert rc == 1
+    assert any(line.startswith(f'❌ {missing}') for line in out.splitlines())
+    assert '成功 1 个，失败 1 个' in out
+    assert (tmp_path / 'out' / 'a_23勘工_保研_成绩计算结果.xlsx').exists()
+
+
+def test_no_matching_files(tmp_path, capsys):
+    assert web.run_cli([str(tmp_path / '*.xlsx'), '--major', MAJOR]) == 1
+    assert '没有找到任何成绩表文件' in capsys.readouterr().err
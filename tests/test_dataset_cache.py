@@ -0,0 +1,95 @@
+"""
+磁盘数据集缓存（DatasetCache）的测试：Parquet 读回的数据表与 load_data 解析结果完全一致（排名也一致），
+解析代码版本变化或条目损坏时不命中、重新解析，总大小超限时按最近使用时间淘汰。
+运行：python -m pytest -q tests
+"""
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+import web
+
+MAJOR = '23kg'
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        '2023级勘查技术与工程专业成绩综合查询.xlsx')
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['plain', 'compact'])
+def parsed(request):
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data(WORKBOOK)
+    if request.param:
+        calc.compact()
+    return calc
+
+
+def ranking(df, column_mapping):
+    calc = web.StudentGradeCalculator(df=df, reporter=web.ConsoleReporter(quiet=True))
+    calc.column_mapping = dict(column_mapping)
+    calc.set_major(MAJOR)
+    return calc.calculate_all_students(None, '保研')[0]
+
+
+def test_round_trip_matches_load_data(parsed, tmp_path):
+    cache = web.DatasetCache(str(tmp_path))
+    assert cache.put('sample', parsed.header_row, parsed.column_mapping, parsed.df)
+
+    entry = web.DatasetCache(str(tmp_path)).get('sample')
+    assert entry['header_row'] == parsed.header_row
+    assert entry['column_mapping'] == parsed.column_mapping
+    pd.testing.assert_frame_equal(entry['df'], parsed.df, check_exact=True)
+    pd.testing.assert_frame_equal(ranking(entry['df'], entry['column_mapping']),
+                                  ranking(parsed.df, parsed.column_mapping), check_exact=True)
+
+
+def test_version_change_forces_reparse(parsed, tmp_path, monkeypatch):
+    cache = web.DatasetCache(str(tmp_path))
+    cache.put('sample', parsed.header_row, parsed.column_mapping, parsed.df)
+    assert cache.get('sample') is not None
+
+    monkeypatch.setattr(web, 'INGESTION_VERSION', web.INGESTION_VERSION + 1)
+    assert cache.get('sample') is None
+    assert cache.misses == 1
+
+    # 元数据中的版本与文件名不符（如旧版本写下的条目被改名）：不使用并删除
+    old_files = glob.glob(os.path.join(str(tmp_path), 'sample-*'))
+    for path in old_files:
+        base, ext = os.path.splitext(path)
+        os.replace(path, cache._base_path('sample') + ext)
+    assert cache.get('sample') is None
+    assert len(cache) == 0
+
+
+def test_corrupt_entry_is_dropped(parsed, tmp_path):
+    cache = web.DatasetCache(str(tmp_path))
+    cache.put('sample', parsed.header_row, parsed.column_mapping, parsed.df)
+    with open(cache._base_path('sample') + '.parquet', 'wb') as f:
+        f.write(b'not parquet')
+    assert cache.get('sample') is None
+    assert len(cache) == 0
+
+
+def test_eviction_by_size(parsed, tmp_path):
+    cache = web.DatasetCache(str(tmp_path))
+    cache.put('a', parsed.header_row, parsed.column_mapping, parsed.df)
+    entry_bytes = cache.total_bytes()
+    cache.max_bytes = int(entry_bytes * 2.5)
+
+    def age(key, seconds):
+        base = cache._base_path(key)
+        for suffix in ('.parquet', cache.META_SUFFIX):
+            stat = os.stat(base + suffix)
+            os.utime(base + suffix, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+    age('a', 30)
+    cache.put('b', parsed.header_row, parsed.column_mapping, parsed.df)
+    age('b', 20)
+    # 读取会刷新最近使用时间：a 比 b 新，超限时先淘汰 b
+    assert cache.get('a') is not None
+    cache.put('c', parsed.header_row, parsed.column_mapping, parsed.df)
+
+    assert len(cache) == 2 and cache.total_bytes() <= cache.max_bytes
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
@@ -0,0 +1,77 @@
+"""
+CSV/TSV 分块读取（_load_delimited）的回归测试：
+由示例成绩表导出的各种文本格式（编码、分隔符、表头前的说明行）读入后，数据和排名必须与读取工作簿一致。
+运行：python -m pytest -q tests
+"""
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import web
+
+MAJOR = '23kg'
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        '2023级勘查技术与工程专业成绩综合查询.xlsx')
+
+
+def quiet():
+    return web.ConsoleReporter(quiet=True)
+
+
+@pytest.fixture(scope='module')
+def workbook():
+    calc = web.StudentGradeCalculator(reporter=quiet())
+    calc.load_data(WORKBOOK)
+    table = pd.read_excel(WORKBOOK, header=calc.header_row)
+    return calc, table
+
+
+def load_text(text, encoding='utf-8'):
+    source = io.BytesIO(text.encode(encoding))
+    calc = web.StudentGradeCalculator(reporter=quiet())
+    calc.CSV_CHUNK_ROWS = 700
+    success, missing = calc.load_data(source)
+    assert success, missing
+    # 调用方传入的文件对象读完后仍可使用
+    assert not source.closed
+    return calc
+
+
+def ranking(calc, calc_mode):
+    ranked = web.StudentGradeCalculator(df=calc.df, reporter=quiet())
+    ranked.column_mapping = dict(calc.column_mapping)
+    ranked.set_major(MAJOR)
+    return ranked.calculate_all_students(None, calc_mode)[0]
+
+
+# 表头之前的说明行：引号内含换行的单元格占多个物理行，
+# 以及 \x0b、\u2028 等 csv 模块和 pandas 都不当作换行、但 str.splitlines 会断行的字符
+PREAMBLES = {
+    'none': '',
+    'title': '成绩综合查询,,,\n导出时间: 2025\n\n',
+    'quoted_newline': '"导出说明：第一行\n第二行\r\n第三行",,\n\n',
+    'unicode_separators': '说明\x0b备注\u2028续行\x1c,,\n',
+}
+
+
+@pytest.mark.parametrize('preamble', sorted(PREAMBLES))
+@pytest.mark.parametrize('encoding, sep', [('utf-8', ','), ('gb18030', ','), ('utf-8-sig', '\t')])
+def test_text_export_matches_workbook(workbook, preamble, encoding, sep):
+    reference, table = workbook
+    text = PREAMBLES[preamble] + table.to_csv(sep=sep, index=False, lineterminator='\r\n')
+    calc = load_text(text, encoding)
+
+    assert calc.column_mapping == reference.column_mapping
+    assert len(calc.df) == len(reference.df)
+    for calc_mode in ('保研', '综测'):
+        pd.testing.assert_frame_equal(ranking(calc, calc_mode).astype(str), ranking(reference, calc_mode).astype(str))
+
+
+def test_quoted_newline_keeps_first_data_row(workbook):
+    _, table = workbook
+    plain = load_text(table.to_csv(index=False))
+    quoted = load_text(PREAMBLES['quoted_newline'] + table.to_csv(index=False))
+    assert quoted.header_row == plain.header_row + 2
+    pd.testing.assert_frame_equal(quoted.df, plain.df)
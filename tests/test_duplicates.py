@@ -0,0 +1,124 @@
+"""
+重复课程/补考处理的一致性测试：整表一次分组的 resolve_duplicate_courses / _handle_duplicate_courses
+与原来逐个学生、逐个课程组循环的处理（legacy_handle_duplicates，照原实现转写）结果必须完全一致。
+运行：python -m pytest -q tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import web
+
+MAPPING = {'学号': '学号', '姓名': '姓名', '课程编号': '课程编号', '课程名称': '课程名称',
+           '总成绩': '总成绩', '学分': '学分', '取得方式': '取得方式'}
+EXAM_TYPES = ['初修取得', '补考取得', '补考', '初修补考', '重修取得', '缓考取得', None]
+
+
+def legacy_handle_duplicates(df, column_mapping):
+    """原逐个学生的重复课程处理（对单个学生的有效成绩记录原地修改，返回删除的行索引集合）"""
+    has_course_id = '课程编号' in column_mapping
+    has_course_name = '课程名称' in column_mapping
+    if not (has_course_id or has_course_name):
+        return set()
+
+    df['_课程标识'] = ''
+    if has_course_id:
+        df['_课程标识'] += df[column_mapping['课程编号']].astype(str) + '_'
+    if has_course_name:
+        df['_课程标识'] += df[column_mapping['课程名称']].astype(str)
+
+    acquire_col = column_mapping.get('取得方式', None)
+    courses_to_drop = set()
+    for _, course_group in df.groupby('_课程标识'):
+        if len(course_group) > 1:
+            has_makeup, makeup_idx, makeup_score, original_idx = False, None, None, None
+            for idx, row in course_group.iterrows():
+                exam_type = ''
+                if acquire_col and pd.notna(row.get(acquire_col)):
+                    exam_type = str(row[acquire_col])
+                if '补考' in exam_type and '初修' not in exam_type:
+                    has_makeup, makeup_idx, makeup_score = True, idx, row['_计算成绩']
+                else:
+                    original_idx = idx
+            if has_makeup and makeup_idx is not None:
+                if makeup_score >= 60:
+                    df.loc[makeup_idx, '_计算成绩'] = 60.0
+                    if original_idx is not None:
+                        courses_to_drop.add(original_idx)
+                else:
+                    courses_to_drop.add(makeup_idx)
+
+    if courses_to_drop:
+        df.drop(index=courses_to_drop, inplace=True)
+    return courses_to_drop
+
+
+def duplicate_sheet(seed, students=40):
+    """每位学生若干门课，每门课 1~4 条记录（初修、补考、重修等随机组合），部分课程编号缺失"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for student in range(students):
+        for course in rng.choice(12, size=rng.integers(3, 10), replace=False):
+            for _ in range(rng.choice([1, 1, 2, 2, 3, 4])):
+                rows.append({
+                    '学号': f'2304003{student:04d}',
+                    '姓名': f'学生{student}',
+                    '课程编号': np.nan if course == 11 else f'70010130{course:02d}',
+                    '课程名称': f'课程{course % 10}',
+                    '总成绩': float(rng.choice([30, 45, 59.5, 60, 61, 75, 90])),
+                    '学分': 2.0,
+                    '取得方式': EXAM_TYPES[rng.integers(len(EXAM_TYPES))],
+                })
+    df = pd.DataFrame(rows)
+    df['_学号'] = df['学号']
+    df['_计算成绩'] = df['总成绩']
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def make_calculator(mapping):
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.column_mapping = dict(mapping)
+    return calc
+
+
+def legacy_result(df, mapping):
+    parts = []
+    for _, student_df in df.groupby('_学号', sort=False):
+        student_df = student_df.copy()
+        legacy_handle_duplicates(student_df, mapping)
+        parts.append(student_df)
+    return pd.concat(parts).sort_index()
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('fields', ['both', 'name_only', 'id_only'])
+def test_matches_per_student_loop(seed, fields):
+    mapping = dict(MAPPING)
+    if fields == 'name_only':
+        del mapping['课程编号']
+    elif fields == 'id_only':
+        del mapping['课程名称']
+    df = duplicate_sheet(seed)
+
+    expected = legacy_result(df, mapping)
+    resolved = df.copy()
+    dropped = make_calculator(mapping)._handle_duplicate_courses(resolved)
+
+    assert dropped == set(df.index) - set(expected.index)
+    pd.testing.assert_frame_equal(resolved.sort_index(), expected, check_exact=True)
+
+
+def test_rules():
+    calc = make_calculator(MAPPING)
+    df = pd.DataFrame({
+        '_学号': ['1'] * 7 + ['2'] * 2,
+        '课程编号': ['A', 'A', 'B', 'B', 'C', 'C', 'C', 'A', 'A'],
+        '课程名称': ['数学', '数学', '物理', '物理', '化学', '化学', '化学', '数学', '数学'],
+        '取得方式': ['初修取得', '补考取得', '初修取得', '补考', '初修取得', '补考取得', '补考取得',
+                 '初修取得', '重修取得'],
+        '_计算成绩': [40.0, 75.0, 50.0, 55.0, 30.0, 45.0, 80.0, 70.0, 85.0],
+    })
+    set_sixty, drop = calc.resolve_duplicate_courses(df)
+    # 补考≥60 记60分并删除初修；补考<60 删除补考、保留初修；多次补考看最后一次；没有补考的重复记录都保留
+    assert set_sixty.tolist() == [False, True, False, False, False, False, True, False, False]
+    assert drop.tolist() == [True, False, False, True, True, False, False, False, False]
@@ -0,0 +1,65 @@
+"""
+表头检测的回归测试：表头之前有一行关键词很多的说明（得分超过30）、真正的表头在第20行之后时，
+工作簿（流式读取和整表读取）与 CSV 都必须定位到真正的表头。
+运行：python -m pytest -q tests
+"""
+import io
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import web
+
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        '2023级勘查技术与工程专业成绩综合查询.xlsx')
+# 学号10 + 姓名10 + 课程8 + 成绩8 + 学分8 + 非空单元格0.5 = 44.5
+PREAMBLE = '说明：本表按学号排列，含姓名、课程、成绩、学分，数据以教务系统为准'
+HEADER_ROW = 25
+
+
+def quiet():
+    return web.ConsoleReporter(quiet=True)
+
+
+@pytest.fixture(scope='module')
+def table():
+    calc = web.StudentGradeCalculator(reporter=quiet())
+    calc.load_data(WORKBOOK)
+    return pd.read_excel(WORKBOOK, header=calc.header_row).head(200)
+
+
+def rows(table):
+    """说明行 + 空行 + 表头 + 数据行"""
+    return ([[PREAMBLE]] + [[] for _ in range(HEADER_ROW - 1)] + [list(table.columns)]
+            + table.astype(object).where(table.notna(), None).values.tolist())
+
+
+def test_preamble_scores_as_a_header():
+    calc = web.StudentGradeCalculator(reporter=quiet())
+    assert calc.score_header_rows(pd.DataFrame([[PREAMBLE]]))[0] >= 30
+
+
+@pytest.mark.parametrize('mapped_only', [True, False])
+def test_workbook_header_after_preamble(table, mapped_only):
+    book = Workbook()
+    for row in rows(table):
+        book.active.append(row)
+    source = io.BytesIO()
+    book.save(source)
+
+    calc = web.StudentGradeCalculator(reporter=quiet())
+    success, missing = calc.load_data(source, mapped_only=mapped_only)
+    assert success, missing
+    assert calc.header_row == HEADER_ROW
+    assert len(calc.df) == len(table)
+    assert list(calc.df[calc.column_mapping['学号']]) == list(table[calc.column_mapping['学号']])
+
+
+def test_text_header_after_preamble(table):
+    text = '\n'.join(','.join('' if value is None else str(value) for value in row) for row in rows(table))
+    calc = web.StudentGradeCalculator(reporter=quiet())
+    success, missing = calc.load_data(io.BytesIO(text.encode('utf-8')))
+    assert success, missing
+    assert calc.header_row == HEADER_ROW and len(calc.df) == len(table)
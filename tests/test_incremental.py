@@ -0,0 +1,110 @@
+"""
+增量追加新学期成绩（append_records）的回归测试：
+在部分成绩上算过一遍后追加其余记录，排名结果和各阶段产物必须与对合并后的整表重新计算完全一致。
+运行：python -m pytest -q tests
+"""
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope='module')
+def sheet(grade_sheet):
+    # 补考、旷考比例调高，保证有跨两部分的重复课程组和无效成绩
+    return grade_sheet(120, makeup_rate=0.1, absence_rate=0.03, seed=7)
+
+
+def settings(sheet):
+    semesters = sorted(sheet['学年学期'].unique())
+    return [(None, '保研'), (None, '综测'), (semesters[:3], '保研'), (semesters[-2:], '综测')]
+
+
+def splits(sheet):
+    semesters = sorted(sheet['学年学期'].unique())
+    return {
+        'last_semester': sheet['学年学期'] != semesters[-1],
+        'middle_semester': sheet['学年学期'] != semesters[2],
+        # 按行号切分：各学期的记录交错在两部分里
+        'row_split': pd.Series(range(len(sheet)), index=sheet.index) < len(sheet) * 0.7,
+        # 补考成绩下学期才录入：初修记录已算过，补考记录后追加，需要重新处理已有的重复课程组
+        'makeup_later': sheet['取得方式'] != '补考取得',
+    }
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('split', ['last_semester', 'middle_semester', 'row_split', 'makeup_later'])
+def test_append_matches_full_recomputation(sheet, make_calculator, split, compact):
+    kept = splits(sheet)[split]
+    calc = make_calculator(sheet[kept], compact=compact)
+    for semester_filter, calc_mode in settings(sheet):
+        calc.calculate_all_students(semester_filter, calc_mode)
+
+    changed = calc.append_records(sheet[~kept], dict(calc.column_mapping), verify=False)
+    assert changed
+
+    full = make_calculator(calc.df, compact=False)
+    full.column_mapping = dict(calc.column_mapping)
+    for semester_filter, calc_mode in settings(sheet):
+        incremental = calc.calculate_all_students(semester_filter, calc_mode)
+        expected = full.calculate_all_students(semester_filter, calc_mode)
+        pd.testing.assert_frame_equal(incremental[0], expected[0], check_exact=True)
+        assert incremental[1:] == expected[1:]
+        assert calc.check_consistency(semester_filter, calc_mode) == []
+
+    for name in ('normalized', 'scored', 'resolved', 'classified'):
+        pd.testing.assert_frame_equal(getattr(calc, f'stage_{name}')().astype(object),
+                                      getattr(full, f'stage_{name}')().astype(object), check_exact=True)
+
+
+@pytest.mark.parametrize('verify', ['sample', True])
+def test_append_verification(sheet, make_calculator, monkeypatch, verify):
+    kept = splits(sheet)['last_semester']
+    calc = make_calculator(sheet[kept], compact=True)
+    calc.calculate_all_students(None, '保研')
+    checked = []
+    original = calc.check_consistency
+    monkeypatch.setattr(calc, 'check_consistency', lambda *args: checked.append(args) or original(*args))
+
+    changed = calc.append_records(sheet[~kept], dict(calc.column_mapping), verify=verify)
+    [(semester_filter, calc_mode, students)] = checked
+    assert (semester_filter, calc_mode) == (None, '保研')
+    if verify == 'sample':
+        # 默认只抽查一部分成绩有变化的学生
+        assert len(students) == calc.APPEND_CHECK_STUDENTS and set(students) <= set(changed)
+    else:
+        assert students is None
+    # 核对通过时保留增量产物
+    assert calc.append_verified is True
+    assert any(key[0] == calc._rows_key() for key in calc._stage_cache['aggregated'])
+
+
+def test_sample_check_reports_wrong_rows(sheet, make_calculator):
+    kept = splits(sheet)['last_semester']
+    calc = make_calculator(sheet[kept], compact=False)
+    calc.calculate_all_students(None, '综测')
+    changed = calc.append_records(sheet[~kept], dict(calc.column_mapping), verify=False)
+    assert calc.append_verified is None
+    assert calc.check_consistency(None, '综测', changed[:5]) == []
+
+    # 篡改其中一位学生的汇总行，抽查到他时应报告不一致
+    aggregated = calc.stage_aggregated(None, '综测')
+    aggregated.loc[aggregated['学号'] == changed[0], '平均成绩'] += 1
+    assert calc.check_consistency(None, '综测', changed[:5])
+    assert calc.check_consistency(None, '综测', changed[1:5]) == []
+
+
+def test_failed_verification_discards_incremental_stages(sheet, make_calculator, monkeypatch):
+    kept = splits(sheet)['last_semester']
+    calc = make_calculator(sheet[kept], compact=True)
+    calc.calculate_all_students(None, '综测')
+    monkeypatch.setattr(calc, 'check_consistency', lambda *args: ['模拟的不一致'])
+
+    calc.append_records(sheet[~kept], dict(calc.column_mapping))
+    assert calc.append_verified is False
+    rows_key = calc._rows_key()
+    assert not [key for entries in calc._stage_cache.values() for key in entries if rows_key in (key, key[0])]
+
+    monkeypatch.undo()
+    full = make_calculator(calc.df, compact=False)
+    full.column_mapping = dict(calc.column_mapping)
+    pd.testing.assert_frame_equal(calc.calculate_all_students(None, '综测')[0],
+                                  full.calculate_all_students(None, '综测')[0], check_exact=True)
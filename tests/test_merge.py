@@ -0,0 +1,123 @@
+"""
+多文件合并的测试：把一份成绩表按学期拆成几个导出文件（表头前的标题行数、工作表、列名各不相同），
+并行解析（parse_grade_files）后合并（merge_sources），排名必须与不拆分的成绩表完全一致；
+解析结果按输入顺序返回，与逐个解析相同；学期有重叠时重复的记录数与重叠部分一致，去掉重复后排名仍一致。
+运行：python -m pytest -q tests
+"""
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import web
+
+# 各文件表头前的标题行、列名改写、前面是否多一个说明工作表
+LAYOUTS = [
+    ([], {}, False),
+    ([['2023级成绩综合查询'], ['导出时间：2025-09-01']], {}, True),
+    ([['成绩单'], [], ['学院：地球科学学院'], ['备注：含补考成绩']], {'学号': '考生号', '总成绩': '总评成绩'}, False),
+]
+
+
+@pytest.fixture(scope='module')
+def sheet(grade_sheet):
+    # 按学期排好序的导出：拆开再按顺序合并后记录顺序不变，各学生成绩的累加顺序与不拆分时相同
+    df = grade_sheet(80, makeup_rate=0.05, absence_rate=0.02, seed=5)
+    return df.sort_values('学年学期', kind='stable').reset_index(drop=True)
+
+
+def workbook_bytes(df, preamble=(), renames=None, cover=False):
+    book = openpyxl.Workbook()
+    ws = book.active
+    if cover:
+        ws.title = '说明'
+        ws.append(['本文件由教务系统导出'])
+        ws = book.create_sheet('成绩')
+    for row in preamble:
+        ws.append(row)
+    ws.append([(renames or {}).get(col, col) for col in df.columns])
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False):
+        ws.append(list(row))
+    output = io.BytesIO()
+    book.save(output)
+    return output.getvalue()
+
+
+def split_files(sheet, overlap):
+    """按学期拆成三个文件；overlap 时第三个文件开头再带上第二个文件最后一个学期的记录"""
+    semesters = sorted(sheet['学年学期'].unique())
+    groups = [semesters[:2], semesters[2:4], semesters[4:]]
+    if overlap:
+        groups[2] = [groups[1][-1]] + groups[2]
+    files = []
+    for i, (semesters_in_file, (preamble, renames, cover)) in enumerate(zip(groups, LAYOUTS)):
+        part = pd.concat([sheet[sheet['学年学期'] == semester] for semester in semesters_in_file])
+        files.append((f'成绩_{i + 1}.xlsx', workbook_bytes(part, preamble, renames, cover)))
+    return files, (sheet['学年学期'] == groups[1][-1]).sum() if overlap else 0
+
+
+def ranking(calc, semester_filter, calc_mode):
+    calc.set_major('23kg')
+    return calc.calculate_all_students(semester_filter, calc_mode)
+
+
+@pytest.fixture(scope='module')
+def unsplit(sheet):
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    assert calc.load_data(io.BytesIO(workbook_bytes(sheet)))[0]
+    calc.compact()
+    return calc
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['disjoint', 'overlap'])
+def parsed(request, sheet):
+    files, overlap_rows = split_files(sheet, request.param)
+    return files, parse_grade_files_quietly(files, workers=2), overlap_rows
+
+
+def parse_grade_files_quietly(files, workers):
+    return web.parse_grade_files(files, workers=workers, reporter=web.ConsoleReporter(quiet=True))
+
+
+def test_results_in_input_order(parsed):
+    files, results, _ = parsed
+    assert [name for name, *_ in results] == [name for name, _ in files]
+    assert [(header_row, sheet_name) for _, header_row, sheet_name, *_ in results] == [(0, 'Sheet'), (2, '成绩'),
+                                                                                      (4, 'Sheet')]
+    assert all(error is None and df is not None for *_, df, _, error in results)
+    assert results[2][3]['学号'] == '考生号' and results[2][3]['总成绩'] == '总评成绩'
+
+    # 倒序给出文件，结果也按给出的倒序返回，且与逐个解析完全一致
+    reversed_results = parse_grade_files_quietly(files[::-1], workers=3)
+    sequential = parse_grade_files_quietly(files, workers=1)
+    for result, reversed_result, single in zip(results, reversed_results[::-1], sequential):
+        for other in (reversed_result, single):
+            assert other[:4] == result[:4]
+            pd.testing.assert_frame_equal(other[4], result[4], check_exact=True)
+
+
+@pytest.mark.parametrize('calc_mode', ['保研', '综测'])
+@pytest.mark.parametrize('semesters', ['all', 'partial'])
+def test_merged_ranking_matches_unsplit(parsed, unsplit, calc_mode, semesters):
+    _, results, overlap_rows = parsed
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    success, missing = calc.merge_sources([(name, mapping, df) for name, _, _, mapping, df, _, _ in results])
+    assert success and not missing
+    assert list(calc.column_mapping.values())[:2] == [unsplit.column_mapping['学号'], unsplit.column_mapping['姓名']]
+    calc.compact()
+
+    # 与网页版相同的重复检测：不同文件里完全相同的记录
+    record_cols = list(dict.fromkeys(calc.column_mapping.values()))
+    per_file = calc.df.drop_duplicates(subset=record_cols + [calc.SOURCE_COLUMN])
+    repeated = per_file.duplicated(subset=record_cols)
+    assert repeated.sum() == overlap_rows
+    if overlap_rows:
+        calc.df = per_file[~repeated].reset_index(drop=True)
+
+    semester_filter = sorted(unsplit.df[unsplit.column_mapping['学年学期']].unique())[1:4] \
+        if semesters == 'partial' else None
+    expected = ranking(unsplit, semester_filter, calc_mode)
+    result_df, excellent_count, normal_count = ranking(calc, semester_filter, calc_mode)
+    assert (excellent_count, normal_count) == expected[1:]
+    pd.testing.assert_frame_equal(result_df, expected[0], check_exact=True)
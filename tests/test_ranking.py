@@ -0,0 +1,45 @@
+"""
+排名结果回归测试：示例成绩表在各专业、两种计算模式、全部学期/部分学期下的排名，
+必须与改为整表计算之前（逐个学生计算）的结果完全一致。
+tests/data/expected_rankings.csv 由改动前的代码对示例成绩表计算得到。
+运行：python -m pytest -q tests
+"""
+import itertools
+import os
+
+import pandas as pd
+import pytest
+
+import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKBOOK = os.path.join(ROOT, '2023级勘查技术与工程专业成绩综合查询.xlsx')
+EXPECTED = os.path.join(ROOT, 'tests', 'data', 'expected_rankings.csv')
+
+MAJORS = ['23kg', '23dz', '23dx', '24kg', 'other']
+SEMESTERS = {'全部': None, '2024秋季学期、2025春季学期': ['2024秋季学期', '2025春季学期']}
+
+
+@pytest.fixture(scope='module')
+def workbook():
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data(WORKBOOK)
+    return calc
+
+
+@pytest.fixture(scope='module')
+def expected():
+    return pd.read_csv(EXPECTED, dtype={'学号': str, '姓名': str})
+
+
+@pytest.mark.parametrize('major, calc_mode, semesters', list(itertools.product(MAJORS, ['保研', '综测'], SEMESTERS)))
+def test_ranking_matches_expected(workbook, expected, major, calc_mode, semesters):
+    calc = web.StudentGradeCalculator(df=workbook.df, reporter=web.ConsoleReporter(quiet=True))
+    calc.column_mapping = dict(workbook.column_mapping)
+    calc.set_major(major)
+    result = calc.calculate_all_students(SEMESTERS[semesters], calc_mode)[0]
+
+    rows = expected[(expected['专业'] == major) & (expected['计算模式'] == calc_mode)
+                    & (expected['学期筛选'] == semesters)]
+    rows = rows.drop(columns=['专业', '学期筛选']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), rows, check_exact=True)
@@ -0,0 +1,84 @@
+"""
+整表成绩换算（convert_scores）与逐行 _convert_score 的一致性测试：
+示例成绩表全部记录，以及旷考/缺考/缓考、补考取得、等级制成绩、空白和无法识别的成绩等边界组合。
+运行：python -m pytest -q tests
+"""
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import web
+
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        '2023级勘查技术与工程专业成绩综合查询.xlsx')
+
+SCORES = [85, 59.5, 60, 100, 0, -1, np.int64(73), np.float32(88.5), True, '85', ' 61 ', '59', '0', '',
+          '优秀', ' 良好 ', '中等', '及格', '不及格', '通过', '不通过', '合格', '不合格', '优', '良',
+          '优秀（补）', '缓考', 'abc', None, np.nan]
+EXAM_TYPES = ['初修取得', '补考取得', '补考', '初修补考', '重修取得', '缓考取得', '', None, np.nan]
+FLAGS = ['', '旷考', '缺考', '缓考', '作弊', None, np.nan]
+
+
+def make_calculator(df):
+    calc = web.StudentGradeCalculator(df=df, reporter=web.ConsoleReporter(quiet=True))
+    calc.column_mapping = {'学号': '学号', '总成绩': '总成绩', '取得方式': '取得方式', '成绩标志': '成绩标志'}
+    return calc
+
+
+def row_wise(calc, df):
+    return pd.Series([calc._convert_score(row) for _, row in df.iterrows()], index=df.index, dtype=float)
+
+
+@pytest.fixture(scope='module')
+def edge_cases():
+    combos = list(itertools.product(SCORES, EXAM_TYPES, FLAGS))
+    return pd.DataFrame({
+        '学号': [f'2304003{i:04d}' for i in range(len(combos))],
+        '总成绩': pd.Series([score for score, _, _ in combos], dtype=object),
+        '取得方式': pd.Series([exam for _, exam, _ in combos], dtype=object),
+        '成绩标志': pd.Series([flag for _, _, flag in combos], dtype=object),
+    })
+
+
+def test_edge_cases_match_row_wise(edge_cases):
+    calc = make_calculator(edge_cases)
+    pd.testing.assert_series_equal(calc.convert_scores(edge_cases), row_wise(calc, edge_cases), check_exact=True)
+
+
+def test_categorical_columns_match_row_wise(edge_cases):
+    # 紧凑数据表中文本列为分类列：每个取值只换算一次后展开
+    text = edge_cases[edge_cases['总成绩'].map(lambda value: isinstance(value, str) or value is None)]
+    compact = text.astype({'总成绩': 'category', '取得方式': 'category', '成绩标志': 'category'})
+    calc = make_calculator(compact)
+    pd.testing.assert_series_equal(calc.convert_scores(compact), row_wise(calc, text), check_exact=True)
+
+
+def test_rules(edge_cases):
+    calc = make_calculator(edge_cases)
+    converted = calc.convert_scores(edge_cases)
+
+    def value(score, exam_type='初修取得', flag=''):
+        rows = edge_cases[(edge_cases['总成绩'].map(repr) == repr(score))
+                          & (edge_cases['取得方式'].map(repr) == repr(exam_type))
+                          & (edge_cases['成绩标志'].map(repr) == repr(flag))]
+        return converted[rows.index[0]]
+
+    assert np.isnan(value(85, flag='旷考')) and np.isnan(value(85, flag='缺考'))
+    assert np.isnan(value(85, flag='缓考')) and value(85, exam_type='缓考取得', flag='缓考') == 85
+    # 补考取得：≥60 记60，不及格保留原分，等级制成绩不认
+    assert value(85, exam_type='补考取得') == 60 and value(59.5, exam_type='补考') == 59.5
+    assert np.isnan(value('优秀', exam_type='补考取得'))
+    assert value(85, exam_type='初修补考') == 85
+    # 等级制：精确匹配优先，否则取第一个包含的等级
+    assert value(' 良好 ') == calc.grade_map['良好'] and value('不及格') == calc.grade_map['不及格']
+    assert value('优秀（补）') == calc.grade_map['优秀']
+    assert np.isnan(value('abc')) and np.isnan(value('')) and np.isnan(value(None))
+
+
+def test_workbook_matches_row_wise():
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data(WORKBOOK)
+    pd.testing.assert_series_equal(calc.convert_scores(calc.df), row_wise(calc, calc.df), check_exact=True)
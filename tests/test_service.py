@@ -0,0 +1,275 @@
+"""
+本地 HTTP 计算服务的接口测试：在后台线程启动 make_server(service, port=0)，通过 HTTP 调用各接口。
+运行：python -m pytest -q tests
+"""
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+import pandas as pd
+import pytest
+
+import web
+
+MAJOR = '23kg'
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        '2023级勘查技术与工程专业成绩综合查询.xlsx')
+
+
+@pytest.fixture(scope='module')
+def content():
+    with open(WORKBOOK, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture(scope='module')
+def expected():
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data(WORKBOOK)
+    calc.set_major(MAJOR)
+    return calc.calculate_all_students(None, '保研')[0]
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    # 磁盘缓存放在临时目录，不写入用户的缓存目录
+    service = web.CalculationService(workers=2, dataset_cache=web.DatasetCache(str(tmp_path_factory.mktemp('cache'))))
+    httpd = web.make_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield service, f"http://127.0.0.1:{httpd.server_port}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        service.shutdown()
+
+
+def call(url, data=None, method=None):
+    """发送请求，返回 (状态码, 响应头, 响应体字节)；错误状态码不抛异常"""
+    request = Request(url, data=data, method=method or ('POST' if data is not None else 'GET'))
+    try:
+        with urlopen(request, timeout=120) as response:
+            return response.status, response.headers, response.read()
+    except HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def call_json(url, data=None, method=None):
+    status, _, body = call(url, data, method)
+    return status, json.loads(body)
+
+
+@pytest.fixture(scope='module')
+def dataset(server, content):
+    _, base = server
+    status, info = call_json(f"{base}/datasets", content)
+    assert status == 201
+    return info
+
+
+def test_upload(server, content, dataset):
+    service, base = server
+    assert dataset['rows'] > 0 and MAJOR in dataset['majors'] and dataset['semesters']
+    # 同一文件重复上传复用同一个数据集
+    status, again = call_json(f"{base}/datasets", content)
+    assert status == 201 and again['dataset_id'] == dataset['dataset_id']
+    assert call_json(f"{base}/datasets/{dataset['dataset_id']}")[1]['rows'] == dataset['rows']
+    # 上传时已写入（临时目录中的）磁盘缓存
+    assert service.dataset_cache.get(dataset['dataset_id']) is not None
+
+
+def test_ranking_matches_calculator(server, dataset, expected):
+    _, base = server
+    status, ranking = call_json(f"{base}/datasets/{dataset['dataset_id']}/ranking?major={MAJOR}")
+    assert status == 200
+    assert ranking['excellent_count'] + ranking['normal_count'] == len(expected)
+    received = pd.DataFrame(ranking['students'])
+    assert received['学号'].tolist() == expected['学号'].tolist()
+    assert received['排名'].tolist() == expected['排名'].tolist()
+    assert received['平均成绩'].tolist() == pytest.approx(expected['平均成绩'].tolist())
+
+
+def test_single_student(server, dataset, expected):
+    _, base = server
+    first = expected.iloc[0]
+    for key in (first['学号'], first['姓名']):
+        status, result = call_json(f"{base}/datasets/{dataset['dataset_id']}/students/{quote(str(key))}?major={MAJOR}")
+        assert status == 200
+        assert result['total'] == len(expected)
+        assert result['students'][0]['学号'] == first['学号']
+
+    status, headers, body = call(f"{base}/datasets/{dataset['dataset_id']}/students/{first['学号']}/detail?major={MAJOR}")
+    assert status == 200 and 'spreadsheetml' in headers['Content-Type']
+    assert pd.read_excel(io.BytesIO(body), header=None).size > 0
+
+
+def wait_for(base, job_id):
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        status, job = call_json(f"{base}/jobs/{job_id}")
+        assert status == 200
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.2)
+    raise AssertionError(f"任务超时: {job_id}")
+
+
+@pytest.mark.parametrize('kind', ['summary', 'details'])
+def test_export_job(server, dataset, expected, kind):
+    _, base = server
+    status, job = call_json(f"{base}/datasets/{dataset['dataset_id']}/exports?major={MAJOR}&kind={kind}", b'')
+    assert status == 202 and job['status'] in ('queued', 'running', 'done')
+    job = wait_for(base, job['job_id'])
+    assert job['status'] == 'done', job['error']
+
+    status, headers, body = call(f"{base}/jobs/{job['job_id']}/result")
+    assert status == 200 and len(body) == job['size']
+    if kind == 'summary':
+        sheets = pd.read_excel(io.BytesIO(body), sheet_name=None)
+        assert sheets['全校成绩排名']['学号'].astype(str).tolist() == expected['学号'].tolist()
+    else:
+        assert len(zipfile.ZipFile(io.BytesIO(body)).namelist()) == len(expected)
+
+
+def test_what_if(server, dataset, expected):
+    _, base = server
+    student = expected.iloc[-1]
+    url = f"{base}/datasets/{dataset['dataset_id']}/students/{student['学号']}/whatif?major={MAJOR}"
+    changes = {'changes': [{'课程名称': '模拟新课程', '总成绩': 100, '学分': 10}]}
+    status, result = call_json(url, json.dumps(changes).encode('utf-8'))
+    assert status == 200
+    assert result['原排名'] == student['排名'] and result['排名'] < student['排名']
+
+    missing_credit = {'changes': [{'课程名称': '模拟新课程', '总成绩': 100}]}
+    assert call_json(url, json.dumps(missing_credit).encode('utf-8'))[0] == 400
+    assert call_json(url, b'not json')[0] == 400
+    assert call_json(url.replace(f"/students/{student['学号']}/", '/students/00000000000/'), b'{}')[0] == 404
+
+
+@pytest.fixture(scope='module')
+def semesters():
+    """示例成绩表按学期拆成两个CSV：最后一个学期之前的记录、最后一个学期的记录"""
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data(WORKBOOK)
+    table = pd.read_excel(WORKBOOK, header=calc.header_row)
+    last = table['学年学期'] == sorted(table['学年学期'].dropna().unique())[-1]
+    return (table[~last].to_csv(index=False).encode('utf-8'), table[last].to_csv(index=False).encode('utf-8'),
+            table.to_csv(index=False).encode('utf-8'))
+
+
+def test_append(server, semesters):
+    _, base = server
+    earlier, last, whole = semesters
+    status, first = call_json(f"{base}/datasets", earlier)
+    assert status == 201
+    call_json(f"{base}/datasets/{first['dataset_id']}/ranking?major={MAJOR}")
+
+    status, appended = call_json(f"{base}/datasets/{first['dataset_id']}/append", last)
+    assert status == 201 and appended['verified'] == 'sample' and appended['changed_students'] > 0
+    assert appended['dataset_id'] != first['dataset_id']
+    # 原ID失效
+    assert call_json(f"{base}/datasets/{first['dataset_id']}")[0] == 404
+    assert call_json(f"{base}/datasets/{first['dataset_id']}/append", last)[0] == 404
+
+    status, full = call_json(f"{base}/datasets", whole)
+    assert status == 201 and full['rows'] == appended['rows']
+    ranked = [call_json(f"{base}/datasets/{info['dataset_id']}/ranking?major={MAJOR}")[1]['students']
+              for info in (appended, full)]
+    assert ranked[0] == ranked[1]
+
+
+def test_concurrent_appends_to_one_dataset(semesters):
+    earlier, last, _ = semesters
+    service = web.CalculationService(workers=2)
+    try:
+        dataset_id = service.add_dataset(earlier)['dataset_id']
+        outcomes = []
+
+        def append():
+            try:
+                outcomes.append(service.append_dataset(dataset_id, last)['dataset_id'])
+            except KeyError as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=append) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 只有一次追加生效，另一次因原ID已被替换而被拒绝
+        new_ids = [outcome for outcome in outcomes if isinstance(outcome, str)]
+        assert len(new_ids) == 1 and len(outcomes) == 2
+        assert list(service.datasets) == new_ids
+        assert service.dataset_info(new_ids[0])['rows'] == service.add_dataset(earlier)['rows'] + len(
+            pd.read_csv(io.BytesIO(last)))
+    finally:
+        service.shutdown()
+
+
+def test_append_reports_failed_verification(semesters, monkeypatch):
+    earlier, last, _ = semesters
+    service = web.CalculationService(workers=1)
+    try:
+        dataset_id = service.add_dataset(earlier)['dataset_id']
+        monkeypatch.setattr(web.StudentGradeCalculator, 'check_consistency', lambda *args: ['模拟的不一致'])
+        # 核对不一致时增量结果已丢弃，不能报告为已核对
+        assert service.append_dataset(dataset_id, last)['verified'] is False
+        assert service.append_dataset(service.add_dataset(earlier)['dataset_id'], last, verify=False)['verified'] is None
+    finally:
+        service.shutdown()
+
+
+def test_bad_requests(server, dataset):
+    _, base = server
+    dataset_id = dataset['dataset_id']
+    assert call_json(f"{base}/datasets/{dataset_id}/ranking")[0] == 400  # 缺少 major
+    assert call_json(f"{base}/datasets/{dataset_id}/ranking?major=nope")[0] == 400
+    assert call_json(f"{base}/datasets/{dataset_id}/ranking?major={MAJOR}&mode=x")[0] == 400
+    assert call_json(f"{base}/datasets/{dataset_id}/exports?major={MAJOR}&kind=x", b'')[0] == 400
+    assert call_json(f"{base}/datasets", b'')[0] == 400  # 空请求体
+    assert call_json(f"{base}/datasets", b'not a grade sheet')[0] == 400
+
+
+def test_not_found(server, dataset):
+    _, base = server
+    assert call_json(f"{base}/datasets/{'0' * 16}")[0] == 404
+    assert call_json(f"{base}/datasets/{'0' * 16}/ranking?major={MAJOR}")[0] == 404
+    assert call_json(f"{base}/datasets/{dataset['dataset_id']}/students/nobody?major={MAJOR}")[0] == 404
+    assert call_json(f"{base}/jobs/{'0' * 32}")[0] == 404
+    assert call_json(f"{base}/nowhere")[0] == 404
+
+
+def test_upload_too_large(server, monkeypatch):
+    service, base = server
+    monkeypatch.setattr(web.CalculationRequestHandler, 'max_upload_bytes', 1024)
+    status, body = call_json(f"{base}/datasets", b'x' * 2048)
+    assert status == 413 and body['error']
+
+
+def test_finished_jobs_evicted_by_bytes_and_age():
+    service = web.CalculationService(workers=1, max_job_bytes=250, job_ttl=60)
+    try:
+        def finished_job(size, age):
+            job = web.CalculationJob(f"{len(service.jobs):032x}", 'summary')
+            job.status, job.content, job.finished = 'done', b'x' * size, time.time() - age
+            service.jobs[job.job_id] = job
+            return job.job_id
+
+        expired = finished_job(10, age=120)
+        oldest, middle, newest = finished_job(100, 30), finished_job(100, 20), finished_job(100, 10)
+        running = web.CalculationJob('f' * 32, 'summary')
+        service.jobs[running.job_id] = running
+        with service._lock:
+            service._evict_jobs()
+        # 过期的先丢弃，再从最早结束的开始丢弃直到结果总字节数不超限；未结束的任务保留
+        assert expired not in service.jobs and oldest not in service.jobs
+        assert list(service.jobs) == [middle, newest, running.job_id]
+    finally:
+        service.shutdown()
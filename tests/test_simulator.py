@@ -0,0 +1,85 @@
+"""
+假设成绩模拟（simulate_student）的测试：只重算一位学生得到的平均成绩和名次，
+必须与把假设成绩写进成绩表后整表重新计算的结果一致。
+运行：python -m pytest -q tests
+"""
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope='module')
+def sheet(grade_sheet):
+    return grade_sheet(150, makeup_rate=0.05, absence_rate=0.02, seed=11)
+
+
+def single_course(sheet, student_id):
+    """该学生只有一条记录、且为数字成绩的初修课程（改成绩后整表计算时不涉及重复课程处理）"""
+    rows = sheet[sheet['学号'].astype(str) == student_id]
+    counts = rows['课程名称'].value_counts()
+    numeric = pd.to_numeric(rows['总成绩'], errors='coerce').notna()
+    candidates = rows[numeric & rows['课程名称'].map(counts).eq(1) & (rows['取得方式'] == '初修取得')]
+    return candidates.iloc[0]
+
+
+def recomputed(make_calculator, df, student_id, calc_mode):
+    result = make_calculator(df).calculate_all_students(None, calc_mode)[0]
+    return result.set_index('学号').loc[student_id]
+
+
+@pytest.mark.parametrize('calc_mode', ['保研', '综测'])
+@pytest.mark.parametrize('position, score', [(0, 100), (40, 0.5), (75, '优秀'), (149, 61)])
+def test_existing_course_matches_full_recomputation(sheet, make_calculator, calc_mode, position, score):
+    calc = make_calculator(sheet)
+    full = calc.calculate_all_students(None, calc_mode)[0]
+    student_id = sorted(full['学号'])[position]
+    course = single_course(sheet, student_id)
+
+    simulated = calc.simulate_student(student_id, [{'课程名称': course['课程名称'], '总成绩': score}],
+                                      calc_mode=calc_mode)
+    changed = sheet.copy()
+    changed.loc[course.name, '总成绩'] = score
+    expected = recomputed(make_calculator, changed, student_id, calc_mode)
+
+    before = full.set_index('学号').loc[student_id]
+    assert simulated['原平均成绩'] == pytest.approx(float(before['平均成绩']))
+    assert simulated['原排名'] == before['排名']
+    assert simulated['平均成绩'] == pytest.approx(float(expected['平均成绩']))
+    assert simulated['排名'] == expected['排名']
+    assert simulated['班级内排名'] == expected['班级内排名']
+    assert simulated['参与排名人数'] == len(full)
+    assert any(course_row['假设成绩'] for course_row in simulated['课程'])
+
+
+def test_new_course_matches_full_recomputation(sheet, make_calculator):
+    calc = make_calculator(sheet)
+    student_id = sorted(calc.calculate_all_students(None, '综测')[0]['学号'])[10]
+    simulated = calc.simulate_student(student_id, [{'课程名称': '模拟新课程', '总成绩': 99, '学分': 3}],
+                                      calc_mode='综测')
+
+    row = sheet[sheet['学号'].astype(str) == student_id].iloc[[-1]].copy()
+    row[['课程名称', '课程编号', '总成绩', '学分', '取得方式', '成绩标志']] = ['模拟新课程', '', 99, 3.0, '', '']
+    expected = recomputed(make_calculator, pd.concat([sheet, row]), student_id, '综测')
+    assert simulated['平均成绩'] == pytest.approx(float(expected['平均成绩']))
+    assert simulated['排名'] == expected['排名']
+    assert simulated['总学分'] == pytest.approx(float(expected['总学分']))
+
+
+def test_new_course_requires_credit(sheet, make_calculator):
+    calc = make_calculator(sheet)
+    student_id = sorted(calc.calculate_all_students(None, '保研')[0]['学号'])[0]
+    with pytest.raises(ValueError, match='学分'):
+        calc.simulate_student(student_id, [{'课程名称': '不存在的课程', '总成绩': 90}])
+
+
+def test_unrecognized_score(sheet, make_calculator):
+    calc = make_calculator(sheet)
+    student_id = sorted(calc.calculate_all_students(None, '保研')[0]['学号'])[0]
+    course = single_course(sheet, student_id)
+    with pytest.raises(ValueError, match='无法识别'):
+        calc.simulate_student(student_id, [{'课程名称': course['课程名称'], '总成绩': '很好'}])
+
+
+def test_unknown_student(sheet, make_calculator):
+    calc = make_calculator(sheet)
+    with pytest.raises(KeyError):
+        calc.simulate_student('00000000000', [{'课程名称': '高等数学A(1)', '总成绩': 90}])
@@ -0,0 +1,46 @@
+"""
+分阶段计算的用时记录测试：export_results 同时导出汇总工作簿和明细压缩包时，
+每个阶段在 timings 中只记录一次（排名不重复计算，复用缓存的阶段也只记一次）。
+运行：python -m pytest -q tests
+"""
+import io
+import os
+from collections import Counter
+
+import pytest
+
+import web
+
+MAJOR = '23kg'
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        '2023级勘查技术与工程专业成绩综合查询.xlsx')
+
+
+@pytest.fixture
+def calc():
+    calc = web.StudentGradeCalculator(reporter=web.ConsoleReporter(quiet=True))
+    calc.load_data(WORKBOOK)
+    calc.set_major(MAJOR)
+    return calc
+
+
+def stage_counts(calc):
+    return Counter(record['stage'] for record in calc.timings.records if record['group'] != '读取')
+
+
+@pytest.mark.parametrize('calc_mode', ['保研', '综测'])
+def test_each_stage_recorded_once(calc, calc_mode):
+    # 第一次全部重新计算，第二次各阶段都复用缓存
+    for _ in range(2):
+        result_df, _, _, detail_result = calc.export_results(io.BytesIO(), None, calc_mode, zip_target=io.BytesIO())
+        assert detail_result[0] == len(result_df)
+        counts = stage_counts(calc)
+        assert counts['排名'] == 1
+        assert all(count == 1 for count in counts.values()), counts
+
+
+def test_summary_without_details_ranks_once(calc):
+    calc.export_results(io.BytesIO(), None, '保研')
+    counts = stage_counts(calc)
+    assert counts['排名'] == 1 and '选修课折算与加权汇总' not in counts
+    assert all(count == 1 for count in counts.values()), counts
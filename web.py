@@ -1,11 +1,75 @@
-import streamlit as st
 import pandas as pd
 import numpy as np
+import argparse
+import codecs
+import contextlib
+import copy
+import csv
 import datetime
+import functools
+import glob
+import hashlib
+import importlib
+import itertools
+import json
+import multiprocessing
 import os
+import re
+import sys
 import tempfile
+import threading
+import time
+import uuid
+import warnings
 import zipfile
-from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, TextIOWrapper
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from pandas.io.parsers import TextParser
+
+try:
+    import pyarrow  # noqa: F401  仅用于判断能否写Parquet
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+
+class _LazyStreamlit:
+    """
+    Streamlit 延迟导入：网页模式下首次用到 st 时才加载并替换为真正的模块，
+    命令行批量计算（python web.py 成绩表.xlsx ...）全程不导入 Streamlit。
+    """
+
+    def __getattr__(self, name):
+        import streamlit
+        globals()['st'] = streamlit
+        return getattr(streamlit, name)
+
+
+st = _LazyStreamlit()
+
+
+def _cache_resource(func):
+    """st.cache_resource 的延迟版本：首次调用时才交给 Streamlit 缓存"""
+    cached = []
+
+    @functools.wraps(func)
+    def wrapper():
+        if not cached:
+            cached.append(st.cache_resource(func))
+        return cached[0]()
+    return wrapper
+
+# 明细压缩包在内存中的上限，超过后转存到临时文件
+DETAIL_ZIP_SPOOL_BYTES = 64 * 1024 * 1024
+
+# 读取/规范化逻辑的版本号：修改 load_data 及相关解析函数后需递增，使磁盘缓存自动失效
+INGESTION_VERSION = 11
 
 
 # ============ 专业配置类（完全不变） ============
@@ -205,6 +269,21 @@ class MajorConfig:
         """获取所有专业列表（用于显示）"""
         return self.major_display_list
 
+    def resolve_major_code(self, value):
+        """把专业代码、专业名称或显示名称解析为专业代码，无法识别时返回None"""
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return None
+        text = str(value).strip()
+        if text in self.majors:
+            return text
+        for code, config in self.majors.items():
+            if text == config.get('专业名称'):
+                return code
+        for major in self.major_display_list:
+            if text == major['name'] and major['code'] in self.majors:
+                return major['code']
+        return None
+
 def show_signature():
     """显示醒目的作者签名"""
     try:
@@ -229,6 +308,492 @@ def show_signature():
     </div>
     """, unsafe_allow_html=True)
 
+# ============ 工作簿读取（单次解析） ============
+def _excel_cell_value(cell):
+    """单元格取值 - 与 pandas.read_excel（openpyxl引擎）的单元格转换规则一致"""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+def excel_value_converter():
+    """values_only 读取时的单元格取值转换（与 read_excel 一致）：空→''，错误值→NaN，整数值的浮点数→int"""
+    from openpyxl.cell.cell import ERROR_CODES
+
+    def convert(value):
+        if value is None:
+            return ''
+        if type(value) is float and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and value in ERROR_CODES:
+            return np.nan
+        return value
+    return convert
+
+
+def read_sheet_rows(source, sheet_index=0):
+    """只解析一次工作表，返回所有行的取值列表（每行已去掉行尾空单元格）"""
+    from openpyxl import load_workbook
+
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[sheet_index]
+        sheet.reset_dimensions()
+        rows = []
+        for row in sheet.rows:
+            values = [_excel_cell_value(cell) for cell in row]
+            while values and values[-1] == '':
+                values.pop()
+            rows.append(values)
+    finally:
+        workbook.close()
+    return rows
+
+
+def rows_to_frame(rows, header=0):
+    """由行数据构建DataFrame - 表头处理与类型推断和 pd.read_excel(header=header) 相同"""
+    last_row = max((i for i, values in enumerate(rows) if values), default=-1)
+    data = rows[:last_row + 1]
+    if not data:
+        return pd.DataFrame()
+
+    width = max(len(values) for values in data)
+    data = [values + [''] * (width - len(values)) if len(values) < width else values
+            for values in data]
+    try:
+        return TextParser(data, header=header, skip_blank_lines=False).read()
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+# ============ CSV/TSV 文本导出 ============
+# xlsx 是zip压缩包，xls 是OLE2复合文档；两者都不是时按分隔符文本读取
+_WORKBOOK_MAGICS = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0')
+_DELIMITERS = ',\t;|'
+
+
+@contextlib.contextmanager
+def open_binary(source):
+    """以二进制方式打开路径或文件对象（文件对象回到开头，用完不关闭）"""
+    if hasattr(source, 'read'):
+        source.seek(0)
+        yield source
+    else:
+        with open(source, 'rb') as f:
+            yield f
+
+
+def is_delimited_text(source):
+    """按文件开头的字节判断是否为CSV/TSV等分隔符文本（而非xlsx/xls工作簿）"""
+    with open_binary(source) as f:
+        magic = f.read(4)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return bool(magic) and not magic.startswith(_WORKBOOK_MAGICS)
+
+
+def sniff_encoding(sample):
+    """
+    根据文件开头的字节判断编码：有BOM按BOM；能按UTF-8解码即UTF-8；否则按GB18030（兼容GBK/GB2312）。
+    sample 可能在多字节字符中间截断，所以用增量解码器且不要求结尾完整
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+
+def sniff_delimiter(lines):
+    """在开头若干行中出现次数最多的分隔符（逗号、制表符、分号、竖线），都没有时按逗号"""
+    counts = {sep: sum(line.count(sep) for line in lines) for sep in _DELIMITERS}
+    best = max(counts, key=counts.get)
+    return best if counts[best] else ','
+
+
+# ============ 流式读取：列缓冲区 ============
+# pandas 默认识别为缺失值的文本（与 read_excel 一致）
+_NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+])
+_BOOL_STRINGS = frozenset(['True', 'TRUE', 'true', 'False', 'FALSE', 'false'])
+
+
+class _ColumnBuffer:
+    """
+    列缓冲区 - 预分配、按倍增扩容的数组：全为整数时存int64，出现小数或空值升级为float64，
+    出现文本等其他类型再升级为object。结束时按 read_excel 的规则推断最终类型。
+    """
+
+    def __init__(self, capacity=4096):
+        self.size = 0
+        self._data = np.empty(max(capacity, 16), dtype=np.int64)
+        self._is_int = None  # float64 模式下标记哪些值原本是整数（升级为object时还原）
+
+    def _grow(self):
+        capacity = len(self._data) * 2
+        data = np.empty(capacity, dtype=self._data.dtype)
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+        if self._is_int is not None:
+            is_int = np.zeros(capacity, dtype=bool)
+            is_int[:self.size] = self._is_int[:self.size]
+            self._is_int = is_int
+
+    def _to_float(self):
+        self._is_int = np.zeros(len(self._data), dtype=bool)
+        self._is_int[:self.size] = True
+        self._data = self._data.astype(np.float64)
+
+    def _to_object(self):
+        data = self._data.astype(object)
+        if self._is_int is not None:
+            positions = np.flatnonzero(self._is_int[:self.size])
+            data[positions] = [int(v) for v in self._data[positions]]
+        self._data = data
+        self._is_int = None
+
+    def append(self, value):
+        if self.size == len(self._data):
+            self._grow()
+        kind = self._data.dtype.kind
+
+        if value is None or (isinstance(value, str) and value in _NA_STRINGS) \
+                or (isinstance(value, float) and value != value):
+            if kind == 'i':
+                self._to_float()
+            self._data[self.size] = np.nan
+            if self._is_int is not None:
+                self._is_int[self.size] = False
+        elif kind != 'O' and type(value) is int:
+            try:
+                self._data[self.size] = value
+            except OverflowError:
+                self._to_object()
+                self._data[self.size] = value
+            if self._is_int is not None:
+                self._is_int[self.size] = True
+        elif kind != 'O' and type(value) is float:
+            if kind == 'i':
+                self._to_float()
+            self._data[self.size] = value
+            self._is_int[self.size] = False
+        else:
+            if kind != 'O':
+                self._to_object()
+            self._data[self.size] = value
+        self.size += 1
+
+    def append_missing(self, count):
+        """连续追加count个缺失值（空行）"""
+        for _ in range(count):
+            self.append(None)
+
+    def finish(self):
+        """返回最终列数据（类型推断与 read_excel 相同）"""
+        values = self._data[:self.size].copy()
+        self._data = None
+        if values.dtype != object:
+            return values
+
+        types = set(map(type, values))
+        if types <= {str, int, float}:
+            try:
+                return pd.to_numeric(values)
+            except (ValueError, TypeError):
+                strings = {v for v in values if isinstance(v, str)}
+                if not (strings and strings <= _BOOL_STRINGS):
+                    return values
+        # 布尔、日期等少见类型交给 pandas 自身的解析器推断
+        column = TextParser([[v] for v in values], header=None, skip_blank_lines=False).read()
+        return column.iloc[:, 0].to_numpy()
+
+
+# ============ 等级制成绩匹配器 ============
+class GradeLabelMatcher:
+    """等级制成绩匹配器 - 预编译等级关键词，整列匹配时每个不同文本只匹配一次"""
+
+    def __init__(self, grade_map):
+        self.grade_map = dict(grade_map)
+        # 预筛选正则：不含任何等级关键词的文本（绝大多数数字成绩）直接跳过逐个匹配
+        self.pattern = re.compile('|'.join(re.escape(k) for k in self.grade_map)) if self.grade_map else None
+
+    def match_one(self, text):
+        """单个文本匹配：先精确匹配，再按 grade_map 顺序取第一个包含的等级（与 _convert_score 一致）"""
+        if text in self.grade_map:
+            return self.grade_map[text]
+        if self.pattern is None or not self.pattern.search(text):
+            return np.nan
+        for key, value in self.grade_map.items():
+            if key in text:
+                return value
+        return np.nan
+
+    def match(self, texts):
+        """整列匹配（texts 为已去空格的字符串Series），未命中等级的返回NaN"""
+        table = {text: self.match_one(text) for text in pd.unique(texts)}
+        return texts.map(table).astype(float)
+
+
+# ============ 课程分类匹配器 ============
+class CourseClassifier:
+    """
+    课程分类匹配器 - 一个专业的选修课清单编译一次：
+    所有关键词合成一个正则做预筛选，命中后再按清单顺序逐个比对（保持“先匹配先得”）；
+    整列分类时每个不同的（课程名称, 课程编号）只分类一次
+    """
+
+    def __init__(self, elective_courses, default='必修课程'):
+        self.default = default
+        self.rules = [(course_type, str(kw))
+                      for course_type, courses in elective_courses.items()
+                      for kw in courses]
+        keywords = sorted({kw for _, kw in self.rules}, key=len, reverse=True)
+        # 空关键词会匹配任何课程，此时不能用正则预筛选
+        if keywords and '' not in keywords:
+            self.pattern = re.compile('|'.join(re.escape(kw) for kw in keywords))
+        else:
+            self.pattern = None
+
+    def classify_one(self, course_name, course_code):
+        """单门课程分类（与逐行 classify_course 一致）"""
+        if not self.rules:
+            return self.default
+        if self.pattern is not None and not (self.pattern.search(course_name)
+                                             or self.pattern.search(course_code)):
+            return self.default
+        for course_type, kw in self.rules:
+            if kw in course_name or kw in course_code:
+                return course_type
+        return self.default
+
+    def classify(self, course_names, course_codes):
+        """整列分类（两个字符串Series），返回同索引的课程类别Series"""
+        if course_names.empty:
+            return pd.Series([], index=course_names.index, dtype=object)
+        pairs = pd.MultiIndex.from_arrays([course_names, course_codes])
+        codes, uniques = pd.factorize(pairs)
+        labels = np.array([self.classify_one(name, code) for name, code in uniques], dtype=object)
+        return pd.Series(labels[codes], index=course_names.index, dtype=object)
+
+
+# ============ 提示信息输出 ============
+class StreamlitReporter:
+    """计算器的提示信息输出到 Streamlit 页面"""
+
+    def write(self, message):
+        st.write(message)
+
+    def error(self, message):
+        st.error(message)
+
+
+class ConsoleReporter:
+    """命令行模式：提示信息写到标准输出（quiet 时不输出），错误写到标准错误"""
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+
+    def write(self, message):
+        if not self.quiet:
+            print(message)
+
+    def error(self, message):
+        print(message, file=sys.stderr)
+
+
+# ============ 阶段计时 ============
+class StageTimer:
+    """
+    轻量级阶段计时：记录每个阶段的用时、处理行数和是否复用了缓存（线程安全，两个导出线程可同时记录）。
+    分组：读取（解析上传文件）、计算（各流水线阶段）、导出（写汇总工作簿、打包明细）。
+    """
+
+    COLUMNS = ['分组', '阶段', '用时(毫秒)', '处理行数', '每学生平均(毫秒)', '复用缓存']
+
+    def __init__(self, max_records=500):
+        self.records = []
+        self.max_records = max_records
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None, group='计算'):
+        """with timer.stage('成绩换算', rows=len(df)): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, rows, group)
+
+    def record(self, name, seconds, rows=None, group='计算', cached=False):
+        with self._lock:
+            self.records.append({'stage': name, 'group': group, 'seconds': seconds,
+                                 'rows': None if rows is None else int(rows), 'cached': cached})
+            if len(self.records) > self.max_records:
+                del self.records[0]
+
+    def has_group(self, group):
+        return any(record['group'] == group for record in self.records)
+
+    def has_stage(self, name):
+        return any(record['stage'] == name for record in self.records)
+
+    def reset(self, keep=('读取',)):
+        """开始新一次计算：清除计算、导出阶段的记录，保留文件读取记录"""
+        with self._lock:
+            self.records = [record for record in self.records if record['group'] in keep]
+
+    def total_seconds(self):
+        return sum(record['seconds'] for record in self.records)
+
+    def to_frame(self, student_count=None):
+        """性能统计表（每学生平均 = 阶段用时 / 学生数）"""
+        rows = []
+        for record in list(self.records):
+            rows.append([
+                record['group'],
+                record['stage'],
+                round(record['seconds'] * 1000, 3),
+                record['rows'],
+                round(record['seconds'] * 1000 / student_count, 4) if student_count else None,
+                '是' if record['cached'] else ''
+            ])
+        return pd.DataFrame(rows, columns=self.COLUMNS)
+
+    def log_line(self, **context):
+        """一次计算的结构化日志：单行JSON，便于服务器日志收集"""
+        payload = {
+            'event': 'grade_calculation',
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            **context,
+            'total_seconds': round(self.total_seconds(), 6),
+            'stages': [dict(record, seconds=round(record['seconds'], 6)) for record in list(self.records)]
+        }
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+# ============ 排名索引（单个学生增量重排） ============
+class RankIndex:
+    """
+    排名索引 - 上次全量计算的平均成绩有序数组（全体一份，每个班级类型各一份）。
+    某位学生的平均成绩变化后，用二分查找数出比他高的人数即得新名次（O(log n)），无需对全体重新排序。
+    名次规则与 _rank 相同：同分取最小名次。
+    """
+
+    def __init__(self, aggregated):
+        self.averages = {}  # 学号 -> (平均成绩, 班级类型)
+        self.sorted_all = np.empty(0)
+        self.sorted_by_class = {}
+        if aggregated.empty:
+            return
+        self.averages = dict(zip(aggregated['学号'], zip(aggregated['平均成绩'], aggregated['班级类型'])))
+        self.sorted_all = np.sort(aggregated['平均成绩'].to_numpy(dtype=float))
+        self.sorted_by_class = {
+            student_class: np.sort(group['平均成绩'].to_numpy(dtype=float))
+            for student_class, group in aggregated.groupby('班级类型')
+        }
+
+    def __len__(self):
+        return len(self.sorted_all)
+
+    @staticmethod
+    def _position(sorted_values, average, previous=None):
+        """average 的名次 = 比它高的人数 + 1；previous 为该学生原来的平均成绩，数人数时把他本人排除"""
+        higher = len(sorted_values) - int(np.searchsorted(sorted_values, average, side='right'))
+        if previous is not None and previous > average:
+            higher -= 1
+        return higher + 1
+
+    def rank(self, student_id, average, student_class):
+        """学生平均成绩为 average 时的 (排名, 班级内排名, 参与排名人数)"""
+        previous, previous_class = self.averages.get(student_id, (None, None))
+        class_values = self.sorted_by_class.get(student_class, np.empty(0))
+        return (
+            self._position(self.sorted_all, average, previous),
+            self._position(class_values, average, previous if previous_class == student_class else None),
+            len(self.sorted_all) + (previous is None)
+        )
+
+
+# ============ 流式写出Excel（write-only工作簿） ============
+class ExcelStreamWriter:
+    """
+    基于 openpyxl write_only 工作簿的导出器：DataFrame 按行流式写入，整个工作簿只保存一次。
+    单元格取值与表头样式（加粗、细边框、居中）与 DataFrame.to_excel 一致。
+    """
+
+    def __init__(self, target):
+        from openpyxl import Workbook
+        from openpyxl.styles import Alignment, Border, Font, Side
+
+        self.target = target
+        self.workbook = Workbook(write_only=True)
+        thin = Side(style='thin')
+        self._header_font = Font(bold=True)
+        self._header_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        self._header_alignment = Alignment(horizontal='center', vertical='top')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.save()
+
+    @staticmethod
+    def _cell_value(value):
+        """对应 to_excel 的取值规则：缺失值留空，无穷大写成 inf 文本"""
+        if value is None or value is pd.NaT:
+            return None
+        if isinstance(value, (float, np.floating)):
+            if np.isnan(value):
+                return None
+            if np.isinf(value):
+                return '-inf' if value < 0 else 'inf'
+        return value
+
+    def _header_cell(self, worksheet, value):
+        from openpyxl.cell import WriteOnlyCell
+
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.font = self._header_font
+        cell.border = self._header_border
+        cell.alignment = self._header_alignment
+        return cell
+
+    def write_frame(self, sheet_name, df, extra_rows=()):
+        """写入一个工作表：表头 + DataFrame各行（不含索引），extra_rows 追加在数据之后"""
+        worksheet = self.workbook.create_sheet(sheet_name)
+        worksheet.append([self._header_cell(worksheet, str(col)) for col in df.columns])
+
+        convert = self._cell_value
+        for row in df.itertuples(index=False, name=None):
+            worksheet.append([convert(value) for value in row])
+
+        for row in extra_rows:
+            worksheet.append(list(row))
+        return worksheet
+
+    def save(self):
+        self.workbook.save(self.target)
+
+
 # ============ 成绩计算器类（完全不变，只改文件读取方式） ============
 class StudentGradeCalculator:
     """
@@ -237,13 +802,39 @@ class StudentGradeCalculator:
     Streamlit版 - 完全保留原逻辑
     """
 
-    def __init__(self, file_path=None, df=None):
-        """支持两种初始化：文件路径或DataFrame"""
+    # 未选择专业时使用的选修课清单（23勘工）
+    LEGACY_ELECTIVE_COURSES = {
+        '学科基础课程': [
+            '科学计算语言与编程', 'Python程序设计与实践', '海洋地质学概论',
+            '电工电子学', '数据结构', '计算机图形学', '地理信息系统',
+            '并行编程原理与程序设计', '专业英语与科技写作', '岩石物理学基础'
+        ],
+        '专业知识课程': [
+            '地球物理测井', '油气地质学', '工程与环境地球物理',
+            '地球物理大数据与人工智能', '海洋地球物理探测技术',
+            '计算地球物理原理', '国际课程-三维地震勘探', '非常规油气勘探开发',
+            '人工智能资料处理与解释', '海洋电磁学', '地学软件工程',
+            '地球物理前沿讲座'
+        ],
+        '工作技能课程': [
+            '地球物理技能训练', '地球物理软件设计实习', '工程实践'
+        ]
+    }
+
+    def __init__(self, file_path=None, df=None, reporter=None):
+        """支持两种初始化：文件路径或DataFrame；reporter 负责输出提示信息（默认输出到 Streamlit 页面）"""
         self.file_path = file_path
         self.df = df
+        self.reporter = reporter or StreamlitReporter()
+        self.timings = StageTimer()
         self.raw_data = None
         self.header_row = 0
+        self.header_score = 0
+        self.sheet_name = None
         self.column_mapping = {}
+        self.memory_usage = None
+        # 最近一次 append_records 的核对结果：True 一致，False 不一致（已丢弃增量产物），None 未核对
+        self.append_verified = None
         self.calc_mode = '保研'
 
         # 专业配置
@@ -265,7 +856,8 @@ class StudentGradeCalculator:
             '课程名称': ['课程名称', '课程名', 'course', 'course name'],
             '课程编号': ['课程编号', '课程代码', 'course code', 'course_id'],
             '开课单位': ['开课单位', '开课院系', '开课系', 'department', 'dept'],
-            '绩点': ['绩点', 'gpa', 'grade point']
+            '绩点': ['绩点', 'gpa', 'grade point'],
+            '专业': ['上课专业', '所在专业', '专业', 'major']
         }
 
         # 成绩映射（完全不变）
@@ -278,6 +870,7 @@ class StudentGradeCalculator:
             '通过': 85,
             '不通过': 0
         }
+        self.grade_matcher = GradeLabelMatcher(self.grade_map)
 
         self.plan_credits = {}
         self.class_credit_requirements = {
@@ -293,47 +886,380 @@ class StudentGradeCalculator:
             }
         }
 
+        # 课程分类匹配器（按选修课清单缓存）
+        self._course_classifier = None
+        self._course_classifier_key = None
+
+        # 分阶段计算的产物缓存：{阶段名: OrderedDict(输入键 → 产物)}
+        self._stage_cache = {}
+        self._dataset_key = None
+        self._dataset_key_df = None
+
         # 计算明细存储
         self.calculation_details = {}
         self.duplicate_courses_record = {}
 
-    # ============ 核心检测函数（完全不变） ============
+    # ============ 核心检测函数（打分规则不变，查看范围扩大到各工作表的前 HEADER_SCAN_ROWS 行） ============
+    # 表头关键词及分值
+    HEADER_KEYWORDS = {
+        '学号': 10, 'student': 8, 'id': 5,
+        '姓名': 10, 'name': 8,
+        '课程': 8, 'course': 6,
+        '成绩': 8, 'score': 6, 'grade': 6,
+        '学分': 8, 'credit': 6,
+        '学期': 5, 'semester': 4,
+        '院系': 3, 'department': 3,
+        '教师': 2, 'teacher': 2
+    }
+    # 流式读取时表头检测每次读入的行数，以及查看的行数（这些行全部打分后取得分最高的行）
+    HEADER_SCAN_CHUNK = 20
+    HEADER_SCAN_ROWS = 200
+
+    def score_header_rows(self, raw_data):
+        """
+        表头得分（整表向量化）：每行命中的关键词分值之和 + 非空单元格数 × 0.5。
+        关键词不含空格，与把整行非空单元格用空格拼接后逐个查找的结果相同。
+        """
+        if raw_data is None or raw_data.empty:
+            return pd.Series(dtype=float)
+        cells = raw_data.stack()  # 只保留非空单元格
+        row_text = cells.astype(str).str.lower().groupby(level=0, sort=False).agg(' '.join)
+        row_text = row_text.reindex(raw_data.index, fill_value='')
+
+        keyword_score = pd.Series(0, index=raw_data.index)
+        for keyword, score in self.HEADER_KEYWORDS.items():
+            keyword_score += row_text.str.contains(keyword.lower(), regex=False).to_numpy() * score
+        return keyword_score + raw_data.count(axis=1) * 0.5
+
+    def locate_header(self, raw_data):
+        """
+        在 raw_data 的前 HEADER_SCAN_ROWS 行中定位表头：全部打分后取得分最高的行。
+        不在出现高分行时提前结束，否则表头前得分较高的说明行会挡住后面真正的表头。
+        返回 (表头行, 得分, 已查看的行数)；得分相同取靠前的行，全部为0时表头为第0行。
+        """
+        scores = self.score_header_rows(raw_data.iloc[:self.HEADER_SCAN_ROWS])
+        if not len(scores) or scores.max() <= 0:
+            return 0, 0, len(scores)
+        return int(scores.idxmax()), float(scores.max()), len(scores)
+
     def detect_header_row(self):
         """
         核心功能：自动检测表头在第几行
         """
         # 静默检测，不输出任何内容
-        keywords = {
-            '学号': 10, 'student': 8, 'id': 5,
-            '姓名': 10, 'name': 8,
-            '课程': 8, 'course': 6,
-            '成绩': 8, 'score': 6, 'grade': 6,
-            '学分': 8, 'credit': 6,
-            '学期': 5, 'semester': 4,
-            '院系': 3, 'department': 3,
-            '教师': 2, 'teacher': 2
-        }
+        self.header_row, self.header_score, _ = self.locate_header(self.raw_data)
+        return self.header_row
+
+    # ============ 加载数据（单次读取工作簿） ============
+    def load_data(self, source=None, mapped_only=True):
+        """
+        加载成绩表 - 工作簿只解析一次：在各工作表开头检测表头（选得分最高的工作表），再把表头行提升为列名构建 self.df
+        mapped_only=True 时流式读取，只保留 auto_detect_columns 识别出的列（内存只与保留列成正比）
+        CSV/TSV 等文本导出（按文件开头字节识别）改为分块读取，见 _load_delimited
+        返回 auto_detect_columns() 的结果 (success, missing)
+        """
+        from openpyxl.utils.exceptions import InvalidFileException
+
+        source = self.file_path if source is None else source
+        if is_delimited_text(source):
+            return self._load_delimited(source, mapped_only)
+        try:
+            if mapped_only:
+                return self._load_streaming(source)
+            sheet_index = self._locate_workbook_header(source)
+            rows = read_sheet_rows(source, sheet_index)
+        except (InvalidFileException, zipfile.BadZipFile):
+            # 非xlsx格式（如xls）交给pandas读取：各工作表的开头都检测一遍表头，取得分最高的工作表
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            heads = pd.read_excel(source, sheet_name=None, header=None, nrows=self.HEADER_SCAN_ROWS)
+            best = None
+            for sheet_name, head in heads.items():
+                header_row, score, scanned = self.locate_header(head)
+                if best is None or score > best[0]:
+                    best = (score, sheet_name, header_row, head.iloc[:scanned])
+            self.header_score, self.sheet_name, self.header_row, self.raw_data = best
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            self.df = pd.read_excel(source, sheet_name=self.sheet_name, header=self.header_row)
+            return self.auto_detect_columns()
+
+        head = rows_to_frame(rows[:self.HEADER_SCAN_ROWS], header=None)
+        self.header_row, self.header_score, scanned = self.locate_header(head)
+        self.raw_data = rows_to_frame(rows[:scanned], header=None)
+        self.df = rows_to_frame(rows, header=self.header_row)
+        del rows
+        return self.auto_detect_columns()
+
+    def _scan_sheet_header(self, row_iter, convert):
+        """
+        读取一个工作表开头的 HEADER_SCAN_ROWS 行并定位表头（与 locate_header 相同：全部打分后取得分最高的行）。
+        返回 (得分, 表头行, 已读取的原始行, 转换后的行)；row_iter 停在已读取部分之后，可继续读取数据行。
+        """
+        head_rows, converted_head = [], []
+        header_row, header_score = 0, 0
+        while len(head_rows) < self.HEADER_SCAN_ROWS:
+            chunk = list(itertools.islice(row_iter, min(self.HEADER_SCAN_CHUNK, self.HEADER_SCAN_ROWS - len(head_rows))))
+            if not chunk:
+                break
+            converted = []
+            for row in chunk:
+                values = [convert(v) for v in row]
+                while values and values[-1] == '':
+                    values.pop()
+                converted.append(values)
+            # 各行得分互不影响，只需给新读入的这一段打分
+            scores = self.score_header_rows(rows_to_frame(converted, header=None))
+            if len(scores) and scores.max() > header_score:
+                header_score = float(scores.max())
+                header_row = len(head_rows) + int(scores.idxmax())
+            head_rows.extend(chunk)
+            converted_head.extend(converted)
+        return header_score, header_row, head_rows, converted_head
+
+    def _locate_workbook_header(self, source):
+        """xlsx 各工作表开头检测表头，返回得分最高的工作表序号（得分相同取靠前的工作表）"""
+        from openpyxl import load_workbook
+
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+        try:
+            best_index, best_score = 0, None
+            for index, sheet in enumerate(workbook.worksheets):
+                sheet.reset_dimensions()
+                score = self._scan_sheet_header(sheet.iter_rows(values_only=True), excel_value_converter())[0]
+                if best_score is None or score > best_score:
+                    best_index, best_score = index, score
+                    self.sheet_name = sheet.title
+        finally:
+            workbook.close()
+        return best_index
+
+    def _load_streaming(self, source):
+        """
+        流式读取（openpyxl只读模式 + values_only）：
+        各工作表开头检测表头，取得分最高的工作表识别列名，之后逐行只把已识别列的值追加到各自的列缓冲区
+        """
+        from openpyxl import load_workbook
+
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+        convert = excel_value_converter()
+        try:
+            # 每个工作表只读开头若干行检测表头，取得分最高的工作表继续往下读（得分相同取靠前的工作表）
+            best = None
+            for sheet in workbook.worksheets:
+                # 不读取 sheet.max_row：缺少dimension标记的文件会因此额外扫描整个工作表
+                sheet.reset_dimensions()
+                row_iter = sheet.iter_rows(values_only=True)
+                scanned = self._scan_sheet_header(row_iter, convert)
+                if best is None or scanned[0] > best[0][0]:
+                    best = (scanned, sheet.title, row_iter)
+            (self.header_score, self.header_row, head_rows, converted_head), self.sheet_name, row_iter = best
+            self.raw_data = rows_to_frame(converted_head, header=None)
+
+            # 表头行提升为列名（列名去重、Unnamed 命名与 read_excel 一致）
+            width = max((len(values) for values in converted_head), default=0)
+            header_rows = [values + [''] * (width - len(values))
+                           for values in converted_head[:self.header_row + 1]]
+            self.df = pd.DataFrame(columns=rows_to_frame(header_rows, header=self.header_row).columns)
+            success, missing = self.auto_detect_columns()
+            if not success:
+                return success, missing
+
+            mapped = set(self.column_mapping.values())
+            keep = [(i, col) for i, col in enumerate(self.df.columns) if col in mapped]
+            buffers = [_ColumnBuffer(4096) for _ in keep]
+
+            # 空行先计数，等后面出现数据行时再补为缺失值；表尾的空行因此自然被丢弃（与 read_excel 一致）
+            pending_blank = 0
+            for row in itertools.chain(head_rows[self.header_row + 1:], row_iter):
+                n = len(row)
+                if row.count(None) + row.count('') == n:
+                    pending_blank += 1
+                    continue
+                for buffer, (i, _) in zip(buffers, keep):
+                    if pending_blank:
+                        buffer.append_missing(pending_blank)
+                    buffer.append(convert(row[i]) if i < n else None)
+                pending_blank = 0
+            del head_rows, converted_head
+        finally:
+            workbook.close()
+
+        self.df = pd.DataFrame({col: buffer.finish() for buffer, (_, col) in zip(buffers, keep)},
+                               columns=[col for _, col in keep])
+        return success, missing
+
+    # ============ CSV/TSV：分块读取 ============
+    CSV_CHUNK_ROWS = 50000
+    CSV_SNIFF_BYTES = 64 * 1024
+
+    def _load_delimited(self, source, mapped_only=True):
+        """
+        分块读取CSV/TSV：先按文件开头判断编码和分隔符，用与工作簿相同的打分在开头若干行中定位表头，
+        再从表头之后逐块读取（mapped_only=True 时只读已识别的列），每块读入后立即规范学号、学分和成绩，
+        整个文件的文本不会一次性读入内存。返回 auto_detect_columns() 的结果
+        """
+        with open_binary(source) as f:
+            encoding = sniff_encoding(f.read(self.CSV_SNIFF_BYTES))
+            f.seek(0)
+            # 只按 \r、\n 分行（与csv模块、pandas一致）；不用 codecs 的 readline，它还会在 \x0b、\u2028 等字符处断行
+            text = TextIOWrapper(f, encoding=encoding, newline='')
+            try:
+                lines = list(itertools.islice(text, self.HEADER_SCAN_ROWS))
+            finally:
+                # 解除包装，避免包装对象回收时关闭调用方传入的文件对象
+                text.detach()
+            delimiter = sniff_delimiter(lines)
+            # 记录每条记录结束时已读的物理行数：引号内的换行使一条记录跨多行，表头之后的数据从物理行数处开始读
+            reader = csv.reader(lines, delimiter=delimiter)
+            line_ends = []
+
+            def records():
+                for record in reader:
+                    line_ends.append(reader.line_num)
+                    yield record
+
+            self.header_score, self.header_row, _, head = self._scan_sheet_header(records(), str.strip)
+        header_lines = line_ends[self.header_row] if line_ends else 0
+        self.raw_data = rows_to_frame(head, header=None)
+        self.sheet_name = None
+
+        # 表头行提升为列名（列名去重、Unnamed 命名与工作簿一致）
+        width = max((len(values) for values in head), default=0)
+        header_rows = [values + [''] * (width - len(values)) for values in head[:self.header_row + 1]]
+        self.df = pd.DataFrame(columns=rows_to_frame(header_rows, header=self.header_row).columns)
+        success, missing = self.auto_detect_columns()
+        if mapped_only and not success:
+            return success, missing
+
+        columns = list(self.df.columns)
+        if mapped_only:
+            mapped = set(self.column_mapping.values())
+            keep = [i for i, col in enumerate(columns) if col in mapped]
+        else:
+            keep = list(range(len(columns)))
 
-        best_score = 0
-        best_row = 0
+        chunks = []
+        with open_binary(source) as f:
+            # 先按物理行跳过表头及其之前的内容，再交给pandas（不用 skiprows：它按记录计数，与上面的物理行数不同）
+            text = TextIOWrapper(f, encoding=encoding, newline='')
+            try:
+                for _ in range(header_lines):
+                    text.readline()
+                reader = pd.read_csv(
+                    text, sep=delimiter, header=None, names=list(range(width)), index_col=False,
+                    usecols=keep, dtype=str, skipinitialspace=True, chunksize=self.CSV_CHUNK_ROWS
+                )
+                for chunk in reader:
+                    chunk.columns = [columns[i] for i in chunk.columns]
+                    chunks.append(self._normalize_text_chunk(chunk))
+            finally:
+                text.detach()
+        self.df = pd.concat(chunks, ignore_index=True) if chunks else self.df.iloc[:, keep]
+        return success, missing
+
+    def _normalize_text_chunk(self, chunk):
+        """
+        文本读入的一块数据：去掉首尾空格，学号统一为文本学号（与 student_ids 一致），学分转为数值，
+        成绩能转成数字的转为数字、等级制成绩保留文本（与 convert_scores 对文本成绩的处理一致）
+        """
+        chunk = chunk.apply(lambda values: values.str.strip())
+        id_col = self.column_mapping.get('学号')
+        if id_col in chunk:
+            chunk[id_col] = self.student_ids(chunk)
+        credit_col = self.column_mapping.get('学分')
+        if credit_col in chunk:
+            chunk[credit_col] = pd.to_numeric(chunk[credit_col], errors='coerce')
+        score_col = self.column_mapping.get('总成绩')
+        if score_col in chunk:
+            scores = chunk[score_col]
+            numeric = pd.to_numeric(scores, errors='coerce')
+            if numeric.count() == scores.count():
+                chunk[score_col] = numeric
+            else:
+                chunk[score_col] = numeric.astype(object).where(numeric.notna(), scores)
+        return chunk
 
-        for idx, row in self.raw_data.iterrows():
-            row_score = 0
-            row_text = ' '.join([str(cell).lower() for cell in row.values if pd.notna(cell)])
+    # ============ 多文件合并（如每学期一个导出文件） ============
+    SOURCE_COLUMN = '来源文件'
+
+    def merge_sources(self, parts):
+        """
+        合并多个已各自识别好列名的成绩表：parts 为 [(来源文件名, column_mapping, df)]，按给定顺序拼接到 self.df。
+        同一字段在各文件中的列名统一为第一个含该字段的文件中的列名，只保留已识别的列，
+        另加“来源文件”列便于核对每条成绩出自哪个文件。返回 (success, missing)，与 auto_detect_columns() 相同
+        """
+        names = {}
+        for field in self.required_fields:
+            for _, mapping, _ in parts:
+                if field in mapping:
+                    # 两个字段在第一个文件里指向同一列时，后一个字段改用字段名作列名，避免合并后互相覆盖
+                    names[field] = mapping[field] if mapping[field] not in names.values() else field
+                    break
 
-            for keyword, score in keywords.items():
-                if keyword.lower() in row_text:
-                    row_score += score
+        frames = []
+        for source, mapping, df in parts:
+            frame = pd.DataFrame({names[field]: df[col] for field, col in mapping.items() if field in names},
+                                 index=df.index)
+            frame[self.SOURCE_COLUMN] = source
+            frames.append(frame)
+        columns = list(dict.fromkeys(names.values())) + [self.SOURCE_COLUMN]
+        self.df = pd.concat(frames, ignore_index=True).reindex(columns=columns) if frames else pd.DataFrame()
 
-            non_empty = row.count()
-            row_score += non_empty * 0.5
+        self.raw_data = None
+        self.header_row = 0
+        self.sheet_name = None
+        self.column_mapping = dict(names)
+        missing = [f for f in ['学号', '姓名', '学分', '总成绩'] if f not in self.column_mapping]
+        return not missing, missing
 
-            if row_score > best_score:
-                best_score = row_score
-                best_row = idx
+    # ============ 紧凑数据表 ============
+    # 取值重复多的列存为分类（整数编码 + 共享取值表）；学分、成绩等数值列不在此列
+    CATEGORICAL_FIELDS = ('学号', '姓名', '学年学期', '课程名称', '课程编号', '开课单位', '取得方式', '成绩标志', '专业')
+    CATEGORICAL_MAX_RATIO = 0.5
 
-        self.header_row = best_row
-        return self.header_row
+    def compact(self):
+        """
+        把 self.df 换成紧凑的类型化数据表：只保留已识别的列（及来源文件列）；
+        学号、学期、课程名称/编号、取得方式、成绩标志等存为分类，学分在不损失精度时存为float32，
+        成绩为文本与数字混合时存为分类（纯数字时保持原数值列）。
+        取值与原表逐个相等，各计算阶段的结果不变。返回并记录 (压缩前字节数, 压缩后字节数)
+        """
+        before = int(self.df.memory_usage(index=True, deep=True).sum())
+        fields = {col: field for field, col in self.column_mapping.items()}
+        columns = list(dict.fromkeys(self.column_mapping.values()))
+        if self.SOURCE_COLUMN in self.df.columns and self.SOURCE_COLUMN not in fields:
+            columns.append(self.SOURCE_COLUMN)
+
+        compact = {}
+        for col in columns:
+            values = self.df[col]
+            field = fields.get(col, self.SOURCE_COLUMN)
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.cat.remove_unused_categories()
+            elif field == '学分':
+                if values.dtype.kind in 'if':
+                    as_float32 = values.astype(np.float32)
+                    lossless = (as_float32.astype(np.float64).to_numpy() == values.to_numpy(dtype=float)) \
+                        | values.isna().to_numpy()
+                    values = as_float32 if lossless.all() else values.astype(float)
+            elif field == '总成绩':
+                if values.dtype == object:
+                    values = values.astype('category')
+            elif field in self.CATEGORICAL_FIELDS or field == self.SOURCE_COLUMN:
+                # 学号等按要求存为分类；其余列取值过于分散时分类反而更占空间，保持原样
+                if field in ('学号', self.SOURCE_COLUMN) \
+                        or values.nunique() <= len(values) * self.CATEGORICAL_MAX_RATIO:
+                    values = values.astype('category')
+            compact[col] = values
+
+        self.df = pd.DataFrame(compact, index=self.df.index)
+        self.memory_usage = (before, int(self.df.memory_usage(index=True, deep=True).sum()))
+        return self.memory_usage
 
     # ============ 自动识别列名（完全不变） ============
     def auto_detect_columns(self):
@@ -368,32 +1294,33 @@ class StudentGradeCalculator:
         """设置专业（根据用户选择）"""
         major_config = self.major_config.get_major(major_code)
         if not major_config:
-            st.write(f"❌ 无效的专业代码: {major_code}")
+            self.reporter.write(f"❌ 无效的专业代码: {major_code}")
             return False
 
         self.current_major = major_config
         self.major_name = major_config['专业名称']
+        self._course_classifier = None
         self.has_excellent_class = major_config['有卓越班']
 
         # === 新增：确保学分要求存在 ===
         if '学分要求' not in self.current_major:
-            st.error(f"❌ 专业 {self.major_name} 未配置学分要求")
+            self.reporter.error(f"❌ 专业 {self.major_name} 未配置学分要求")
             return False
 
         if self.has_excellent_class:
             self.excellent_students = major_config.get('卓越班级学号集', {})
             # === 新增：确保卓越/普通班学分要求存在 ===
             if '卓越' not in self.current_major['学分要求']:
-                st.error(f"❌ 卓越班学分要求未配置")
+                self.reporter.error(f"❌ 卓越班学分要求未配置")
                 return False
             if '普通' not in self.current_major['学分要求']:
-                st.error(f"❌ 普通班学分要求未配置")
+                self.reporter.error(f"❌ 普通班学分要求未配置")
                 return False
-            st.write(f"✅ 已设置专业: {self.major_name}")
-            st.write(f"   📋 卓越班学生: {len(self.excellent_students)} 人")
+            self.reporter.write(f"✅ 已设置专业: {self.major_name}")
+            self.reporter.write(f"   📋 卓越班学生: {len(self.excellent_students)} 人")
         else:
             self.excellent_students = {}
-            st.write(f"✅ 已设置专业: {self.major_name}（无卓越班）")
+            self.reporter.write(f"✅ 已设置专业: {self.major_name}（无卓越班）")
 
         return True
 
@@ -444,6 +1371,74 @@ class StudentGradeCalculator:
         except:
             return None
 
+    # ============ 成绩换算（整表向量化） ============
+    def convert_scores(self, df):
+        """整表成绩换算 - 与逐行 _convert_score 结果完全一致，返回与df同索引的float Series"""
+        converted = pd.Series(np.nan, index=df.index, dtype=float)
+        score_col = self.column_mapping.get('总成绩')
+        if not score_col or df.empty:
+            return converted
+
+        scores = df[score_col]
+        exam_type = self._text_column(df, '取得方式')
+        score_flag = self._text_column(df, '成绩标志')
+
+        # 旷考/缺考，或缓考但未缓考取得 → 无效成绩
+        invalid = (score_flag.str.contains('旷考', regex=False)
+                   | score_flag.str.contains('缺考', regex=False)
+                   | (score_flag.str.contains('缓考', regex=False)
+                      & ~exam_type.str.contains('缓考取得', regex=False)))
+        # 补考取得：只认数值成绩，≥60 记 60
+        makeup = (exam_type.str.contains('补考取得', regex=False)
+                  | (exam_type.str.contains('补考', regex=False)
+                     & ~exam_type.str.contains('初修', regex=False)))
+        valid = scores.notna() & ~invalid
+        numeric, labels = self._score_values(scores)
+
+        makeup_rows = valid & makeup
+        normal_rows = valid & ~makeup
+        converted[makeup_rows] = numeric[makeup_rows].mask(numeric[makeup_rows] >= 60, 60.0)
+        # 等级制优先于数值
+        converted[normal_rows] = labels[normal_rows].fillna(numeric[normal_rows])
+        return converted
+
+    def _score_values(self, scores):
+        """
+        成绩取值的 (数值, 等级制分数) 两列：文本去空格后转换，其余类型直接转换。
+        分类列只对每个不同取值换算一次，再按编码展开
+        """
+        if isinstance(scores.dtype, pd.CategoricalDtype):
+            numeric, labels = self._score_values(pd.Series(scores.cat.categories, dtype=object))
+            codes = scores.cat.codes.to_numpy()
+            return (pd.Series(np.append(numeric.to_numpy(), np.nan)[codes], index=scores.index),
+                    pd.Series(np.append(labels.to_numpy(), np.nan)[codes], index=scores.index))
+
+        if scores.dtype == object:
+            is_text = scores.apply(isinstance, args=(str,))
+        else:
+            is_text = pd.Series(False, index=scores.index)
+        numeric = pd.Series(np.nan, index=scores.index, dtype=float)
+        labels = pd.Series(np.nan, index=scores.index, dtype=float)
+        if is_text.any():
+            text = scores[is_text].str.strip()
+            numeric[is_text] = pd.to_numeric(text, errors='coerce')
+            labels[is_text] = self.grade_matcher.match(text)
+        if (~is_text).any():
+            numeric[~is_text] = pd.to_numeric(scores[~is_text], errors='coerce')
+        return numeric, labels
+
+    def _text_column(self, df, field):
+        """取映射列的文本形式（缺失值为空字符串），未映射时整列为空字符串"""
+        col = self.column_mapping.get(field)
+        if not col:
+            return pd.Series('', index=df.index, dtype=object)
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # 分类列：每个取值只转一次文本，按编码展开（编码-1即缺失值，取末尾的空字符串）
+            table = np.append(values.cat.categories.astype(str).to_numpy(dtype=object), '')
+            return pd.Series(table[values.cat.codes.to_numpy()], index=df.index, dtype=object)
+        return values.where(values.notna(), '').astype(str)
+
     # ============ 获取学号（完全不变） ============
     def _get_student_id(self, row):
         """获取学号"""
@@ -468,6 +1463,28 @@ class StudentGradeCalculator:
         except:
             return 0
 
+    # ============ 整列获取学号 / 学分（向量化） ============
+    def student_ids(self, df):
+        """整列获取学号 - 每个不同取值只转换一次，结果与 _get_student_id 一致（无学号为NaN）"""
+        id_col = self.column_mapping.get('学号')
+        if not id_col:
+            return pd.Series(np.nan, index=df.index, dtype=object)
+        values = df[id_col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            table = [self._get_student_id({id_col: val}) for val in values.cat.categories]
+            table = np.array(table + [np.nan], dtype=object)
+            return pd.Series(table[values.cat.codes.to_numpy()], index=df.index, dtype=object)
+        table = {val: self._get_student_id({id_col: val}) for val in pd.unique(values.dropna())}
+        return values.map(table)
+
+    def credits(self, df):
+        """整列获取学分 - 无法转换的记0，结果与 _get_credit 一致"""
+        credit_col = self.column_mapping.get('学分')
+        if not credit_col:
+            return pd.Series(0.0, index=df.index)
+        # 紧凑数据表中学分可能存为float32，这里统一转回float64再参与累加
+        return pd.to_numeric(df[credit_col], errors='coerce').astype(float).fillna(0.0)
+
     # ============ 获取学生班级（完全不变） ============
     def _get_student_class(self, student_id):
         """判断学生班级类型：卓越 或 普通"""
@@ -501,7 +1518,20 @@ class StudentGradeCalculator:
         except:
             return value
 
-    # ============ 课程分类（完全不变） ============
+    # ============ 课程分类（预编译匹配器） ============
+    def get_course_classifier(self):
+        """当前专业的课程分类匹配器 - 切换专业或选修课清单变化（如自定义培养方案）时自动重建"""
+        if self.current_major:
+            elective_courses = self.current_major.get('选修课列表', {})
+        else:
+            elective_courses = self.LEGACY_ELECTIVE_COURSES
+
+        key = tuple((course_type, tuple(courses)) for course_type, courses in elective_courses.items())
+        if self._course_classifier is None or self._course_classifier_key != key:
+            self._course_classifier = CourseClassifier(elective_courses)
+            self._course_classifier_key = key
+        return self._course_classifier
+
     def classify_course(self, row):
         """课程分类 - 根据当前专业配置的选修课列表"""
         course_name = ''
@@ -518,35 +1548,21 @@ class StudentGradeCalculator:
         if not self.current_major:
             return self._classify_course_legacy(course_name, course_code)
 
-        elective_courses = self.current_major.get('选修课列表', {})
-
-        for course_type, courses in elective_courses.items():
-            for kw in courses:
-                if kw in course_name or kw in course_code:
-                    return course_type
+        return self.get_course_classifier().classify_one(course_name, course_code)
 
-        return '必修课程'
+    def classify_courses(self, df):
+        """整表课程分类 - 每个不同的（课程名称, 课程编号）只分类一次，结果与 classify_course 一致"""
+        return self.get_course_classifier().classify(
+            self._text_column(df, '课程名称'),
+            self._text_column(df, '课程编号')
+        )
 
     # ============ 旧分类方法（完全不变） ============
     def _classify_course_legacy(self, course_name, course_code):
         """原有的分类方法（23勘工）"""
-        basic_courses = [
-            '科学计算语言与编程', 'Python程序设计与实践', '海洋地质学概论',
-            '电工电子学', '数据结构', '计算机图形学', '地理信息系统',
-            '并行编程原理与程序设计', '专业英语与科技写作', '岩石物理学基础'
-        ]
-
-        major_courses = [
-            '地球物理测井', '油气地质学', '工程与环境地球物理',
-            '地球物理大数据与人工智能', '海洋地球物理探测技术',
-            '计算地球物理原理', '国际课程-三维地震勘探', '非常规油气勘探开发',
-            '人工智能资料处理与解释', '海洋电磁学', '地学软件工程',
-            '地球物理前沿讲座'
-        ]
-
-        skill_courses = [
-            '地球物理技能训练', '地球物理软件设计实习', '工程实践'
-        ]
+        basic_courses = self.LEGACY_ELECTIVE_COURSES['学科基础课程']
+        major_courses = self.LEGACY_ELECTIVE_COURSES['专业知识课程']
+        skill_courses = self.LEGACY_ELECTIVE_COURSES['工作技能课程']
 
         for kw in basic_courses:
             if kw in course_name or kw in course_code:
@@ -572,55 +1588,87 @@ class StudentGradeCalculator:
         else:
             return self.current_major['学分要求']
 
-    # ============ 处理重复课程（完全不变） ============
-    def _handle_duplicate_courses(self, df):
-        """处理同一课程多次考试的情况（补考）"""
+    # ============ 处理重复课程（整表向量化） ============
+    def _course_keys(self, df):
+        """课程标识：课程编号_课程名称（无课程列时返回None）"""
         has_course_id = '课程编号' in self.column_mapping
         has_course_name = '课程名称' in self.column_mapping
 
         if not (has_course_id or has_course_name):
-            return set()
+            return None
 
-        df['_课程标识'] = ''
-        if has_course_id:
-            id_col = self.column_mapping['课程编号']
-            df['_课程标识'] += df[id_col].astype(str) + '_'
-        if has_course_name:
-            name_col = self.column_mapping['课程名称']
-            df['_课程标识'] += df[name_col].astype(str)
+        # 每个出现过的（课程编号, 课程名称）组合只拼接一次文本，结果与逐列 astype(str) 拼接相同
+        combined = np.zeros(len(df), dtype=np.int64)
+        columns = []
+        for field, suffix in (('课程编号', '_'), ('课程名称', '')):
+            if field in self.column_mapping:
+                codes, uniques = pd.factorize(df[self.column_mapping[field]], use_na_sentinel=False)
+                combined = combined * len(uniques) + codes
+                columns.append(([str(value) + suffix for value in uniques], len(uniques)))
+        pair_codes, pairs = pd.factorize(combined)
+        labels = []
+        for pair in pairs:
+            label = ''
+            for texts, size in reversed(columns):
+                pair, position = divmod(pair, size)
+                label = texts[position] + label
+            labels.append(label)
+        return pd.Series(np.array(labels, dtype=object)[pair_codes], index=df.index, dtype=object)
+
+    def _makeup_mask(self, df):
+        """补考记录：取得方式含“补考”且不含“初修”"""
+        exam_type = self._text_column(df, '取得方式')
+        return (exam_type.str.contains('补考', regex=False)
+                & ~exam_type.str.contains('初修', regex=False))
+
+    def resolve_duplicate_courses(self, df):
+        """
+        整表处理同一课程多次考试（补考）- 按（学号, 课程标识）一次分组，不逐个学生循环。
+        每个重复课程组取最后一条补考记录：补考≥60 记60分并删除最后一条初修记录；
+        补考<60 则删除该补考记录。
+        返回两个与df等长的布尔数组：(需记60分的行, 需删除的行)
+        """
+        n = len(df)
+        set_sixty = np.zeros(n, dtype=bool)
+        drop = np.zeros(n, dtype=bool)
 
-        acquire_col = self.column_mapping.get('取得方式', None)
-        courses_to_drop = set()
+        keys = self._course_keys(df)
+        if keys is None or n == 0:
+            return set_sixty, drop
 
-        for course_id, course_group in df.groupby('_课程标识'):
-            if len(course_group) > 1:
-                has_makeup = False
-                makeup_idx = None
-                makeup_score = None
-                original_idx = None
+        group_keys = [df['_学号'], keys] if '_学号' in df.columns else [keys]
+        grouped = keys.groupby(group_keys, sort=False)
+        group_ids = grouped.ngroup().to_numpy()
+        duplicated = grouped.transform('size').to_numpy() > 1
+        makeup = self._makeup_mask(df).to_numpy()
+        scores = df['_计算成绩'].to_numpy(dtype=float)
 
-                for idx, row in course_group.iterrows():
-                    exam_type = ''
-                    if acquire_col and pd.notna(row.get(acquire_col)):
-                        exam_type = str(row[acquire_col])
+        def last_per_group(mask):
+            positions = np.flatnonzero(mask)
+            return positions[~pd.Series(group_ids[positions]).duplicated(keep='last').to_numpy()]
 
-                    is_makeup = '补考' in exam_type and '初修' not in exam_type
+        last_makeup = last_per_group(duplicated & makeup)
+        passed = scores[last_makeup] >= 60
+        set_sixty[last_makeup[passed]] = True
+        drop[last_makeup[~passed]] = True
 
-                    if is_makeup:
-                        has_makeup = True
-                        makeup_idx = idx
-                        makeup_score = row['_计算成绩']
-                    else:
-                        original_idx = idx
+        last_original = last_per_group(duplicated & ~makeup)
+        passed_groups = group_ids[last_makeup[passed]]
+        drop[last_original[np.isin(group_ids[last_original], passed_groups)]] = True
 
-                if has_makeup and makeup_idx is not None:
-                    if makeup_score >= 60:
-                        df.loc[makeup_idx, '_计算成绩'] = 60.0
-                        if original_idx is not None:
-                            courses_to_drop.add(original_idx)
-                    else:
-                        courses_to_drop.add(makeup_idx)
+        return set_sixty, drop
+
+    def _handle_duplicate_courses(self, df):
+        """处理同一课程多次考试的情况（补考）- 原地修改df，返回删除的行索引集合"""
+        keys = self._course_keys(df)
+        if keys is None:
+            return set()
 
+        df['_课程标识'] = keys
+        set_sixty, drop = self.resolve_duplicate_courses(df)
+        df.loc[set_sixty, '_计算成绩'] = 60.0
+
+        courses_to_drop = set(df.index[drop])
         if courses_to_drop:
             df.drop(index=courses_to_drop, inplace=True)
 
@@ -689,73 +1737,46 @@ class StudentGradeCalculator:
 
         return f'{student_class}班{course_type}需择优计入{required}学分'
 
-    # ============ 分析重复课程（完全不变） ============
+    # ============ 分析重复课程（整表向量化） ============
     def _analyze_duplicate_courses(self, df):
-        """分析重复课程处理情况"""
-        duplicate_records = []
-
-        has_course_id = '课程编号' in self.column_mapping
-        has_course_name = '课程名称' in self.column_mapping
-
-        if not (has_course_id or has_course_name):
-            return duplicate_records
-
-        df = df.copy()
-        df['_课程标识'] = ''
-        if has_course_id:
-            id_col = self.column_mapping['课程编号']
-            df['_课程标识'] += df[id_col].astype(str) + '_'
-        if has_course_name:
-            name_col = self.column_mapping['课程名称']
-            df['_课程标识'] += df[name_col].astype(str)
-
-        acquire_col = self.column_mapping.get('取得方式', None)
-
-        for course_id, course_group in df.groupby('_课程标识'):
-            if len(course_group) > 1:
-                has_makeup = False
-                makeup_records = []
-                original_records = []
-
-                for idx, row in course_group.iterrows():
-                    exam_type = ''
-                    if acquire_col and pd.notna(row.get(acquire_col)):
-                        exam_type = str(row[acquire_col])
-
-                    is_makeup = '补考' in exam_type and '初修' not in exam_type
-
-                    record = {
-                        '课程标识': course_id,
-                        '课程名称': row[self.column_mapping['课程名称']] if '课程名称' in self.column_mapping else '',
-                        '考试类型': exam_type if exam_type else '初修',
-                        '原始成绩': row[self.column_mapping['总成绩']] if '总成绩' in self.column_mapping else '',
-                        '换算后成绩': row['_计算成绩'] if '_计算成绩' in row else '',
-                        '处理结果': ''
-                    }
-
-                    if is_makeup:
-                        has_makeup = True
-                        makeup_records.append(record)
-                    else:
-                        original_records.append(record)
-
-                if has_makeup and makeup_records:
-                    for record in makeup_records:
-                        if record['换算后成绩'] >= 60:
-                            record['处理结果'] = '补考通过，成绩计60分，初修成绩不参与计算'
-                        else:
-                            record['处理结果'] = '补考未通过，保留此补考成绩'
-
-                    for record in original_records:
-                        if makeup_records[0]['换算后成绩'] >= 60:
-                            record['处理结果'] = '初修成绩，因补考通过不参与计算'
-                        else:
-                            record['处理结果'] = '初修成绩，保留参与计算'
-
-                    duplicate_records.extend(makeup_records)
-                    duplicate_records.extend(original_records)
-
-        return duplicate_records
+        """分析重复课程处理情况 - 生成“重复课程处理”表的记录（补考记录在前，初修记录在后）"""
+        keys = self._course_keys(df)
+        if keys is None or len(df) == 0:
+            return []
+
+        group_keys = [df['_学号'], keys] if '_学号' in df.columns else [keys]
+        grouped = keys.groupby(group_keys, sort=True)
+        makeup = self._makeup_mask(df)
+        has_makeup = makeup.groupby(group_keys, sort=True).transform('any')
+        involved = (grouped.transform('size') > 1) & has_makeup
+        if not involved.any():
+            return []
+
+        exam_type = self._text_column(df, '取得方式')
+        converted = df['_计算成绩'] if '_计算成绩' in df.columns else pd.Series('', index=df.index)
+
+        audit = pd.DataFrame({
+            '_组号': grouped.ngroup(),
+            '_原始记录': ~makeup,
+            '_序号': np.arange(len(df)),
+            '课程标识': keys,
+            '课程名称': df[self.column_mapping['课程名称']] if '课程名称' in self.column_mapping else '',
+            '考试类型': exam_type.where(exam_type != '', '初修'),
+            '原始成绩': df[self.column_mapping['总成绩']] if '总成绩' in self.column_mapping else '',
+            '换算后成绩': converted
+        })[involved.to_numpy()]
+        audit = audit.sort_values(['_组号', '_原始记录', '_序号'], kind='mergesort')
+
+        makeup_passed = pd.to_numeric(audit['换算后成绩'], errors='coerce') >= 60
+        first_makeup_passed = makeup_passed[~audit['_原始记录']].groupby(audit['_组号']).first()
+        group_passed = audit['_组号'].map(first_makeup_passed).astype(bool)
+
+        audit['处理结果'] = np.where(
+            ~audit['_原始记录'],
+            np.where(makeup_passed, '补考通过，成绩计60分，初修成绩不参与计算', '补考未通过，保留此补考成绩'),
+            np.where(group_passed, '初修成绩，因补考通过不参与计算', '初修成绩，保留参与计算')
+        )
+        return audit.drop(columns=['_组号', '_原始记录', '_序号']).to_dict('records')
 
     # ============ 重复课程规则说明（完全不变） ============
     def _get_duplicate_rule_description(self):
@@ -804,132 +1825,725 @@ class StudentGradeCalculator:
 
         return '；'.join(notes) if notes else '正常成绩'
 
-    # ============ 计算单个学生成绩（完全不变） ============
+    # ============ 计算单个学生成绩 ============
     def calculate_student_gpa(self, student_df, semester_filter=None, calc_mode='保研'):
-        """计算单个学生成绩"""
+        """计算单个学生成绩（与全体计算共用同一套选课与加权逻辑）"""
         df = student_df.copy()
+        df['_学号'] = self._get_student_id(df.iloc[0])
+        df['_姓名'] = df[self.column_mapping.get('姓名')].astype(str).str.strip()
 
-        student_id = self._get_student_id(df.iloc[0])
-        student_class = self._get_student_class(student_id)
+        result_df = self._calculate_students(df, semester_filter, calc_mode)
+        if result_df.empty:
+            return None
+        return result_df.iloc[0].to_dict()
 
-        df['_学号'] = student_id
+    # ============ 分阶段计算（向量化） ============
+    # 阶段：读取 → 规范学号 → 成绩换算 → 重复课程处理 → 课程分类 → 学期筛选 → 选修课折算 → 加权汇总 → 排名 → 导出
+    # 下面每个 _xxx 方法是一个阶段的纯计算；stage_xxx 方法按输入键缓存阶段产物，输入不变时直接复用。
+    def _normalize_keys(self, df):
+        """规范学号/姓名，删除无学号记录，并记录原始行序"""
+        df = df.copy()
+        df['_学号'] = self.student_ids(df)
         df['_姓名'] = df[self.column_mapping.get('姓名')].astype(str).str.strip()
+        df = df.dropna(subset=['_学号']).reset_index(drop=True)
+        df['_学号'] = df['_学号'].astype(str)
+        df['_序号'] = np.arange(len(df))
+        return df
 
-        df['_计算成绩'] = df.apply(self._convert_score, axis=1)
-        df['_学分'] = df.apply(self._get_credit, axis=1)
+    def _score_rows(self, df):
+        """逐行成绩换算：计算成绩、学分、是否补考（全部记录，含无效成绩）"""
+        df = df.copy()
+        df['_计算成绩'] = self.convert_scores(df)
+        df['_学分'] = self.credits(df)
+        df['_是否补考'] = np.where(self._makeup_mask(df), '是（补考）', '否')
+        return df
 
+    def _resolve_rows(self, df):
+        """保留有效成绩（非空且大于0），并按规则处理重复课程"""
         df = df.dropna(subset=['_计算成绩'])
-        df = df[df['_计算成绩'] > 0]
-
-        if len(df) == 0:
-            return None
+        df = df[df['_计算成绩'] > 0].copy()
 
-        self._handle_duplicate_courses(df)
+        set_sixty, drop = self.resolve_duplicate_courses(df)
+        df.loc[set_sixty, '_计算成绩'] = 60.0
+        return df[~drop]
 
+    def _filter_semesters(self, df, semester_filter):
+        """学期筛选"""
         if semester_filter and '学年学期' in self.column_mapping:
             sem_col = self.column_mapping['学年学期']
             if isinstance(semester_filter, str):
                 semester_filter = [semester_filter]
             df = df[df[sem_col].isin(semester_filter)]
-            if len(df) == 0:
-                return None
+        return df
 
-        df['_课程类别'] = df.apply(self.classify_course, axis=1)
+    def _assign_classes(self, df):
+        """标注班级类型（卓越/普通）"""
+        df = df.copy()
+        df['_班级类型'] = np.where(df['_学号'].isin(list(self.excellent_students)), '卓越', '普通')
+        return df
 
+    def _select_rows(self, df, calc_mode):
+        """保研模式做选修课择优折算；综测模式全部计入，只按学号排好顺序"""
         if calc_mode == '保研':
-            credit_requirements = self._get_credit_requirements(student_class)
-            processed_list = []
+            return self._select_elective_credits(df)
+        return df.sort_values(['_学号', '_序号'], kind='mergesort')
+
+    def _aggregate(self, df, calc_mode):
+        """加权平均：返回按学号排序、未排名的结果表"""
+        # 此时各学生的课程行已连续排列；逐学生切片用 ndarray.sum 求和，
+        # 浮点累加顺序与逐个学生计算时完全一致（5位有效数字的进位不会因求和方式改变）
+        student_ids = df['_学号'].to_numpy()
+        names = df['_姓名'].to_numpy()
+        classes = df['_班级类型'].to_numpy()
+        credits = df['_学分'].to_numpy(dtype=float)
+        weighted = df['_计算成绩'].to_numpy(dtype=float) * credits
+        starts = np.flatnonzero(np.r_[True, student_ids[1:] != student_ids[:-1]])
+        ends = np.r_[starts[1:], len(df)]
+
+        results = []
+        for start, end in zip(starts, ends):
+            total_credits = credits[start:end].sum()
+            if total_credits == 0:
+                continue
+            total_weighted = weighted[start:end].sum()
+            results.append({
+                '学号': student_ids[start],
+                '姓名': names[start],
+                '班级类型': classes[start],
+                '平均成绩': self.format_significant_digits(total_weighted / total_credits, 5),
+                '总学分': self.format_significant_digits(total_credits, 5),
+                '课程门数': int(end - start),
+                '计算模式': calc_mode
+            })
+        return pd.DataFrame(results)
+
+    def _rank(self, result_df):
+        """统一排名 + 班级内排名"""
+        if not result_df.empty:
+            result_df = result_df.sort_values('平均成绩', ascending=False).reset_index(drop=True)
+            result_df['排名'] = result_df['平均成绩'].rank(method='min', ascending=False).astype(int)
+            cols = ['排名'] + [col for col in result_df.columns if col != '排名']
+            result_df = result_df[cols]
+            result_df['班级内排名'] = result_df.groupby('班级类型')['平均成绩'] \
+                .rank(method='min', ascending=False) \
+                .astype(int)
+        return result_df
 
-            for course_type, group in df.groupby('_课程类别'):
-                if course_type in credit_requirements:
-                    required_credits = credit_requirements[course_type]
+    def _calculate_students(self, df_calc, semester_filter=None, calc_mode='保研'):
+        """
+        对已带 _学号/_姓名 的成绩表依次执行各计算阶段（不缓存），返回按学号排序、未排名的结果表。
+        """
+        df = df_calc.copy()
+        df['_序号'] = np.arange(len(df))
+        df = self._resolve_rows(self._score_rows(df))
+        df = self._filter_semesters(df, semester_filter)
 
-                    if required_credits <= 0:
-                        continue
+        if len(df) == 0:
+            return pd.DataFrame([])
+
+        df['_课程类别'] = self.classify_courses(df)
+        df = self._select_rows(self._assign_classes(df), calc_mode)
+        return self._aggregate(df, calc_mode)
+
+    # ============ 阶段产物缓存 ============
+    STAGE_LABELS = {
+        'normalized': '规范学号',
+        'scored': '成绩换算',
+        'resolved': '重复课程处理',
+        'categories': '课程分类',
+        'classified': '班级标注',
+        'aggregated': '选修课折算与加权汇总',
+        'detail_rows': '明细数据准备',
+        'rank_index': '排名索引',
+        'student_positions': '学生记录索引'
+    }
+
+    def _timed(self, name, build, rows=None):
+        """计时执行一个阶段（计入 self.timings）"""
+        with self.timings.stage(name, rows):
+            return build()
+
+    def _stage(self, name, key, build, keep=1):
+        """按输入键缓存阶段产物：键命中则直接复用，否则重新计算；每个阶段最多保留 keep 份产物"""
+        entries = self._stage_cache.setdefault(name, OrderedDict())
+        if key in entries:
+            entries.move_to_end(key)
+            # 复用缓存只记一次（后续阶段取用前面阶段的产物时不重复记录）
+            label = self.STAGE_LABELS.get(name, name)
+            if not self.timings.has_stage(label):
+                self.timings.record(label, 0.0, len(entries[key]), cached=True)
+            return entries[key]
+        artifact = build()
+        entries[key] = artifact
+        while len(entries) > keep:
+            entries.popitem(last=False)
+        return artifact
+
+    def dataset_key(self):
+        """当前数据表的内容指纹（对同一个DataFrame对象只计算一次）"""
+        if self._dataset_key_df is not self.df:
+            row_hashes = pd.util.hash_pandas_object(self.df, index=True).to_numpy()
+            digest = hashlib.sha1(row_hashes.tobytes())
+            digest.update(repr(list(self.df.columns)).encode('utf-8'))
+            self._dataset_key = digest.hexdigest()
+            self._dataset_key_df = self.df
+        return self._dataset_key
+
+    def _rows_key(self):
+        """逐行阶段的输入键：数据内容 + 列映射"""
+        return self.dataset_key(), tuple(sorted(self.column_mapping.items()))
+
+    def _major_key(self):
+        """与专业相关阶段的输入键：专业配置 + 卓越班名单 + 两类班级的学分要求"""
+        requirements = {cls: self._get_credit_requirements(cls) for cls in ('卓越', '普通')}
+        return (
+            self.major_fingerprint(),
+            tuple(sorted(str(sid) for sid in self.excellent_students)),
+            json.dumps(requirements, sort_keys=True, ensure_ascii=False)
+        )
 
-                    group = group.sort_values('_计算成绩', ascending=False)
-
-                    selected_courses = []
-                    total_credits = 0
-
-                    for _, row in group.iterrows():
-                        if total_credits < required_credits:
-                            credit = row['_学分']
-
-                            if total_credits + credit <= required_credits:
-                                selected_courses.append(row)
-                                total_credits += credit
-                            else:
-                                remaining = required_credits - total_credits
-                                new_row = row.copy()
-                                new_row['_学分'] = remaining
-                                selected_courses.append(new_row)
-                                total_credits = required_credits
-                                break
-                        else:
-                            break
+    def stage_normalized(self):
+        """阶段：规范学号（全部有学号的记录）"""
+        return self._stage('normalized', self._rows_key(),
+                           lambda: self._timed('规范学号', lambda: self._normalize_keys(self.df), len(self.df)))
+
+    def stage_scored(self):
+        """阶段：成绩换算（全部记录）"""
+        def build():
+            df = self.stage_normalized()
+            return self._timed('成绩换算', lambda: self._score_rows(df), len(df))
+        return self._stage('scored', self._rows_key(), build)
+
+    def stage_resolved(self):
+        """阶段：重复课程处理（仅有效成绩）"""
+        def build():
+            df = self.stage_scored()
+            return self._timed('重复课程处理', lambda: self._resolve_rows(df), len(df))
+        return self._stage('resolved', self._rows_key(), build)
+
+    def stage_categories(self):
+        """阶段：课程分类（全部记录的课程类别，索引与 stage_scored 一致）"""
+        key = (self._rows_key(), self._major_key())
+        def build():
+            df = self.stage_scored()
+            return self._timed('课程分类', lambda: self.classify_courses(df), len(df))
+        return self._stage('categories', key, build, keep=4)
+
+    def stage_classified(self):
+        """阶段：有效成绩 + 课程类别 + 班级类型"""
+        def build():
+            df = self.stage_resolved().copy()
+            categories = self.stage_categories()
+            with self.timings.stage('班级标注', len(df)):
+                df['_课程类别'] = categories.loc[df.index]
+                return self._assign_classes(df)
+        return self._stage('classified', (self._rows_key(), self._major_key()), build, keep=2)
+
+    def stage_aggregated(self, semester_filter=None, calc_mode='保研'):
+        """
+        阶段：学期筛选 → 选修课折算 → 加权汇总。
+        只依赖已换算、已分类的逐行数据，切换模式或学期时只重做这一步；最近用过的组合直接复用。
+        """
+        semesters = tuple(semester_filter) if isinstance(semester_filter, (list, tuple)) else semester_filter
+        key = (self._rows_key(), self._major_key(), semesters, calc_mode)
 
-                    if selected_courses:
-                        processed_list.append(pd.DataFrame(selected_courses))
-                else:
-                    processed_list.append(group)
+        def build():
+            df = self._filter_semesters(self.stage_classified(), semester_filter)
+            if len(df) == 0:
+                return pd.DataFrame([])
+            df = self._timed('选修课折算' if calc_mode == '保研' else '课程排序', lambda: self._select_rows(df, calc_mode),
+                             len(df))
+            return self._timed('加权汇总', lambda: self._aggregate(df, calc_mode), len(df))
+        return self._stage('aggregated', key, build, keep=32)
+
+    def stage_detail_rows(self):
+        """阶段：明细用的逐行数据（全部有学号的记录 + 换算结果 + 课程类别）"""
+        def build():
+            df = self.stage_scored().copy()
+            categories = self.stage_categories()
+            with self.timings.stage('明细数据准备', len(df)):
+                df['_课程类别'] = categories
+            return df
+        return self._stage('detail_rows', (self._rows_key(), self._major_key()), build)
+
+    # ============ 计算所有学生（分阶段、可复用） ============
+    def calculate_all_students(self, semester_filter=None, calc_mode='保研'):
+        """计算所有学生 - 统一排名"""
+        all_students = self.stage_normalized()['_学号'].unique()
+        excellent_students = {str(sid) for sid in self.excellent_students}
+        excellent_count = sum(1 for sid in all_students if sid in excellent_students)
+        normal_count = len(all_students) - excellent_count
+
+        aggregated = self.stage_aggregated(semester_filter, calc_mode)
+        result_df = self._timed('排名', lambda: self._rank(aggregated.copy()), len(aggregated))
+        return result_df, excellent_count, normal_count
+
+    def export_results(self, summary_target, semester_filter=None, calc_mode='保研',
+                       zip_target=None, workers=1):
+        """
+        一次完成各计算阶段，再让汇总工作簿和明细压缩包两个导出阶段并发进行。
+        返回 (result_df, 卓越人数, 普通人数, 明细结果)；不生成明细时明细结果为None。
+        本次各阶段用时记录在 self.timings 中（保留文件读取记录）。
+        """
+        self.timings.reset()
+        self.calc_mode = calc_mode
+        if self.excellent_students:
+            self.excellent_students = {str(sid) for sid in self.excellent_students}
+
+        if zip_target is None:
+            return (*self.export_to_excel(summary_target, semester_filter, calc_mode), None)
 
-            if processed_list:
-                df = pd.concat(processed_list, ignore_index=True)
+        # 先在当前线程算好排名和明细用的逐行数据：汇总线程直接用算好的排名，明细线程只读取缓存，
+        # 各阶段在 self.timings 中只记录一次
+        ranked = self.calculate_all_students(semester_filter, calc_mode)
+        self.stage_detail_rows()
 
-        total_weighted = (df['_计算成绩'] * df['_学分']).sum()
-        total_credits = df['_学分'].sum()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            summary = executor.submit(self.export_to_excel, summary_target, semester_filter, calc_mode, ranked)
+            details = executor.submit(self.export_student_details_zip, zip_target, workers)
+            result_df, excellent_count, normal_count = summary.result()
+            detail_result = details.result()
+
+        return result_df, excellent_count, normal_count, detail_result
+
+    def _select_elective_credits(self, df):
+        """
+        保研模式选修课择优折算（全体学生一次完成）：
+        按（学号, 课程类别, 成绩降序）排序后，用组内累计学分判断每门课全部计入、部分计入或不计入。
+        返回参与计算的课程行，顺序与逐个学生计算时一致。
+        """
+        is_elective = pd.Series(False, index=df.index)
+        required = pd.Series(0.0, index=df.index)
+        for student_class in ('卓越', '普通'):
+            credit_requirements = self._get_credit_requirements(student_class)
+            rows = df['_班级类型'] == student_class
+            categories = df.loc[rows, '_课程类别']
+            is_elective[rows] = categories.isin(list(credit_requirements))
+            required[rows] = categories.map(credit_requirements).astype(float).fillna(0.0)
 
-        if total_credits == 0:
-            return None
+        # 学生的课程全部属于“要求学分为0”的选修类别时，不做折算、全部计入
+        excluded = is_elective & (required <= 0)
+        keep_all = excluded.groupby(df['_学号']).transform('all')
 
-        avg_score = total_weighted / total_credits
+        df = df.copy()
+        df['_选修'] = is_elective & ~keep_all
+        df['_要求学分'] = required
+        df = df[~(excluded & ~keep_all)]
+
+        # 选修课按成绩降序，必修课及不折算的学生保持原顺序
+        df['_排序类别'] = df['_课程类别'].where(~keep_all.loc[df.index], '')
+        df['_排序成绩'] = np.where(df['_选修'], -df['_计算成绩'], 0.0)
+        df = df.sort_values(['_学号', '_排序类别', '_排序成绩', '_序号'], kind='mergesort')
+
+        elective = df[df['_选修']]
+        group_keys = [elective['_学号'], elective['_课程类别']]
+        cum = elective['_学分'].groupby(group_keys).cumsum()
+        prev = cum.groupby(group_keys).shift(1, fill_value=0.0)
+        prev_max = cum.groupby(group_keys).cummax().groupby(group_keys).shift(1, fill_value=0.0)
+
+        counted = prev_max < elective['_要求学分']
+        partial = counted & (cum > elective['_要求学分'])
+        credits = elective['_学分'].where(~partial, elective['_要求学分'] - prev)
+
+        df.loc[elective.index, '_学分'] = credits
+        drop = elective.index[~counted]
+        return df.drop(index=drop)
+
+    # ============ 假设成绩模拟（只重算一位学生） ============
+    def rank_index(self, semester_filter=None, calc_mode='保研'):
+        """上次全量计算结果的排名索引（与 stage_aggregated 同键缓存，输入不变时不重建）"""
+        semesters = tuple(semester_filter) if isinstance(semester_filter, (list, tuple)) else semester_filter
+        key = (self._rows_key(), self._major_key(), semesters, calc_mode)
+        return self._stage('rank_index', key,
+                           lambda: RankIndex(self.stage_aggregated(semester_filter, calc_mode)), keep=32)
+
+    def _student_positions(self):
+        """stage_detail_rows 中每位学生的行位置 {学号: 位置数组}，查找单个学生的记录不必扫描全表"""
+        return self._stage('student_positions', (self._rows_key(), self._major_key()),
+                           lambda: self.stage_detail_rows().groupby('_学号', sort=False).indices)
+
+    def student_courses(self, student_id):
+        """学生修过的全部课程名称（含未计入的记录，去重并保持原顺序），供选择要模拟的课程"""
+        positions = self._student_positions().get(str(student_id))
+        if positions is None:
+            return []
+        names = self._text_column(self.stage_detail_rows().iloc[positions], '课程名称')
+        return [name for name in dict.fromkeys(names.str.strip()) if name]
+
+    def _hypothetical_score(self, value, exam_type=''):
+        """按正常的成绩换算规则（等级制、补考成绩≥60记60等）换算一个假设成绩，无法识别时为 NaN"""
+        frame = pd.DataFrame({col: [None] for col in self.column_mapping.values()}, dtype=object)
+        frame[self.column_mapping['总成绩']] = [value]
+        if '取得方式' in self.column_mapping:
+            frame[self.column_mapping['取得方式']] = [exam_type]
+        return float(self.convert_scores(frame).iloc[0])
 
+    def simulate_student(self, student_id, changes, semester_filter=None, calc_mode='保研'):
+        """
+        假设成绩模拟。changes 为 [{'课程名称' 或 '课程编号', '总成绩', '学分'(新课程必填), '取得方式'(可选)}]：
+        已修课程（含旷考等未计入的记录）按课程名称或课程编号匹配后改为假设成绩，匹配不到的作为新课程加入。
+        只对该学生重做选修课折算和加权平均，再在上次全量结果的排名索引中二分查找新名次，其余学生不重新计算。
+        返回模拟前后的平均成绩、排名，以及模拟后计入的课程
+        """
+        student_id = str(student_id)
+        index = self.rank_index(semester_filter, calc_mode)
+        positions = self._student_positions().get(student_id)
+        if positions is None:
+            raise KeyError(f"未找到学生: {student_id}")
+        records = self.stage_detail_rows().iloc[positions]
+        classified = self.stage_classified()
+        counted = classified.index.get_indexer(records.index)
+        rows = classified.iloc[counted[counted >= 0]].copy()
+        rows['_假设'] = False
+        # 未计入的记录（旷考、0分、被补考覆盖的初修等）也可以假设一个新成绩
+        candidates = records[counted < 0]
+        student = {'_姓名': records['_姓名'].iloc[0],
+                   '_班级类型': '卓越' if student_id in self.excellent_students else '普通'}
+
+        added = []
+        for change in changes:
+            name = str(change.get('课程名称') or '').strip()
+            code = str(change.get('课程编号') or '').strip()
+            if not name and not code:
+                raise ValueError("假设成绩需给出课程名称或课程编号")
+            credit = change.get('学分')
+            credit = None if credit in (None, '') else float(credit)
+
+            field, value = ('课程名称', name) if name else ('课程编号', code)
+            in_rows = self._text_column(rows, field) == value
+            in_candidates = self._text_column(candidates, field) == value
+            if in_rows.any() or in_candidates.any():
+                # 同一门课有多条记录（初修+补考等）时只保留一条（优先已计入的），改为假设成绩
+                source, matched = (rows, in_rows) if in_rows.any() else (candidates, in_candidates)
+                first = source.loc[matched.idxmax()].copy()
+                exam_type = change.get('取得方式') or self._text_column(first.to_frame().T, '取得方式').iloc[0]
+                rows, candidates = rows[~in_rows], candidates[~in_candidates]
+            else:
+                if credit is None:
+                    raise ValueError(f"新课程「{name or code}」需给出学分")
+                first = pd.Series({'_学号': student_id, '_姓名': student['_姓名'], '_序号': np.inf})
+                for field, value in (('课程名称', name), ('课程编号', code)):
+                    if field in self.column_mapping:
+                        first[self.column_mapping[field]] = value
+                first['_课程类别'] = self.classify_courses(first.to_frame().T).iloc[0]
+                exam_type = change.get('取得方式') or ''
+
+            score = self._hypothetical_score(change.get('总成绩'), str(exam_type))
+            if np.isnan(score):
+                raise ValueError(f"无法识别的成绩: {change.get('总成绩')}")
+            first['_计算成绩'] = score
+            first['_学分'] = credit if credit is not None else float(first['_学分'])
+            first['_班级类型'] = student['_班级类型']
+            first['_假设'] = True
+            added.append(first)
+
+        # 学期筛选只作用于原有记录，新加的课程总是计入
+        rows = self._filter_semesters(rows, semester_filter)
+        new_rows = pd.DataFrame(added).reindex(columns=rows.columns) if added else rows.iloc[:0]
+        known = new_rows['_序号'].astype(float) < np.inf
+        new_rows = pd.concat([self._filter_semesters(new_rows[known], semester_filter), new_rows[~known]])
+        rows = pd.concat([rows, new_rows], ignore_index=True)
+        rows['_序号'] = rows['_序号'].astype(float).rank(method='first').astype(int)
+        rows['_假设'] = rows['_假设'].astype(bool)
+        rows = rows[rows['_计算成绩'].astype(float) > 0]
+
+        previous = index.averages.get(student_id, (None,))[0]
+        previous = float(previous) if previous is not None else None
+        before = index.rank(student_id, previous, student['_班级类型']) if previous is not None \
+            else (None, None, len(index))
+        selected = self._select_rows(rows, calc_mode) if len(rows) else rows
+        result = self._aggregate(selected, calc_mode) if len(selected) else pd.DataFrame([])
+        average = float(result.iloc[0]['平均成绩']) if not result.empty else None
+        after = index.rank(student_id, average, student['_班级类型']) if average is not None \
+            else (None, None, len(index))
+
+        courses = pd.DataFrame({
+            '课程名称': self._text_column(selected, '课程名称'),
+            '课程类别': selected['_课程类别'].astype(object),
+            '计入学分': selected['_学分'].astype(float),
+            '计算成绩': selected['_计算成绩'].astype(float),
+            '假设成绩': selected['_假设'].astype(bool)
+        })
         return {
             '学号': student_id,
-            '姓名': df.iloc[0]['_姓名'],
-            '班级类型': student_class,
-            '平均成绩': self.format_significant_digits(avg_score, 5),
-            '总学分': self.format_significant_digits(total_credits, 5),
-            '课程门数': len(df),
-            '计算模式': calc_mode
+            '姓名': student['_姓名'],
+            '班级类型': student['_班级类型'],
+            '原平均成绩': previous,
+            '平均成绩': average,
+            '原排名': before[0],
+            '排名': after[0],
+            '原班级内排名': before[1],
+            '班级内排名': after[1],
+            '参与排名人数': after[2],
+            '总学分': float(result.iloc[0]['总学分']) if not result.empty else 0.0,
+            '课程': courses.to_dict('records')
         }
 
-    # ============ 计算所有学生（完全不变） ============
-    def calculate_all_students(self, semester_filter=None, calc_mode='保研'):
-        """计算所有学生 - 统一排名"""
-        df_calc = self.df.copy()
-        df_calc['_学号'] = df_calc.apply(self._get_student_id, axis=1)
-        df_calc['_姓名'] = df_calc[self.column_mapping.get('姓名')].astype(str).str.strip()
-        df_calc = df_calc.dropna(subset=['_学号'])
+    # ============ 追加新学期成绩（增量计算） ============
+    # 抽查核对的学生数（verify='sample'）
+    APPEND_CHECK_STUDENTS = 20
 
-        all_students = df_calc['_学号'].unique()
-        excellent_count = sum(1 for sid in all_students if sid in self.excellent_students)
-        normal_count = len(all_students) - excellent_count
+    def append_records(self, df, column_mapping=None, source=None, verify='sample'):
+        """
+        在已计算过的数据上追加一批成绩记录（如新学期的导出表），按增量更新各阶段产物，结果与整表重新计算一致：
+        只对新记录做规范学号、成绩换算和课程分类；重复课程只重新处理新记录涉及的（学号, 课程）组；
+        选修课折算和加权汇总只对这些学生重做，其余学生沿用上次的汇总行（排名仍按全体重排）。
+        column_mapping 为 df 的列映射（默认与当前数据表相同）；source 为来源文件名（数据表有来源文件列时填入）。
+        verify 为增量结果的核对方式，不一致则丢弃增量产物，之后按整表重新计算：
+        'sample'（默认）从成绩有变化的学生中均匀抽取 APPEND_CHECK_STUDENTS 人，只用这些人的原始记录重新计算后比对；
+        True 与不使用缓存的整表重新计算逐项核对（耗时超过整表计算，用于测试）；False 不核对。
+        核对结果记在 self.append_verified。返回成绩有变化的学号列表
+        """
+        mapping = column_mapping or self.column_mapping
+        old_key, major_key = self._rows_key(), self._major_key()
+        old = {name: getattr(self, f'stage_{name}')()
+               for name in ('normalized', 'scored', 'categories', 'resolved', 'classified')}
+        # 上次算过的各个（学期筛选, 计算模式）组合的汇总结果
+        aggregated = {key[2:]: result for key, result in self._stage_cache.get('aggregated', {}).items()
+                      if key[:2] == (old_key, major_key)}
+
+        frame = pd.DataFrame({self.column_mapping[field]: df[col] for field, col in mapping.items()
+                              if field in self.column_mapping}, index=df.index)
+        if self.SOURCE_COLUMN in self.df.columns:
+            frame[self.SOURCE_COLUMN] = source if source is not None else df.get(self.SOURCE_COLUMN)
+        start = len(self.df)
+        self.df = pd.concat([self.df, frame.reindex(columns=self.df.columns)], ignore_index=True)
+        if self.memory_usage is not None:
+            self.compact()
+
+        with self.timings.stage('追加记录', len(frame)):
+            # 新记录按整表计算时的行号和序号接在原有记录之后
+            offset = len(old['normalized'])
+            added = self._normalize_keys(self.df.iloc[start:])
+            added.index += offset
+            added['_序号'] += offset
+            added = self._score_rows(added)
+            scored = pd.concat([old['scored'], added])
+            categories = pd.concat([old['categories'], self.classify_courses(added)])
+
+            # 受影响的重复课程组：新的有效记录所在的（学号, 课程）组，连同组内原有记录一起重新处理
+            valid = added[added['_计算成绩'] > 0]
+            changed = pd.unique(valid['_学号'])
+            rows = scored[scored['_学号'].isin(changed) & (scored['_计算成绩'] > 0)]
+            new_keys = self._course_keys(valid)
+            if new_keys is None:
+                affected = rows.index >= offset
+            else:
+                # 先按课程列的取值粗筛（分类列上很快），只对可能同组的记录拼接课程标识
+                course_col = self.column_mapping.get('课程名称') or self.column_mapping['课程编号']
+                rows = rows[rows[course_col].isin(pd.unique(valid[course_col]))]
+                groups = rows['_学号'] + '\x00' + self._course_keys(rows)
+                affected = groups.isin(set(valid['_学号'] + '\x00' + new_keys)).to_numpy()
+            regrouped = rows[affected]
+            rows = self._assign_classes(self._resolve_rows(regrouped))
+            rows['_课程类别'] = categories.loc[rows.index]
+            rows = rows[old['classified'].columns]
+
+            # 受影响组的原有记录换成重新处理后的记录，其余记录保持不变，仍按整表的行顺序排列
+            replaced = regrouped.index[regrouped.index < offset]
+            resolved = self._merge_rows(old['resolved'], rows[old['resolved'].columns], replaced)
+            classified = self._merge_rows(old['classified'], rows, replaced)
+
+            # 只重做成绩有变化的学生，其余学生的汇总行不变；汇总表按学号排列，与整表计算的顺序相同
+            updated = {}
+            student_rows = classified[classified['_学号'].isin(changed)]
+            for (semesters, calc_mode), result in aggregated.items():
+                part = self._filter_semesters(student_rows, semesters)
+                part = self._aggregate(self._select_rows(part, calc_mode), calc_mode) if len(part) else pd.DataFrame([])
+                kept = result[~result['学号'].isin(changed)] if not result.empty else result
+                frames = [frame for frame in (kept, part) if not frame.empty]
+                updated[(semesters, calc_mode)] = pd.concat(frames).sort_values('学号', kind='mergesort') \
+                    .reset_index(drop=True) if frames else pd.DataFrame([])
+
+        normalized = pd.concat([old['normalized'], added[old['normalized'].columns]])
+        new_key = self._rows_key()
+        for name, key, artifact, keep in (
+                ('normalized', new_key, normalized, 1),
+                ('scored', new_key, scored, 1),
+                ('resolved', new_key, resolved, 1),
+                ('categories', (new_key, major_key), categories, 4),
+                ('classified', (new_key, major_key), classified, 2)):
+            self._stage(name, key, lambda artifact=artifact: artifact, keep)
+        for (semesters, calc_mode), result in updated.items():
+            self._stage('aggregated', (new_key, major_key, semesters, calc_mode), lambda result=result: result, keep=32)
+
+        self.append_verified = None
+        if verify:
+            students = None
+            if verify == 'sample':
+                picks = np.linspace(0, len(changed) - 1, min(len(changed), self.APPEND_CHECK_STUDENTS)).astype(int)
+                students = [str(student_id) for student_id in np.sort(changed)[np.unique(picks)]]
+            problems = [problem for semesters, calc_mode in (updated or {(None, '保研'): None})
+                        for problem in self.check_consistency(semesters, calc_mode, students)]
+            self.append_verified = not problems
+            if problems:
+                # 增量结果与整表计算不一致：丢弃这份数据的全部阶段产物，之后按整表重新计算
+                for entries in self._stage_cache.values():
+                    for key in [key for key in entries if new_key in (key, key[0])]:
+                        del entries[key]
+                self.reporter.error("⚠️ 增量计算结果与整表重新计算不一致，已改为整表重新计算：" + "；".join(problems[:3]))
+        return [str(student_id) for student_id in changed]
+
+    @staticmethod
+    def _merge_rows(previous, rows, replaced):
+        """previous 中去掉 replaced 行后并入 rows，按行号排列（只有重新处理了原有记录时才需要重新排序）"""
+        if len(replaced):
+            previous = previous.drop(index=previous.index.intersection(replaced))
+        merged = pd.concat([previous, rows])
+        return merged if merged.index.is_monotonic_increasing else merged.sort_index(kind='mergesort')
+
+    def check_consistency(self, semester_filter=None, calc_mode='保研', student_ids=None):
+        """
+        一致性核对：阶段缓存给出的排名结果与不使用任何缓存、从原始记录整表重新计算的结果逐项比较。
+        给出 student_ids 时只核对这些学生：只用他们的原始记录重新计算，与缓存中他们的汇总行比较（不含排名）。
+        返回不一致之处的说明列表，为空表示完全一致
+        """
+        if student_ids is None:
+            cached = self._rank(self.stage_aggregated(semester_filter, calc_mode).copy())
+            fresh = self._rank(self._calculate_students(self._normalize_keys(self.df), semester_filter, calc_mode))
+        else:
+            students = set(student_ids)
+            rows = self.df[self.student_ids(self.df).isin(students).to_numpy()]
+            fresh = self._calculate_students(self._normalize_keys(rows), semester_filter, calc_mode)
+            cached = self.stage_aggregated(semester_filter, calc_mode)
+            if not cached.empty:
+                cached = cached[cached['学号'].isin(students)]
+            if cached.empty and fresh.empty:
+                return []
+            cached, fresh = cached.reset_index(drop=True), fresh.reset_index(drop=True)
+        try:
+            pd.testing.assert_frame_equal(cached, fresh, check_exact=True)
+        except AssertionError as e:
+            label = f"{calc_mode}（学期：{semester_filter or '全部'}）"
+            return [f"{label} {str(e).strip().splitlines()[0]}"]
+        return []
+
+    # ============ 多专业批量计算 ============
+    def for_major(self, major_code):
+        """返回切换到指定专业的计算器副本（共享数据与逐行阶段缓存，不输出界面信息）；专业不存在时返回None"""
+        config = self.major_config.get_major(major_code)
+        if not config:
+            return None
+        view = copy.copy(self)
+        view.current_major = config
+        view.major_name = config['专业名称']
+        view.has_excellent_class = config['有卓越班']
+        view.excellent_students = {str(sid) for sid in config.get('卓越班级学号集', {})} if config['有卓越班'] else {}
+        view._course_classifier = None
+        view._course_classifier_key = None
+        return view
+
+    def assign_majors_by_prefix(self, rules):
+        """按学号前缀分配专业：rules 为 {学号前缀: 专业代码}，多个前缀都匹配时取最长的"""
+        ordered = sorted(rules.items(), key=lambda item: -len(item[0]))
+        assignment = {}
+        for student_id in self.stage_normalized()['_学号'].unique():
+            for prefix, major_code in ordered:
+                if student_id.startswith(prefix):
+                    assignment[student_id] = major_code
+                    break
+        return assignment
 
-        results = []
-        for student_id, student_df in df_calc.groupby('_学号'):
-            res = self.calculate_student_gpa(student_df, semester_filter, calc_mode)
-            if res:
-                results.append(res)
+    def assign_majors_by_roster(self, roster_df):
+        """按名单分配专业：名单需含学号列和专业列（专业代码或专业名称）"""
+        id_col = next((col for col in roster_df.columns if '学号' in str(col)), None)
+        major_col = next((col for col in roster_df.columns if '专业' in str(col)), None)
+        if id_col is None or major_col is None:
+            return {}
 
-        result_df = pd.DataFrame(results)
+        # 学号按成绩表同样的规则规范（整数型浮点去掉小数部分）
+        roster = pd.DataFrame({self.column_mapping.get('学号', '学号'): roster_df[id_col].to_numpy()})
+        student_ids = self.student_ids(roster)
+        codes = {value: self.major_config.resolve_major_code(value) for value in pd.unique(roster_df[major_col])}
+        return {sid: codes[value] for sid, value in zip(student_ids, roster_df[major_col])
+                if pd.notna(sid) and codes.get(value)}
 
-        if not result_df.empty:
-            result_df = result_df.sort_values('平均成绩', ascending=False).reset_index(drop=True)
-            result_df['排名'] = result_df['平均成绩'].rank(method='min', ascending=False).astype(int)
-            cols = ['排名'] + [col for col in result_df.columns if col != '排名']
-            result_df = result_df[cols]
-            result_df['班级内排名'] = result_df.groupby('班级类型')['平均成绩'] \
-                .rank(method='min', ascending=False) \
-                .astype(int)
+    def assign_majors_by_column(self, column=None, value_map=None):
+        """
+        按成绩表中的专业列分配：每位学生取该列出现次数最多的值。
+        value_map 为 {列中取值: 专业代码}，未给出的取值按专业代码/专业名称识别。
+        """
+        column = column or self.column_mapping.get('专业')
+        df = self.stage_normalized()
+        if column not in df.columns:
+            return {}
+        # 分类列的 value_counts 会带上未出现的取值，出现次数相同时的先后也不同，先转回普通列
+        values = df[[column, '_学号']].dropna().astype({column: object})
+        if values.empty:
+            return {}
+        most_common = values.groupby('_学号')[column].agg(lambda col: col.value_counts().index[0])
+        value_map = value_map or {}
+        codes = {value: value_map[value] if value in value_map else self.major_config.resolve_major_code(value)
+                 for value in pd.unique(most_common)}
+        return {sid: codes[value] for sid, value in most_common.items() if codes[value]}
 
-        return result_df, excellent_count, normal_count
+    def calculate_batch(self, assignment, semester_filter=None, calc_mode='保研'):
+        """
+        多专业一次计算：assignment 为 {学号: 专业代码}。
+        成绩换算和重复课程处理对全表只做一次，之后按专业分组完成课程分类、选修课折算、汇总和排名。
+        返回 ({专业代码: (result_df, 卓越人数, 普通人数)}, 未分配专业的学号列表)。
+        """
+        normalized = self.stage_normalized()
+        resolved = self.stage_resolved()
+        student_major = normalized['_学号'].map(assignment)
+        row_major = resolved['_学号'].map(assignment)
+        unassigned = sorted(normalized.loc[student_major.isna(), '_学号'].unique())
+
+        results = OrderedDict()
+        for major_code in pd.unique(student_major.dropna()):
+            view = self.for_major(major_code)
+            if view is None:
+                unassigned.extend(sorted(normalized.loc[student_major == major_code, '_学号'].unique()))
+                continue
+
+            all_students = normalized.loc[student_major == major_code, '_学号'].unique()
+            excellent_students = {str(sid) for sid in view.excellent_students}
+            excellent_count = sum(1 for sid in all_students if sid in excellent_students)
+            normal_count = len(all_students) - excellent_count
+
+            df = view._filter_semesters(resolved[row_major == major_code], semester_filter)
+            if len(df) == 0:
+                result_df = pd.DataFrame([])
+            else:
+                df = df.copy()
+                df['_课程类别'] = view.classify_courses(df)
+                df = view._select_rows(view._assign_classes(df), calc_mode)
+                result_df = view._rank(view._aggregate(df, calc_mode))
+            results[major_code] = (result_df, excellent_count, normal_count)
+
+        return results, unassigned
+
+    def export_batch_to_excel(self, output_buffer, batch_results, unassigned=(), semester_filter=None,
+                              calc_mode='保研'):
+        """多专业批量结果导出：每个专业一个工作表，另附批量计算配置表"""
+        overview = []
+        with ExcelStreamWriter(output_buffer) as writer:
+            for major_code, (result_df, excellent_count, normal_count) in batch_results.items():
+                major_name = self.major_config.get_major(major_code)['专业名称']
+                # 工作表名不能含 []:*?/\ 且不超过31个字符
+                sheet_name = re.sub(r'[\[\]:*?/\\]', '_', major_name)[:31]
+                writer.write_frame(sheet_name, result_df)
+                overview.append({
+                    '专业': major_name,
+                    '专业代码': major_code,
+                    '人数': len(result_df),
+                    '卓越班级人数': excellent_count,
+                    '普通班级人数': normal_count,
+                    '平均分': self.format_significant_digits(result_df['平均成绩'].mean(), 5) if not result_df.empty else None
+                })
+
+            writer.write_frame('批量计算配置', pd.DataFrame(overview), extra_rows=[
+                [],
+                ['学期筛选', str(semester_filter)],
+                ['计算模式', calc_mode],
+                ['未分配专业的学生', len(unassigned)],
+                ['计算时间', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
+            ])
 
     # ============ 生成学生明细（带完整错误输出） ============
     # ============ 生成学生明细（静默版） ============
-    def export_student_calculation_details(self, output_dir):
-        """为每个学生生成单独的成绩计算明细Excel文件"""
+    def export_student_calculation_details(self, output_dir, workers=1):
+        """为每个学生生成单独的成绩计算明细Excel文件（workers>1 时多进程并行生成）"""
         import os
 
         # === 确保输出目录存在 ===
@@ -937,57 +2551,181 @@ class StudentGradeCalculator:
             if not os.path.exists(output_dir):
                 os.makedirs(output_dir)
         except Exception as e:
+            self.reporter.error(f"❌ 无法创建明细输出目录 {output_dir}：{e}")
             return 0, 0, []
 
-        # 准备数据
-        df_calc = self.df.copy()
+        prepared = self._prepare_detail_groups()
+        if prepared is None:
+            return 0, 0, []
 
-        # 获取学号
-        df_calc['_学号'] = df_calc.apply(self._get_student_id, axis=1)
-        df_calc['_姓名'] = df_calc[self.column_mapping.get('姓名')].astype(str).str.strip()
+        student_count = 0
+        error_count = 0
+        detail_files = []
 
-        # 学号统计
-        total_with_id = df_calc['_学号'].notna().sum()
-        if total_with_id == 0:
-            return 0, 0, []
+        for file_name, content in self._iter_student_details(*prepared, workers=workers):
+            if file_name is None:
+                # 生成失败：content 为出错信息
+                self.reporter.error(content)
+                error_count += 1
+                continue
+            try:
+                file_path = os.path.join(output_dir, file_name)
+                with open(file_path, 'wb') as f:
+                    f.write(content)
+                student_count += 1
+                detail_files.append(file_path)
+            except Exception as e:
+                self.reporter.error(f"❌ 明细文件 {file_name} 写入失败：{e}")
+                error_count += 1
+
+        return student_count, error_count, detail_files
+
+    def export_student_details_zip(self, zip_target, workers=1, compression=zipfile.ZIP_STORED):
+        """
+        把每位学生的明细工作簿直接写入ZIP压缩包（不经过临时目录），返回 (成功数, 失败数, 文件名列表)。
+        zip_target 可以是路径或可写的二进制文件对象；xlsx本身已压缩，默认 ZIP_STORED 只打包不再压缩。
+        """
+        student_count = 0
+        error_count = 0
+        file_names = []
+
+        with zipfile.ZipFile(zip_target, 'w', compression) as zf:
+            prepared = self._prepare_detail_groups()
+            if prepared is None:
+                return 0, 0, []
+
+            with self.timings.stage('生成明细压缩包', len(prepared[0]), group='导出'):
+                for file_name, content in self._iter_student_details(*prepared, workers=workers):
+                    if file_name is None:
+                        # 生成失败：content 为出错信息
+                        self.reporter.error(content)
+                        error_count += 1
+                        continue
+                    zf.writestr(file_name, content)
+                    student_count += 1
+                    file_names.append(file_name)
 
-        # 删除无学号记录
-        df_calc = df_calc.dropna(subset=['_学号'])
-        df_calc['_学号'] = df_calc['_学号'].astype(str)
+        return student_count, error_count, file_names
+
+    def _prepare_detail_groups(self):
+        """明细生成前的数据准备：取流水线的逐行数据并按学号分组；没有任何学号时返回None"""
+        df_calc = self.stage_detail_rows()
+        if len(df_calc) == 0:
+            return None
 
         # 确保卓越班学号集也是字符串
         if self.excellent_students:
             self.excellent_students = {str(sid) for sid in self.excellent_students}
 
-        student_count = 0
-        error_count = 0
-        detail_files = []
-
         # 分组处理
-        grouped = df_calc.groupby('_学号')
+        return df_calc, df_calc.groupby('_学号')
 
-        for i, (student_id, student_df) in enumerate(grouped):
+    def render_student_detail(self, student_id):
+        """按学号即时生成单个学生的明细工作簿，返回 (文件名, 工作簿字节)；找不到该学生时返回None"""
+        prepared = self._prepare_detail_groups()
+        if prepared is None:
+            return None
+
+        df_calc, grouped = prepared
+        student_id = str(student_id)
+        if student_id not in grouped.indices:
+            return None
+
+        student_df = grouped.get_group(student_id)
+        student_name = student_df.iloc[0]['_姓名']
+        student_class = self._get_student_class(student_id)
+        return self._render_student_detail(student_id, student_name, student_class, student_df)
+
+    def major_fingerprint(self):
+        """当前专业配置的指纹（自定义培养方案修改后会变化），用作明细缓存键的一部分"""
+        payload = json.dumps(self.current_major, sort_keys=True, ensure_ascii=False, default=sorted)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _iter_student_details(self, df_calc, grouped, workers=1):
+        """
+        按学号顺序产出每位学生的 (文件名, 工作簿字节)，生成失败的学生产出 (None, 出错信息)。
+        workers>1 时按学号切成连续分片交给进程池，每个子进程只收到本分片的成绩行和专业配置，
+        结果按分片顺序产出，与逐个生成的顺序完全一致。
+        """
+        if not (workers and workers > 1 and grouped.ngroups > 1):
+            yield from self._render_detail_groups(grouped)
+            return
+
+        workers = min(workers, grouped.ngroups)
+        # 分片数取进程数的4倍，避免个别学生课程多导致负载不均
+        shard_count = min(grouped.ngroups, workers * 4)
+        positions = list(grouped.indices.values())
+        bounds = np.linspace(0, len(positions), shard_count + 1).astype(int)
+        shards = [
+            df_calc.iloc[np.concatenate(positions[start:end])]
+            for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+        ]
+
+        done = 0
+        try:
+            state = self._detail_worker_state()
+            worker = _importable(_render_detail_shard)
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [executor.submit(worker, state, shard) for shard in shards]
+                for future in futures:
+                    yield from future.result()
+                    done += 1
+            return
+        except (OSError, BrokenProcessPool) as e:
+            # 只有进程池不可用（如运行环境禁止创建子进程、子进程异常退出）时才退回逐个生成，
+            # 其余异常照常抛出；退回时提示一次，避免多进程配置静默失效
+            self.reporter.error(f"⚠️ 进程池不可用，剩余 {len(shards) - done} 个分片改为逐个生成：{e}")
+
+        for shard in shards[done:]:
+            yield from self._render_detail_groups(shard.groupby('_学号'))
+
+    def _render_detail_groups(self, grouped):
+        """逐个学生生成明细工作簿，产出 (文件名, 工作簿字节)，失败时产出 (None, 带学号的出错信息)"""
+        for student_id, student_df in grouped:
             try:
                 student_name = student_df.iloc[0]['_姓名']
                 student_class = self._get_student_class(student_id)
+                yield self._render_student_detail(student_id, student_name, student_class, student_df)
+            except Exception as e:
+                yield None, f"❌ 学生 {student_id} 明细生成失败：{e}"
 
-                detail_file = self._generate_student_detail_file(
-                    student_id, student_name, student_class,
-                    student_df, output_dir
-                )
+    def _detail_worker_state(self):
+        """子进程重建计算器所需的最小状态：列映射、计算模式和当前专业配置"""
+        return {
+            'column_mapping': dict(self.column_mapping),
+            'header_row': self.header_row,
+            'calc_mode': self.calc_mode,
+            'current_major': self.current_major,
+            'major_name': self.major_name,
+            'has_excellent_class': self.has_excellent_class,
+            'excellent_students': self.excellent_students
+        }
 
-                if detail_file and os.path.exists(detail_file):
-                    student_count += 1
-                    detail_files.append(detail_file)
-            except Exception as e:
-                error_count += 1
+    @classmethod
+    def from_worker_state(cls, state):
+        """按 _detail_worker_state 的结果重建计算器（不经过 set_major，避免在子进程输出界面信息）"""
+        calc = cls()
+        for name, value in state.items():
+            setattr(calc, name, value)
+        return calc
 
-        return student_count, error_count, detail_files
+    @staticmethod
+    def detail_file_name(student_id, student_name, student_class):
+        """学生明细文件名"""
+        return f"{student_id}_{student_name}_{student_class}班_计算明细.xlsx"
 
     def _generate_student_detail_file(self, student_id, student_name, student_class,
                                       student_df, output_dir):
-        import os
-        from openpyxl import load_workbook
+        """生成单个学生的明细文件到 output_dir，返回文件路径"""
+        file_name, content = self._render_student_detail(student_id, student_name, student_class, student_df)
+        file_path = os.path.join(output_dir, file_name)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+    def _render_student_detail(self, student_id, student_name, student_class, student_df):
+        """在内存中生成单个学生的明细工作簿，返回 (文件名, 工作簿字节)"""
         from openpyxl.utils.dataframe import dataframe_to_rows
 
         df = student_df.copy()
@@ -1008,18 +2746,19 @@ class StudentGradeCalculator:
         if '成绩标志' in self.column_mapping:
             original_columns.append(self.column_mapping['成绩标志'])
 
-        df['_计算成绩'] = df.apply(self._convert_score, axis=1)
-        df['_学分'] = df.apply(self._get_credit, axis=1)
-        df['_课程类别'] = df.apply(self.classify_course, axis=1)
-        df['_是否补考'] = df.apply(self._is_makeup_exam, axis=1)
+        # 流水线准备的分组已带逐行换算结果和课程类别，直接复用；单独传入原始记录时再现场计算
+        if '_计算成绩' not in df.columns:
+            df = self._score_rows(df)
+        if '_课程类别' not in df.columns:
+            df['_课程类别'] = self.classify_courses(df)
         df['_处理说明'] = df.apply(self._get_course_processing_note, axis=1)
 
         duplicate_record = self._analyze_duplicate_courses(df)
 
-        file_name = f"{student_id}_{student_name}_{student_class}班_计算明细.xlsx"
-        file_path = os.path.join(output_dir, file_name)
+        file_name = self.detail_file_name(student_id, student_name, student_class)
+        output = BytesIO()
 
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+        with ExcelStreamWriter(output) as writer:
             info_df = pd.DataFrame([
                 ['学号', student_id],
                 ['姓名', student_name],
@@ -1029,11 +2768,11 @@ class StudentGradeCalculator:
                 ['有效成绩课程数', df['_计算成绩'].notna().sum()],
                 ['生成时间', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
             ], columns=['项目', '内容'])
-            info_df.to_excel(writer, sheet_name='基本信息', index=False)
+            writer.write_frame('基本信息', info_df)
 
             if original_columns:
                 original_display = df[original_columns].copy()
-                original_display.to_excel(writer, sheet_name='原始成绩', index=False)
+                writer.write_frame('原始成绩', original_display)
 
             conversion_data = []
             for _, row in df.iterrows():
@@ -1054,11 +2793,11 @@ class StudentGradeCalculator:
                     '换算说明': self._get_conversion_note(row)
                 })
 
-            pd.DataFrame(conversion_data).to_excel(writer, sheet_name='成绩换算', index=False)
+            writer.write_frame('成绩换算', pd.DataFrame(conversion_data))
 
             if duplicate_record:
                 duplicate_df = pd.DataFrame(duplicate_record)
-                duplicate_df.to_excel(writer, sheet_name='重复课程处理', index=False)
+                writer.write_frame('重复课程处理', duplicate_df)
 
             classification_data = []
 
@@ -1119,7 +2858,7 @@ class StudentGradeCalculator:
                         non_elective['折算说明'] = '必修课程，全部计入'
                         class_df = pd.concat([processed_class_df, non_elective], ignore_index=True)
 
-                class_df.to_excel(writer, sheet_name='课程分类与折算', index=False)
+                writer.write_frame('课程分类与折算', class_df)
 
             calculation_df = df[df['_计算成绩'].notna()].copy()
             if not calculation_df.empty:
@@ -1145,14 +2884,10 @@ class StudentGradeCalculator:
                     ['保留5位有效数字', self.format_significant_digits(avg_score, 5)]
                 ], columns=['项目', '数值'])
 
-                with pd.ExcelWriter(file_path, engine='openpyxl', mode='w') as writer:
-                    process_df.to_excel(writer, sheet_name='加权平均计算', index=False)
-                    wb = writer.book
-                    ws = wb['加权平均计算']
-                    ws.append([])
-                    ws.append(['=== 成绩汇总 ===', '', '', '', ''])
-                    for row in dataframe_to_rows(summary, index=False, header=True):
-                        ws.append(row)
+                # 汇总紧跟在计算过程之后：空一行、标题行、再接汇总表
+                summary_rows = [[], ['=== 成绩汇总 ===', '', '', '', '']]
+                summary_rows.extend(dataframe_to_rows(summary, index=False, header=True))
+                writer.write_frame('加权平均计算', process_df, extra_rows=summary_rows)
 
             rules = [
                 ['规则类别', '详细说明'],
@@ -1169,30 +2904,33 @@ class StudentGradeCalculator:
                 ['计算模式',
                  f'{self.calc_mode}模式 - {"按选修课学分要求折算" if self.calc_mode == "保研" else "所有课程全部计入"}']
             ]
-            pd.DataFrame(rules[1:], columns=rules[0]).to_excel(writer, sheet_name='计算规则', index=False)
+            writer.write_frame('计算规则', pd.DataFrame(rules[1:], columns=rules[0]))
 
-        return file_path
+        return file_name, output.getvalue()
 
     # ============ 导出Excel（完全不变，只改输出方式） ============
-    def export_to_excel(self, output_buffer, semester_filter=None, calc_mode='保研'):
-        """导出结果 - 返回BytesIO"""
-        result_df, excellent_count, normal_count = self.calculate_all_students(semester_filter, calc_mode)
+    def export_to_excel(self, output_buffer, semester_filter=None, calc_mode='保研', ranked=None):
+        """导出结果 - 返回BytesIO；ranked 为已算好的 calculate_all_students 结果（给出时不再重新排名）"""
+        if ranked is None:
+            ranked = self.calculate_all_students(semester_filter, calc_mode)
+        result_df, excellent_count, normal_count = ranked
+        start = time.perf_counter()
 
-        with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-            result_df.to_excel(writer, sheet_name='全校成绩排名', index=False)
+        with ExcelStreamWriter(output_buffer) as writer:
+            writer.write_frame('全校成绩排名', result_df)
 
             if not result_df.empty:
                 excellent_df = result_df[result_df['班级类型'] == '卓越'].copy()
                 if not excellent_df.empty:
                     excellent_df = excellent_df.sort_values('平均成绩', ascending=False)
                     excellent_df['班级排名'] = range(1, len(excellent_df) + 1)
-                    excellent_df.to_excel(writer, sheet_name='卓越班级', index=False)
+                    writer.write_frame('卓越班级', excellent_df)
 
                 normal_df = result_df[result_df['班级类型'] == '普通'].copy()
                 if not normal_df.empty:
                     normal_df = normal_df.sort_values('平均成绩', ascending=False)
                     normal_df['班级排名'] = range(1, len(normal_df) + 1)
-                    normal_df.to_excel(writer, sheet_name='普通班级', index=False)
+                    writer.write_frame('普通班级', normal_df)
 
                 stats = []
                 for class_type in ['卓越', '普通']:
@@ -1207,7 +2945,7 @@ class StudentGradeCalculator:
                             '总学分平均': self.format_significant_digits(class_df['总学分'].mean(), 5)
                         })
                 if stats:
-                    pd.DataFrame(stats).to_excel(writer, sheet_name='班级统计', index=False)
+                    writer.write_frame('班级统计', pd.DataFrame(stats))
 
             config = {
                 '配置项': [
@@ -1230,10 +2968,1045 @@ class StudentGradeCalculator:
                     '4学分', '4学分', '2学分'
                 ]
             }
-            pd.DataFrame(config).to_excel(writer, sheet_name='计算配置', index=False)
+            # 性能统计：本次计算各阶段的用时，接在计算配置之后（写汇总工作簿本身的用时在保存后才记录，不在此表中）
+            perf_df = self.timings.to_frame(excellent_count + normal_count)
+            perf_rows = [[], ['性能统计'], list(perf_df.columns)] + perf_df.values.tolist() if len(perf_df) else []
+            writer.write_frame('计算配置', pd.DataFrame(config), extra_rows=perf_rows)
 
+        self.timings.record('写出汇总工作簿', time.perf_counter() - start, len(result_df), group='导出')
         return result_df, excellent_count, normal_count
 
+# ============ 明细文件并行生成（子进程入口） ============
+def _importable(func):
+    """
+    Streamlit 以 __main__ 身份执行本脚本，子进程按 __main__ 找不到函数；
+    此时改为从同名模块（web）导入，保证函数可以被序列化传给子进程。
+    """
+    if func.__module__ != '__main__':
+        return func
+    module_name = os.path.splitext(os.path.basename(__file__))[0]
+    return getattr(importlib.import_module(module_name), func.__name__)
+
+
+def _render_detail_shard(state, shard_df):
+    """子进程：为一个分片内的学生生成明细工作簿，返回 [(文件名, 工作簿字节) 或 (None, 出错信息), ...]"""
+    calc = StudentGradeCalculator.from_worker_state(state)
+    return list(calc._render_detail_groups(shard_df.groupby('_学号')))
+
+
+def read_archive(fileobj):
+    """读取压缩包全部内容（BytesIO 或 SpooledTemporaryFile 均可）"""
+    fileobj.seek(0)
+    return fileobj.read()
+
+
+def add_detail_workers_argument(parser):
+    """--detail-workers 的唯一定义：命令行、HTTP服务和网页启动参数共用同一个默认值（CPU核数）"""
+    parser.add_argument('--detail-workers', type=int, default=os.cpu_count() or 1,
+                        help='生成明细压缩包的并行进程总数（默认CPU核数）')
+
+
+@_cache_resource
+def startup_detail_workers():
+    """网页版的默认并行进程数：启动参数 streamlit run web.py -- --detail-workers N，只在启动后解析一次"""
+    parser = argparse.ArgumentParser(add_help=False)
+    add_detail_workers_argument(parser)
+    args, _ = parser.parse_known_args(sys.argv[1:])
+    return max(1, args.detail_workers)
+
+
+# ============ 多文件上传：并行解析 ============
+def _parse_grade_file(name, data):
+    """
+    子进程：解析一个成绩表文件（各自检测表头、识别列名）。
+    返回 (来源文件名, 表头行, 工作表名, 列映射, DataFrame, 缺少的字段, 出错信息)，解析失败时 DataFrame 为None
+    """
+    calc = StudentGradeCalculator(reporter=ConsoleReporter(quiet=True))
+    try:
+        success, missing = calc.load_data(BytesIO(data))
+        if success:
+            calc.compact()  # 紧凑数据表传回主进程也更快
+    except Exception as e:
+        return name, 0, None, {}, None, [], str(e)
+    return name, calc.header_row, calc.sheet_name, calc.column_mapping, calc.df if success else None, missing, None
+
+
+def parse_grade_files(files, workers=None, reporter=None):
+    """
+    并行解析多个成绩表文件：files 为 [(来源文件名, 文件字节)]，结果按 files 的顺序返回。
+    openpyxl 解析是纯Python计算，线程受GIL限制跑不满多核，因此交给进程池；进程池不可用时退回逐个解析
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files)))
+    if workers > 1:
+        try:
+            worker = _importable(_parse_grade_file)
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                return list(executor.map(worker, *zip(*files)))
+        except (OSError, BrokenProcessPool) as e:
+            # 只有进程池不可用时才退回逐个解析，其余异常照常抛出；退回时提示一次
+            (reporter or StreamlitReporter()).error(f"⚠️ 进程池不可用，{len(files)} 个文件改为逐个解析：{e}")
+    return [_parse_grade_file(name, data) for name, data in files]
+
+
+# ============ 上传文件解析缓存 ============
+class ParseCache:
+    """
+    上传文件解析缓存 - 以文件内容的SHA-256为键，保存表头行、列映射和解析后的DataFrame。
+    同一文件在页面重跑（切换专业、模式等）时直接复用，超过容量按最近最少使用淘汰。
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_hash(data):
+        """文件内容哈希"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key):
+        """查找缓存，命中时返回条目并标记为最近使用，未命中返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, header_row, column_mapping, df, raw_data=None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = {
+                'header_row': header_row,
+                'column_mapping': dict(column_mapping),
+                'df': df,
+                'raw_data': raw_data
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@_cache_resource
+def get_parse_cache():
+    """进程内共享的解析缓存（跨重跑、跨会话保留）"""
+    return ParseCache(max_entries=8)
+
+
+class DatasetCache:
+    """
+    磁盘数据集缓存 - 以文件内容哈希为键，把解析后的DataFrame存为列式二进制文件，
+    表头行、列映射等元数据存为同名JSON。服务重启后仍可命中，总大小超限时按最近使用时间淘汰。
+    """
+
+    META_SUFFIX = '.json'
+
+    DEFAULT_MAX_MB = 512
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            'GRADE_CACHE_DIR',
+            os.path.join(os.path.expanduser('~'), '.cache', 'pangaocal')
+        )
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('GRADE_CACHE_MAX_MB', self.DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._skipped = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version_tag():
+        """缓存版本：解析代码版本 + pandas版本，任一变化都视为不同条目"""
+        return f"v{INGESTION_VERSION}-pd{pd.__version__}"
+
+    def _base_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}-{self.version_tag()}")
+
+    # 取值类型混合的列（如成绩列同时有数字和“通过”“优秀”）按“文本 + 类型码”两列写入Parquet，读回时逐个还原
+    MIXED_KIND_PREFIX = '__类型__'
+
+    @staticmethod
+    def _encode_value(value):
+        """单个取值 → (类型码, 文本)；不支持的类型返回None"""
+        if value is None:
+            return 'n', ''
+        if isinstance(value, str):
+            return 's', value
+        if isinstance(value, (bool, np.bool_)):
+            return 'b', '1' if value else '0'
+        if isinstance(value, (int, np.integer)):
+            return 'i', str(int(value))
+        if isinstance(value, (float, np.floating)):
+            return ('N', '') if np.isnan(value) else ('f', repr(float(value)))
+        return None
+
+    @staticmethod
+    def _decode_value(kind, text):
+        return {'n': lambda: None, 'N': lambda: np.nan, 's': lambda: text, 'b': lambda: text == '1',
+                'i': lambda: int(text), 'f': lambda: float(text)}[kind]()
+
+    def _encode_mixed(self, series):
+        """混合类型列 → (类型码列, 文本列)，每个不同取值只转换一次；含不支持的类型时返回None"""
+        values = series.astype(object) if isinstance(series.dtype, pd.CategoricalDtype) else series
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        encoded = [self._encode_value(value) for value in uniques]
+        if any(item is None for item in encoded):
+            return None
+        kinds = np.array([kind for kind, _ in encoded], dtype=object)[codes]
+        texts = np.array([text for _, text in encoded], dtype=object)[codes]
+        return pd.Categorical(kinds), pd.Categorical(texts)
+
+    def _decode_mixed(self, kinds, texts):
+        """类型码列 + 文本列 → 原取值的object列"""
+        codes, uniques = pd.factorize(pd.MultiIndex.from_arrays([kinds.astype(object), texts.astype(object)]))
+        table = np.empty(len(uniques), dtype=object)
+        table[:] = [self._decode_value(kind, text) for kind, text in uniques]
+        return pd.Series(table[codes], index=kinds.index, dtype=object)
+
+    def _parquet_frame(self, df):
+        """
+        转成可写Parquet的数据表：数值/布尔/日期列、"字符串+空值"列和取值类型单一的分类列原样写入，
+        其余列按“文本 + 类型码”写入。返回 (数据表, 含空值的字符串列, 混合类型列{列名: 是否分类})；
+        列名不是字符串或含不支持的取值类型时返回None
+        """
+        if not all(isinstance(col, str) for col in df.columns):
+            return None
+        columns, nan_columns, mixed_columns = {}, [], {}
+        for col in df.columns:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                plain = pd.api.types.infer_dtype(series.cat.categories, skipna=True) in ('string', 'integer', 'floating')
+            elif series.dtype == object:
+                missing = series[series.isna()]
+                plain = pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty') \
+                    and not any(value is None for value in missing)
+                if plain and len(missing):
+                    # 读回时空值是None，需要恢复成NaN
+                    nan_columns.append(col)
+            else:
+                plain = True
+            if plain:
+                columns[col] = series
+                continue
+            encoded = self._encode_mixed(series)
+            if encoded is None:
+                return None
+            columns[self.MIXED_KIND_PREFIX + col], columns[col] = encoded
+            mixed_columns[col] = isinstance(series.dtype, pd.CategoricalDtype)
+        return pd.DataFrame(columns, index=df.index), nan_columns, mixed_columns
+
+    def get(self, key):
+        """读取缓存条目，返回与 ParseCache 相同结构的字典；不存在或损坏时返回None"""
+        base = self._base_path(key)
+        meta_path = base + self.META_SUFFIX
+        with self._lock:
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta.get('version') != self.version_tag():
+                    raise ValueError('版本不匹配')
+                if meta.get('format') != 'parquet':
+                    raise ValueError('不支持的缓存格式')
+                data_path = base + '.parquet'
+                df = pd.read_parquet(data_path)
+                for col in meta.get('nan_columns', []):
+                    df[col] = df[col].mask(df[col].isna(), np.nan)
+                for col, categorical in meta.get('mixed_columns', {}).items():
+                    values = self._decode_mixed(df.pop(self.MIXED_KIND_PREFIX + col), df[col])
+                    df[col] = values.astype('category') if categorical else values
+                # 整数取值的分类列读回后是普通整数列，恢复为分类
+                for col in meta.get('category_columns', []):
+                    if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                        df[col] = df[col].astype('category')
+                now = datetime.datetime.now().timestamp()
+                os.utime(meta_path, (now, now))
+                os.utime(data_path, (now, now))
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except Exception:
+                # 缓存损坏：删除后按未命中处理
+                self._remove(base)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return {
+                'header_row': meta['header_row'],
+                'column_mapping': dict(meta['column_mapping']),
+                'df': df,
+                'raw_data': None
+            }
+
+    def put(self, key, header_row, column_mapping, df):
+        """写入缓存（先写临时文件再替换，避免并发读到半个文件），写入后执行淘汰"""
+        if not HAS_PYARROW:
+            self._skip("未安装 pyarrow，无法写入Parquet（pip install -r requirements.txt）")
+            return False
+        plan = self._parquet_frame(df)
+        if plan is None:
+            self._skip("数据表含有无法写入Parquet的列名或取值类型")
+            return False
+        frame, nan_columns, mixed_columns = plan
+        base = self._base_path(key)
+        meta = {
+            'version': self.version_tag(),
+            'format': 'parquet',
+            'nan_columns': nan_columns,
+            'mixed_columns': mixed_columns,
+            'category_columns': [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)],
+            'header_row': int(header_row),
+            'column_mapping': dict(column_mapping),
+            'rows': int(len(df)),
+            'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self._lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                data_path = base + '.parquet'
+                tmp_path = f"{data_path}.{os.getpid()}.tmp"
+                frame.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, data_path)
+
+                tmp_meta = f"{base}{self.META_SUFFIX}.{os.getpid()}.tmp"
+                with open(tmp_meta, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, ensure_ascii=False)
+                os.replace(tmp_meta, base + self.META_SUFFIX)
+            except OSError:
+                # 缓存目录不可写时静默跳过，不影响正常计算
+                return False
+            self._evict()
+        return True
+
+    def _skip(self, reason):
+        """不写磁盘缓存（每个缓存实例只警告一次），计算照常进行"""
+        if not self._skipped:
+            self._skipped = True
+            warnings.warn(f"磁盘数据集缓存已跳过: {reason}", RuntimeWarning, stacklevel=3)
+
+    def _remove(self, base):
+        # 同时清理旧版本写下的 .pkl 文件
+        for suffix in (self.META_SUFFIX, '.parquet', '.pkl'):
+            try:
+                os.remove(base + suffix)
+            except OSError:
+                pass
+
+    def _entries(self):
+        """列出缓存条目：(最近使用时间, 总字节数, 路径前缀)"""
+        entries = {}
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        for name in names:
+            base, ext = os.path.splitext(name)
+            if ext not in (self.META_SUFFIX, '.parquet', '.pkl', '.tmp'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if ext == '.tmp':
+                # 遗留的临时文件（进程中途退出）超过1小时直接清理
+                if datetime.datetime.now().timestamp() - stat.st_mtime > 3600:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            mtime, size = entries.get(base, (0, 0))
+            entries[base] = (max(mtime, stat.st_mtime), size + stat.st_size)
+        return sorted(
+            (mtime, size, os.path.join(self.cache_dir, base))
+            for base, (mtime, size) in entries.items()
+        )
+
+    def _evict(self):
+        """总大小超过上限时，从最久未使用的条目开始删除"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, base in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(base)
+            total -= size
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+
+@_cache_resource
+def get_dataset_cache():
+    """磁盘数据集缓存（目录和总大小上限可用环境变量 GRADE_CACHE_DIR、GRADE_CACHE_MAX_MB 指定）"""
+    return DatasetCache()
+
+
+# ============ 单个学生明细缓存 ============
+class DetailCache:
+    """
+    单个学生明细工作簿缓存 - 键为 (文件哈希, 专业指纹, 计算模式, 学期筛选, 学号)，
+    值为 (文件名, 工作簿字节)。同一学生重复查询直接返回，超过容量按最近最少使用淘汰。
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_hash, calc, calc_mode, semester_filter, student_id):
+        semesters = tuple(sorted(str(sem) for sem in semester_filter)) if semester_filter else ()
+        return file_hash, calc.major_fingerprint(), calc_mode, semesters, str(student_id)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@_cache_resource
+def get_detail_cache():
+    """进程内共享的单个学生明细缓存"""
+    return DetailCache(max_entries=256)
+
+
+def current_result_key(calc):
+    """当前结果对应的数据和设置：数据内容 + 专业配置 + 学期筛选 + 计算模式，任一变化都需要重新排名"""
+    semester_filter = st.session_state.semester_filter
+    semesters = tuple(semester_filter) if isinstance(semester_filter, (list, tuple)) else semester_filter
+    return calc.dataset_key(), calc.major_fingerprint(), semesters, st.session_state.calc_mode
+
+
+def perf_log_enabled():
+    """界面每次计算是否把各阶段用时写一行JSON到标准错误（环境变量 GRADE_PERF_LOG=1 开启，默认关闭）"""
+    return os.environ.get('GRADE_PERF_LOG', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def release_detail_zip():
+    """释放会话中已生成的明细压缩包（已落盘时同时删除临时文件）"""
+    previous_zip = st.session_state.get('detail_zip')
+    if previous_zip is not None:
+        previous_zip.close()
+    st.session_state.detail_zip = None
+    st.session_state.student_count = None
+
+
+def build_detail_zip(calc, workers):
+    """打包全部学生的明细：工作簿直接写入压缩包，超过上限后自动转存到临时文件"""
+    release_detail_zip()
+    calc.calc_mode = st.session_state.calc_mode
+    zip_buffer = tempfile.SpooledTemporaryFile(max_size=DETAIL_ZIP_SPOOL_BYTES)
+    student_count, error_count, detail_files = calc.export_student_details_zip(zip_buffer, workers=workers)
+    st.session_state.detail_zip = zip_buffer
+    st.session_state.student_count = student_count
+
+
+def get_student_detail(calc, student_id):
+    """单个学生明细：按 (文件哈希, 专业, 模式, 学期筛选, 学号) 缓存，未命中时即时生成"""
+    calc.calc_mode = st.session_state.calc_mode
+    detail_cache = get_detail_cache()
+    key = DetailCache.make_key(
+        st.session_state.file_hash, calc, st.session_state.calc_mode,
+        st.session_state.semester_filter, student_id
+    )
+    entry = detail_cache.get(key)
+    if entry is None:
+        entry = calc.render_student_detail(student_id)
+        if entry is not None:
+            detail_cache.put(key, entry)
+    return entry
+
+
+# ============ 命令行批量计算（不依赖 Streamlit） ============
+def expand_input_paths(patterns):
+    """展开命令行给出的文件路径和通配符，保持给出顺序并去重"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def run_cli_job(path, major_code, calc_mode='保研', semester_filter=None, output_dir='.',
+                details=False, detail_workers=1, perf_log=False):
+    """
+    命令行：计算一个成绩表文件并写出汇总工作簿（以及明细压缩包），
+    返回 (文件路径, 是否成功, 用时秒数, 说明)。任何异常都转成失败结果，不影响其他文件。
+    perf_log=True 时把各阶段用时作为一行JSON写到标准错误。
+    """
+    start = time.perf_counter()
+    try:
+        calc = StudentGradeCalculator(path, reporter=ConsoleReporter(quiet=True))
+        with calc.timings.stage('解析文件', group='读取'):
+            success, missing = calc.load_data()
+        if not success:
+            return path, False, time.perf_counter() - start, f"缺少必要字段: {missing}"
+        calc.compact()
+        if not calc.set_major(major_code):
+            return path, False, time.perf_counter() - start, f"无法设置专业: {major_code}"
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        summary_path = os.path.join(output_dir, f"{stem}_{calc.major_name}_{calc_mode}_成绩计算结果.xlsx")
+        zip_path = os.path.join(output_dir, f"{stem}_{calc.major_name}_计算明细.zip") if details else None
+        result_df, excellent_count, normal_count, detail_result = calc.export_results(
+            summary_path, semester_filter, calc_mode, zip_target=zip_path, workers=detail_workers)
+
+        message = f"{len(result_df)} 名学生（卓越 {excellent_count} / 普通 {normal_count}）→ {summary_path}"
+        ok = True
+        if detail_result is not None:
+            student_count, error_count, _ = detail_result
+            message += f"；明细 {student_count} 份 → {zip_path}"
+            if error_count:
+                message += f"，{error_count} 份生成失败"
+                ok = False
+        if perf_log:
+            print(calc.timings.log_line(file=path, major=major_code, mode=calc_mode, semesters=semester_filter,
+                                        rows=len(calc.df), students=excellent_count + normal_count, details=details),
+                  file=sys.stderr, flush=True)
+        return path, ok, time.perf_counter() - start, message
+    except Exception as e:
+        return path, False, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def run_cli(argv=None):
+    """命令行入口：多个成绩表文件按进程并行计算，逐个输出用时；有文件失败时返回1"""
+    parser = argparse.ArgumentParser(
+        prog='web.py',
+        description='成绩测算 - 命令行批量计算（不启动网页；网页版请使用 streamlit run web.py）'
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='成绩表文件路径（xlsx/xls 或 CSV/TSV 文本导出），可使用通配符（如 "成绩/*.xlsx"）')
+    parser.add_argument('--major', required=True, choices=list(MajorConfig().majors), help='专业代码')
+    parser.add_argument('--mode', choices=['保研', '综测'], default='保研', help='计算模式（默认保研）')
+    parser.add_argument('--semester', action='append', default=None,
+                        help='只计算指定学期，可重复给出；不给出时计算全部学期')
+    parser.add_argument('-o', '--output-dir', default='.', help='输出目录（默认当前目录）')
+    parser.add_argument('--details', action='store_true', help='同时生成学生计算明细压缩包')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='同时处理的文件数（默认CPU核数）')
+    add_detail_workers_argument(parser)
+    parser.add_argument('--perf-log', action='store_true', help='每个文件输出一行JSON格式的各阶段用时到标准错误')
+    args = parser.parse_args(argv)
+
+    paths = expand_input_paths(args.inputs)
+    if not paths:
+        print("❌ 没有找到任何成绩表文件", file=sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(paths)))
+    # 多个文件同时处理时明细进程按文件数分摊，总进程数不超过 --detail-workers
+    detail_workers = max(1, args.detail_workers // jobs)
+    job_args = (args.major, args.mode, args.semester, args.output_dir, args.details, detail_workers, args.perf_log)
+
+    start = time.perf_counter()
+    failures = 0
+    if jobs == 1:
+        results = (run_cli_job(path, *job_args) for path in paths)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'))
+        worker = _importable(run_cli_job)
+        futures = {pool.submit(worker, path, *job_args): path for path in paths}
+        results = (future.result() for future in as_completed(futures))
+
+    try:
+        for path, ok, elapsed, message in results:
+            failures += not ok
+            print(f"{'✅' if ok else '❌'} {path}（{elapsed:.2f} 秒）：{message}", flush=True)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    print(f"共 {len(paths)} 个文件，成功 {len(paths) - failures} 个，失败 {failures} 个，"
+          f"总用时 {time.perf_counter() - start:.2f} 秒")
+    return 1 if failures else 0
+
+
+# ============ HTTP 计算服务（标准库实现，不依赖 Streamlit） ============
+class CalculationJob:
+    """后台计算任务：记录状态（queued/running/done/failed）、结果文件和出错信息"""
+
+    def __init__(self, job_id, kind):
+        self.job_id = job_id
+        self.kind = kind
+        self.status = 'queued'
+        self.error = None
+        self.file_name = None
+        self.content = None
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'file_name': self.file_name,
+            'size': len(self.content) if self.content is not None else None,
+            'created': self.created,
+            'finished': self.finished
+        }
+
+
+class CalculationService:
+    """
+    成绩计算服务 - 上传的数据集以文件内容哈希为ID保存在内存中，所有计算都在有界线程池里执行。
+    同一数据集上的计算串行进行（共享阶段缓存），不同数据集互不阻塞；
+    生成工作簿、明细压缩包等耗时任务立即返回任务ID，之后按ID查询状态并下载结果。
+    线程池负责并发和排队；纯Python的计算部分受GIL限制不会在线程间并行，
+    最耗CPU的明细压缩包由 detail_workers 个子进程生成。
+    已结束任务的结果保留在内存中供下载：超过 job_ttl 秒、或结果总字节数超过 max_job_bytes、
+    或任务数超过 max_jobs 时，从最早结束的任务开始丢弃。
+    """
+
+    EXPORT_KINDS = {
+        'summary': ('成绩计算结果', '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+        'details': ('计算明细', '.zip', 'application/zip')
+    }
+
+    def __init__(self, workers=4, max_datasets=8, max_jobs=256, dataset_cache=None, detail_workers=1,
+                 max_job_bytes=256 * 1024 * 1024, job_ttl=3600):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='grade-calc')
+        self.max_datasets = max_datasets
+        self.max_jobs = max_jobs
+        self.max_job_bytes = max_job_bytes
+        self.job_ttl = job_ttl
+        self.dataset_cache = dataset_cache
+        self.detail_workers = detail_workers
+        self.datasets = OrderedDict()  # 数据集ID -> (计算器, 该数据集的计算锁)
+        self.jobs = OrderedDict()  # 任务ID -> CalculationJob
+        self._lock = threading.Lock()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    # ---- 数据集 ----
+    def add_dataset(self, content):
+        """上传成绩表（xlsx/xls 或 CSV/TSV 字节），返回数据集信息；同一文件重复上传直接复用"""
+        dataset_id = ParseCache.file_hash(content)
+        with self._lock:
+            known = dataset_id in self.datasets
+        if known:
+            return self.dataset_info(dataset_id)
+
+        calc = self.executor.submit(self._load_dataset, dataset_id, content).result()
+        with self._lock:
+            self.datasets[dataset_id] = (calc, threading.Lock())
+            while len(self.datasets) > self.max_datasets:
+                self.datasets.popitem(last=False)
+        return self.dataset_info(dataset_id)
+
+    def _load_dataset(self, dataset_id, content):
+        calc = StudentGradeCalculator(reporter=ConsoleReporter(quiet=True))
+        cached = self.dataset_cache.get(dataset_id) if self.dataset_cache is not None else None
+        if cached is not None:
+            calc.header_row = cached['header_row']
+            calc.column_mapping = dict(cached['column_mapping'])
+            calc.df = cached['df']
+            return calc
+
+        success, missing = calc.load_data(BytesIO(content))
+        if not success:
+            raise ValueError(f"缺少必要字段: {missing}")
+        calc.compact()
+        if self.dataset_cache is not None:
+            self.dataset_cache.put(dataset_id, calc.header_row, calc.column_mapping, calc.df)
+        return calc
+
+    def append_dataset(self, dataset_id, content, verify='sample'):
+        """
+        在已上传的数据集后追加一个成绩表（如新学期的导出），按增量更新该数据集的计算结果。
+        追加后数据集内容改变，改用新的ID（原ID失效，之后对原ID的追加和计算都返回“不存在”），
+        返回新数据集信息及成绩有变化的学生数；verify 同 append_records（默认抽查核对），
+        返回的 verified 为核对方式（'sample' / 'full'），未核对为None，核对发现不一致（已改为整表重新计算）为False
+        """
+        calc, lock = self._dataset(dataset_id)
+        new_id = ParseCache.file_hash('\n'.join([dataset_id, ParseCache.file_hash(content)]).encode('ascii'))
+
+        def task():
+            part = StudentGradeCalculator(reporter=ConsoleReporter(quiet=True))
+            success, missing = part.load_data(BytesIO(content))
+            if not success:
+                raise ValueError(f"缺少必要字段: {missing}")
+            # 持有数据集锁完成“确认ID仍有效 → 追加 → 换用新ID”：
+            # 同一数据集的并发追加排队进行，后到的一个发现原ID已被替换，直接拒绝
+            with lock:
+                with self._lock:
+                    current = self.datasets.get(dataset_id)
+                if current is None or current[0] is not calc:
+                    raise KeyError(f"数据集不存在或已追加更新: {dataset_id}")
+                changed = calc.append_records(part.df, part.column_mapping, verify=verify)
+                passed = calc.append_verified
+                with self._lock:
+                    self.datasets.pop(dataset_id, None)
+                    self.datasets[new_id] = (calc, lock)
+                return changed, passed
+        changed, passed = self.executor.submit(task).result()
+        verified = passed and ('full' if verify is True else verify)
+        return {**self.dataset_info(new_id), 'changed_students': len(changed), 'verified': verified}
+
+    def _dataset(self, dataset_id):
+        with self._lock:
+            if dataset_id not in self.datasets:
+                raise KeyError(f"数据集不存在: {dataset_id}")
+            self.datasets.move_to_end(dataset_id)
+            return self.datasets[dataset_id]
+
+    def dataset_info(self, dataset_id):
+        calc, _ = self._dataset(dataset_id)
+        semesters = []
+        if '学年学期' in calc.column_mapping:
+            semesters = sorted(str(s) for s in calc.df[calc.column_mapping['学年学期']].dropna().unique())
+        return {
+            'dataset_id': dataset_id,
+            'rows': len(calc.df),
+            'memory_bytes': int(calc.df.memory_usage(index=True, deep=True).sum()),
+            'column_mapping': calc.column_mapping,
+            'semesters': semesters,
+            'majors': [code for code in calc.major_config.majors if code != 'custom']
+        }
+
+    # ---- 计算 ----
+    def _task(self, dataset_id, major_code, calc_mode, func):
+        """包装一次计算：在该数据集的锁内切换专业和模式后执行 func(calc)"""
+        if calc_mode not in ('保研', '综测'):
+            raise ValueError(f"无效的计算模式: {calc_mode}")
+        calc, lock = self._dataset(dataset_id)
+        if calc.major_config.get_major(major_code) is None:
+            raise ValueError(f"无效的专业代码: {major_code}")
+
+        def task():
+            with lock:
+                calc.set_major(major_code)
+                calc.calc_mode = calc_mode
+                if calc.excellent_students:
+                    calc.excellent_students = {str(sid) for sid in calc.excellent_students}
+                return func(calc)
+        return task
+
+    def _run(self, dataset_id, major_code, calc_mode, func):
+        return self.executor.submit(self._task(dataset_id, major_code, calc_mode, func)).result()
+
+    def ranking(self, dataset_id, major_code, calc_mode='保研', semester_filter=None):
+        """排名结果：{卓越人数, 普通人数, students: [每位学生一行]}"""
+        def build(calc):
+            result_df, excellent_count, normal_count = calc.calculate_all_students(semester_filter, calc_mode)
+            return {
+                'major': major_code,
+                'mode': calc_mode,
+                'semesters': semester_filter,
+                'excellent_count': excellent_count,
+                'normal_count': normal_count,
+                'students': json.loads(result_df.to_json(orient='records', force_ascii=False))
+            }
+        return self._run(dataset_id, major_code, calc_mode, build)
+
+    def student_result(self, dataset_id, student_id, major_code, calc_mode='保研', semester_filter=None):
+        """单个学生的排名行（按学号或姓名查找）"""
+        def build(calc):
+            result_df = calc.calculate_all_students(semester_filter, calc_mode)[0]
+            if result_df.empty:
+                raise KeyError(f"未找到学生: {student_id}")
+            rows = result_df[(result_df['学号'] == str(student_id)) | (result_df['姓名'] == str(student_id))]
+            if rows.empty:
+                raise KeyError(f"未找到学生: {student_id}")
+            return {'total': len(result_df), 'students': json.loads(rows.to_json(orient='records', force_ascii=False))}
+        return self._run(dataset_id, major_code, calc_mode, build)
+
+    def student_detail(self, dataset_id, student_id, major_code, calc_mode='保研'):
+        """单个学生的明细工作簿 (文件名, 字节)"""
+        def build(calc):
+            detail = calc.render_student_detail(student_id)
+            if detail is None:
+                raise KeyError(f"未找到学生: {student_id}")
+            return detail
+        return self._run(dataset_id, major_code, calc_mode, build)
+
+    def what_if(self, dataset_id, student_id, changes, major_code, calc_mode='保研', semester_filter=None):
+        """假设成绩模拟：只重算该学生，在排名索引中查出新名次（见 simulate_student）"""
+        if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+            raise ValueError("changes 应为课程假设成绩的列表")
+        return self._run(dataset_id, major_code, calc_mode,
+                         lambda calc: calc.simulate_student(student_id, changes, semester_filter, calc_mode))
+
+    # ---- 后台任务 ----
+    def submit_export(self, dataset_id, kind, major_code, calc_mode='保研', semester_filter=None):
+        """提交导出任务（summary 汇总工作簿 / details 明细压缩包），立即返回任务信息"""
+        if kind not in self.EXPORT_KINDS:
+            raise ValueError(f"无效的导出类型: {kind}")
+        suffix, extension, _ = self.EXPORT_KINDS[kind]
+
+        def build(calc):
+            output = BytesIO()
+            if kind == 'summary':
+                calc.export_to_excel(output, semester_filter, calc_mode)
+            else:
+                calc.export_student_details_zip(output, workers=self.detail_workers)
+            return f"{calc.major_name}_{suffix}{extension}", output.getvalue()
+        task = self._task(dataset_id, major_code, calc_mode, build)
+
+        job = CalculationJob(uuid.uuid4().hex, kind)
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._evict_jobs()
+
+        def run():
+            job.status = 'running'
+            try:
+                job.file_name, job.content = task()
+                job.status = 'done'
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = 'failed'
+            with self._lock:
+                job.finished = time.time()
+                self._evict_jobs(keep=job.job_id)
+
+        self.executor.submit(run)
+        return job.to_dict()
+
+    def _evict_jobs(self, keep=None):
+        """
+        丢弃已结束的旧任务（调用方持有 self._lock）：先丢弃结束超过 job_ttl 秒的，
+        再从最早结束的开始丢弃，直到结果总字节数和任务数都不超限；keep（刚结束的任务）总是保留
+        """
+        now = time.time()
+        finished = sorted((old.finished, job_id) for job_id, old in self.jobs.items()
+                          if old.finished is not None and job_id != keep)
+        total_bytes = sum(len(old.content) for old in self.jobs.values() if old.content is not None)
+        for finished_at, job_id in finished:
+            if (now - finished_at <= self.job_ttl and total_bytes <= self.max_job_bytes
+                    and len(self.jobs) <= self.max_jobs):
+                break
+            content = self.jobs.pop(job_id).content
+            total_bytes -= len(content) if content is not None else 0
+
+    def job(self, job_id):
+        with self._lock:
+            if job_id not in self.jobs:
+                raise KeyError(f"任务不存在: {job_id}")
+            return self.jobs[job_id]
+
+
+class CalculationRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP 接口（JSON）：
+      POST /datasets                              上传成绩表（请求体为文件字节）
+      GET  /datasets/<id>                         数据集信息（学期、可选专业）
+      POST /datasets/<id>/append                  追加成绩表（如新学期，请求体为文件字节），增量更新后返回新的数据集ID；
+                                                  默认抽查核对部分学生，参数 verify=full 时与整表重新计算核对，verify=0 时不核对
+      GET  /datasets/<id>/ranking                 排名，参数 major、mode、semester（可重复）
+      GET  /datasets/<id>/students/<学号或姓名>     单个学生的排名行
+      GET  /datasets/<id>/students/<学号>/detail   单个学生的明细工作簿
+      POST /datasets/<id>/students/<学号>/whatif   假设成绩模拟，请求体 {"changes": [{"课程名称", "总成绩", "学分"}]}
+      POST /datasets/<id>/exports                 提交导出任务，参数 kind=summary|details 及 major、mode、semester
+      GET  /jobs/<job_id>                         任务状态
+      GET  /jobs/<job_id>/result                  下载任务结果
+    """
+
+    service = None
+    max_upload_bytes = 64 * 1024 * 1024
+    routes = [
+        ('POST', re.compile(r'^/datasets/?$'), 'post_dataset'),
+        ('GET', re.compile(r'^/datasets/([0-9a-f]+)/?$'), 'get_dataset'),
+        ('POST', re.compile(r'^/datasets/([0-9a-f]+)/append/?$'), 'post_append'),
+        ('GET', re.compile(r'^/datasets/([0-9a-f]+)/ranking/?$'), 'get_ranking'),
+        ('GET', re.compile(r'^/datasets/([0-9a-f]+)/students/([^/]+)/detail/?$'), 'get_student_detail'),
+        ('POST', re.compile(r'^/datasets/([0-9a-f]+)/students/([^/]+)/whatif/?$'), 'post_what_if'),
+        ('GET', re.compile(r'^/datasets/([0-9a-f]+)/students/([^/]+)/?$'), 'get_student'),
+        ('POST', re.compile(r'^/datasets/([0-9a-f]+)/exports/?$'), 'post_export'),
+        ('GET', re.compile(r'^/jobs/([0-9a-f]+)/?$'), 'get_job'),
+        ('GET', re.compile(r'^/jobs/([0-9a-f]+)/result/?$'), 'get_job_result'),
+    ]
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = unquote(url.path)
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                try:
+                    getattr(self, handler)(query, *match.groups())
+                except KeyError as e:
+                    self._send_json(404, {'error': e.args[0] if e.args else '不存在'})
+                except ValueError as e:
+                    self._send_json(400, {'error': str(e)})
+                except Exception as e:
+                    self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+                return
+        self._send_json(404, {'error': f"未知的接口: {method} {path}"})
+
+    # ---- 请求参数与响应 ----
+    @staticmethod
+    def _options(query):
+        """major / mode / semester 参数"""
+        major_code = query.get('major', [None])[0]
+        if not major_code:
+            raise ValueError("缺少参数 major")
+        return major_code, query.get('mode', ['保研'])[0], query.get('semester') or None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, file_name, content, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(file_name)}")
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    # ---- 接口 ----
+    def _read_upload(self):
+        """读取上传的文件字节；文件过大时已回复413，返回None"""
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            raise ValueError("请求体为空，请上传成绩表文件")
+        if length > self.max_upload_bytes:
+            self._send_json(413, {'error': '文件过大'})
+            return None
+        return self.rfile.read(length)
+
+    def post_dataset(self, query):
+        content = self._read_upload()
+        if content is not None:
+            self._send_json(201, self.service.add_dataset(content))
+
+    def post_append(self, query, dataset_id):
+        content = self._read_upload()
+        if content is not None:
+            verify = query.get('verify', ['sample'])[0].lower()
+            verify = False if verify in ('0', 'false', 'no') else (True if verify == 'full' else 'sample')
+            self._send_json(201, self.service.append_dataset(dataset_id, content, verify))
+
+    def get_dataset(self, query, dataset_id):
+        self._send_json(200, self.service.dataset_info(dataset_id))
+
+    def get_ranking(self, query, dataset_id):
+        major_code, calc_mode, semester_filter = self._options(query)
+        self._send_json(200, self.service.ranking(dataset_id, major_code, calc_mode, semester_filter))
+
+    def get_student(self, query, dataset_id, student_id):
+        major_code, calc_mode, semester_filter = self._options(query)
+        self._send_json(200, self.service.student_result(dataset_id, student_id, major_code, calc_mode,
+                                                         semester_filter))
+
+    def get_student_detail(self, query, dataset_id, student_id):
+        major_code, calc_mode, _ = self._options(query)
+        file_name, content = self.service.student_detail(dataset_id, student_id, major_code, calc_mode)
+        self._send_file(file_name, content, CalculationService.EXPORT_KINDS['summary'][2])
+
+    def post_what_if(self, query, dataset_id, student_id):
+        major_code, calc_mode, semester_filter = self._options(query)
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            raise ValueError(f"请求体不是有效的JSON: {e}")
+        changes = body.get('changes', []) if isinstance(body, dict) else body
+        self._send_json(200, self.service.what_if(dataset_id, student_id, changes, major_code, calc_mode,
+                                                  semester_filter))
+
+    def post_export(self, query, dataset_id):
+        major_code, calc_mode, semester_filter = self._options(query)
+        kind = query.get('kind', ['summary'])[0]
+        self._send_json(202, self.service.submit_export(dataset_id, kind, major_code, calc_mode, semester_filter))
+
+    def get_job(self, query, job_id):
+        self._send_json(200, self.service.job(job_id).to_dict())
+
+    def get_job_result(self, query, job_id):
+        job = self.service.job(job_id)
+        if job.status != 'done':
+            self._send_json(409, job.to_dict())
+            return
+        self._send_file(job.file_name, job.content, CalculationService.EXPORT_KINDS[job.kind][2])
+
+
+def make_server(service, host='127.0.0.1', port=8765):
+    """创建绑定到 service 的多线程 HTTP 服务器（port=0 时由系统分配端口）"""
+    handler = type('BoundCalculationRequestHandler', (CalculationRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def run_server(argv=None):
+    """python web.py serve：启动本地 HTTP 计算服务"""
+    parser = argparse.ArgumentParser(prog='web.py serve', description='成绩测算 - 本地 HTTP 计算服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址（默认 127.0.0.1）')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口（默认 8765）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='计算线程数（默认CPU核数）')
+    add_detail_workers_argument(parser)
+    parser.add_argument('--cache-dir', default=None,
+                        help='磁盘数据集缓存目录（默认环境变量 GRADE_CACHE_DIR 或 ~/.cache/pangaocal）')
+    parser.add_argument('--cache-max-mb', type=float, default=None,
+                        help=f'磁盘数据集缓存总大小上限，单位MB（默认 GRADE_CACHE_MAX_MB 或 {DatasetCache.DEFAULT_MAX_MB}）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用磁盘数据集缓存')
+    parser.add_argument('--job-ttl', type=float, default=3600, help='已结束任务的结果保留秒数（默认3600）')
+    parser.add_argument('--max-job-mb', type=float, default=256, help='内存中保留的任务结果总大小上限，单位MB（默认256）')
+    args = parser.parse_args(argv)
+
+    dataset_cache = None
+    if not args.no_cache:
+        max_bytes = int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb is not None else None
+        dataset_cache = DatasetCache(args.cache_dir, max_bytes)
+    service = CalculationService(workers=args.workers, dataset_cache=dataset_cache,
+                                 detail_workers=max(1, args.detail_workers), job_ttl=args.job_ttl,
+                                 max_job_bytes=int(args.max_job_mb * 1024 * 1024))
+    server = make_server(service, args.host, args.port)
+    print(f"成绩计算服务已启动: http://{args.host}:{server.server_port}（计算线程 {args.workers} 个，Ctrl+C 停止）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
 # ============ Streamlit主程序（翻译Tkinter界面） ============
 def main():
     """主函数 - Streamlit版，完全对应原Tkinter逻辑"""
@@ -1265,6 +4038,8 @@ def main():
         st.markdown("- ✅ 自动检测表头在哪一行")
         st.markdown("- ✅ 自动识别列名")
         st.markdown("- ✅ 适配任意格式Excel")
+        st.markdown("- ✅ 支持CSV/TSV大文件（分块读取）")
+        st.markdown("- ✅ 多个文件（如分学期导出）自动合并")
         st.markdown("- ✅ 补考通过计60，不通过保留原始")
         st.markdown("- ✅ 成绩保留5位有效数字")
         st.markdown("- ✅ 每位学生生成独立计算明细")
@@ -1307,6 +4082,8 @@ def main():
         st.session_state.generate_details = False
     if 'result_df' not in st.session_state:
         st.session_state.result_df = None
+    if 'perf_df' not in st.session_state:
+        st.session_state.perf_df = None
 
     # ============ 1. 文件选择对话框（对应filedialog.askopenfilename） ============
     st.header("📂 第一步：选择成绩表文件")
@@ -1337,13 +4114,19 @@ def main():
             st.info("📋 示例表格：请确保文件格式包含：学号、姓名、课程名称、学分、总成绩等字段")
 
     with col1:
-        uploaded_file = st.file_uploader(
-            "请选择Excel成绩表文件",
-            type=['xlsx', 'xls'],
-            help="支持 .xlsx .xls 格式。如果不确定格式，可以点击右侧按钮下载示例表格参考"
+        uploaded_files = st.file_uploader(
+            "请选择Excel成绩表文件（可多选，如每学期一个导出文件）",
+            type=['xlsx', 'xls', 'csv', 'tsv', 'txt'],
+            accept_multiple_files=True,
+            help="支持 .xlsx .xls 格式，以及 CSV/TSV 文本导出（自动识别 UTF-8/GBK 编码），可一次选择多个文件自动合并。"
+                 "如果不确定格式，可以点击右侧按钮下载示例表格参考"
         )
 
-    if uploaded_file is None:
+    # 同一文件重复选择时只保留一份
+    uploads = list({ParseCache.file_hash(f.getvalue()): f for f in uploaded_files or []}.items())
+    uploaded_file = uploads[0][1] if len(uploads) == 1 else None
+
+    if not uploads:
         # 添加示例表格的说明
         st.info("""
         👆 **请上传Excel文件开始使用**
@@ -1357,26 +4140,156 @@ def main():
         """)
         st.stop()
     # ============ 初始化计算器 ============
-    calc = StudentGradeCalculator()
-    st.session_state.calc = calc
+    # 同一文件在页面重跑之间复用计算器，保留已选专业、自定义培养方案等状态；换文件时重新开始
+    # 多个文件时以各文件哈希（按选择顺序）组合成整体的键
+    if uploaded_file is not None:
+        file_hash = uploads[0][0]
+    else:
+        file_hash = ParseCache.file_hash('\n'.join(key for key, _ in uploads).encode('ascii'))
+    calc = st.session_state.calc
+    # 在已合并的多个文件后面再添加文件（如新学期的导出）：保留计算器和上次的计算结果，只把新文件增量追加进去
+    previous_keys = st.session_state.get('upload_keys') or []
+    appended = []
+    if calc is not None and calc.df is not None and st.session_state.get('file_hash') != file_hash \
+            and calc.SOURCE_COLUMN in calc.df.columns and 1 < len(previous_keys) < len(uploads) \
+            and [key for key, _ in uploads[:len(previous_keys)]] == previous_keys:
+        appended = uploads[len(previous_keys):]
+        st.session_state.file_hash = file_hash
+    st.session_state.upload_keys = [key for key, _ in uploads]
+    if calc is None or st.session_state.get('file_hash') != file_hash:
+        calc = StudentGradeCalculator()
+        st.session_state.calc = calc
+        st.session_state.file_hash = file_hash
+        st.session_state.major_code = None
+        st.session_state.result_df = None
+        st.session_state.batch_excel = None
+        st.session_state.perf_df = None
+        st.session_state.upload_summary = None
 
     # ============ 2. 加载数据（对应calc.load_data()） ============
     with st.spinner("正在加载数据..."):
         try:
-            # 读取原始数据用于检测表头
-            calc.raw_data = pd.read_excel(uploaded_file, header=None, nrows=20)
-            # 检测表头行
-            calc.detect_header_row()
-            # 使用检测到的表头行重新读取
-            calc.df = pd.read_excel(uploaded_file, header=calc.header_row)
-            # 识别列名
-            success, missing = calc.auto_detect_columns()
-
-            if not success:
-                st.error(f"❌ 错误: 缺少必要字段: {missing}")
-                st.stop()
+            load_started = time.perf_counter()
+            append_note = None
+            # 同一文件（按内容哈希）重跑时直接复用解析结果
+            parse_cache = get_parse_cache()
+            cached = parse_cache.get(file_hash)
+
+            cache_source = '内存'
+            if cached is None:
+                # 进程内未命中时再查磁盘缓存（服务重启后仍有效）
+                dataset_cache = get_dataset_cache()
+                cached = dataset_cache.get(file_hash)
+                cache_source = '磁盘'
+                if cached is not None:
+                    parse_cache.put(file_hash, cached['header_row'], cached['column_mapping'], cached['df'])
+
+            if cached is not None:
+                calc.raw_data = cached['raw_data']
+                calc.header_row = cached['header_row']
+                calc.column_mapping = dict(cached['column_mapping'])
+                calc.df = cached['df']
+            elif uploaded_file is not None:
+                # 只解析一次工作簿：检测表头行 → 构建数据表 → 识别列名
+                success, missing = calc.load_data(uploaded_file)
+
+                if not success:
+                    st.error(f"❌ 错误: 缺少必要字段: {missing}")
+                    st.stop()
+
+                # 缓存中保存紧凑数据表：多个会话同时持有各自的成绩表时，内存占用主要在这里
+                calc.compact()
+                parse_cache.put(file_hash, calc.header_row, calc.column_mapping, calc.df, calc.raw_data)
+                dataset_cache.put(file_hash, calc.header_row, calc.column_mapping, calc.df)
+            else:
+                # 多个文件：已缓存的文件直接复用，其余文件并行解析，再按选择顺序合并
+                parsed = {}
+                pending = []
+                for key, upload in uploads:
+                    entry = parse_cache.get(key)
+                    if entry is None:
+                        entry = dataset_cache.get(key)
+                        if entry is not None:
+                            parse_cache.put(key, entry['header_row'], entry['column_mapping'], entry['df'])
+                    if entry is not None:
+                        parsed[key] = (upload.name, entry['header_row'], None, entry['column_mapping'],
+                                       entry['df'], [], None)
+                    else:
+                        pending.append((key, upload))
+
+                for (key, upload), result in zip(pending, parse_grade_files(
+                        [(upload.name, upload.getvalue()) for _, upload in pending])):
+                    parsed[key] = result
+                    name, header_row, _, mapping, df, missing, error = result
+                    if error:
+                        st.error(f"❌ 无法读取文件「{name}」: {error}")
+                        st.stop()
+                    if df is None:
+                        st.error(f"❌ 文件「{name}」缺少必要字段: {missing}")
+                        st.stop()
+                    parse_cache.put(key, header_row, mapping, df)
+                    dataset_cache.put(key, header_row, mapping, df)
+
+                if appended and all(set(parsed[key][3]) <= set(calc.column_mapping) for key, _ in appended):
+                    # 新文件的字段都已在合并表中：只处理新增记录，成绩无变化的学生沿用上次结果
+                    changed = set()
+                    verified = True
+                    for key, _ in appended:
+                        changed.update(calc.append_records(parsed[key][4], parsed[key][3], source=parsed[key][0]))
+                        verified = verified and calc.append_verified
+                    # 抽查不一致时增量结果已丢弃，排名按整表重新计算
+                    append_note = (f"➕ 已追加 {len(appended)} 个文件，增量更新了 {len(changed)} 名学生的成绩" +
+                                   ("（已抽查核对）" if verified else "（抽查发现不一致，已改为整表重新计算）"))
+                else:
+                    success, missing = calc.merge_sources(
+                        [(parsed[key][0], parsed[key][3], parsed[key][4]) for key, _ in uploads])
+                    if not success:
+                        st.error(f"❌ 错误: 合并后缺少必要字段: {missing}")
+                        st.stop()
+                    calc.compact()
+                parse_cache.put(file_hash, calc.header_row, calc.column_mapping, calc.df)
+                st.session_state.upload_summary = pd.DataFrame([
+                    {
+                        '文件': parsed[key][0],
+                        '工作表': parsed[key][2] or '',
+                        '表头行': parsed[key][1] + 1,
+                        '成绩记录': len(parsed[key][4]),
+                        '识别列数': len(parsed[key][3])
+                    }
+                    for key, _ in uploads
+                ])
+
+            # 只记录该文件第一次读入的用时（之后的页面重跑都是内存缓存命中）
+            if not calc.timings.has_group('读取'):
+                calc.timings.record(
+                    f'读取{cache_source}缓存' if cached is not None else '解析文件',
+                    time.perf_counter() - load_started, len(calc.df), group='读取', cached=cached is not None
+                )
 
             st.success(f"✅ 加载数据成功，共 {len(calc.df)} 条成绩记录")
+            st.caption(
+                f"{f'⚡ {cache_source}缓存命中，已跳过文件解析' if cached is not None else '📥 首次解析该文件'}"
+                f"（缓存 {len(parse_cache)}/{parse_cache.max_entries} 个文件，"
+                f"命中 {parse_cache.hits} 次 / 未命中 {parse_cache.misses} 次）"
+            )
+            if append_note:
+                st.caption(append_note)
+            if cached is None and calc.sheet_name:
+                st.caption(f"📄 已自动定位：工作表「{calc.sheet_name}」第 {calc.header_row + 1} 行为表头")
+            if calc.memory_usage and calc.memory_usage[0]:
+                before, after = calc.memory_usage
+                st.caption(f"🗜️ 数据表已压缩：{before / 1024 / 1024:.2f} MB → {after / 1024 / 1024:.2f} MB"
+                           f"（节省 {1 - after / before:.0%}）")
+            if calc.SOURCE_COLUMN in calc.df.columns:
+                with st.expander(f"🗃️ 已合并 {len(uploads)} 个文件（“{calc.SOURCE_COLUMN}”列记录每条成绩的出处）"):
+                    if st.session_state.get('upload_summary') is not None:
+                        st.dataframe(st.session_state.upload_summary, use_container_width=True, hide_index=True)
+                    # 不同文件里完全相同的成绩记录（例如两个导出文件的学期有重叠）
+                    record_cols = list(dict.fromkeys(calc.column_mapping.values()))
+                    per_file = calc.df.drop_duplicates(subset=record_cols + [calc.SOURCE_COLUMN])
+                    repeated = int(per_file.duplicated(subset=record_cols).sum())
+                    if repeated:
+                        st.warning(f"⚠️ 有 {repeated} 条成绩记录在多个文件中重复出现，请确认各文件的学期没有重叠")
 
             # 数据预览（对应原preview_data）
             with st.expander("👁️ 数据预览（前3行）", expanded=True):
@@ -1385,8 +4298,11 @@ def main():
                 for field in preview_cols:
                     if field in calc.column_mapping:
                         available_cols.append(calc.column_mapping[field])
+                if calc.SOURCE_COLUMN in calc.df.columns:
+                    available_cols.append(calc.SOURCE_COLUMN)
                 if available_cols:
-                    preview_df = calc.df[available_cols].head(3)
+                    # 分类列转回普通列再展示（成绩列的取值表混有数字和文本，无法直接转成Arrow）
+                    preview_df = calc.df[available_cols].head(3).astype(object)
                     st.dataframe(preview_df, use_container_width=True)
 
         except Exception as e:
@@ -1417,6 +4333,110 @@ def main():
                 st.session_state.calc = calc
                 st.rerun()
 
+    # ============ 多专业混合名单：一次计算全部专业 ============
+    with st.expander("🗂️ 成绩表包含多个专业？一次算出全部专业的排名"):
+        known_majors = [code for code in calc.major_config.majors if code != 'custom']
+        st.caption("可用专业代码：" + "、".join(
+            f"{code}（{calc.major_config.get_major(code)['专业名称']}）" for code in known_majors))
+
+        assign_method = st.radio(
+            "学生所属专业的确定方式",
+            options=['按学号前缀', '按名单文件', '按成绩表中的专业列'],
+            horizontal=True,
+            key='batch_assign_method'
+        )
+
+        prefix_text = roster_file = major_column = None
+        value_map = {}
+        if assign_method == '按学号前缀':
+            prefix_text = st.text_area(
+                "每行一条规则：学号前缀=专业代码",
+                placeholder="23040031=23kg\n23040032=23dz",
+                key='batch_prefix_rules'
+            )
+        elif assign_method == '按名单文件':
+            roster_file = st.file_uploader(
+                "上传名单（需含学号列和专业列，专业填专业代码或专业名称）",
+                type=['xlsx', 'xls', 'csv'],
+                key='batch_roster_file'
+            )
+        else:
+            columns = list(calc.df.columns)
+            default_column = calc.column_mapping.get('专业')
+            major_column = st.selectbox("专业所在列", options=columns,
+                                        index=columns.index(default_column) if default_column in columns else 0,
+                                        key='batch_major_column')
+            # 列中的专业名称往往不带年级，逐个指定对应的专业代码
+            options = ['（不参与）'] + known_majors
+            value_map = {}
+            for i, value in enumerate(sorted(calc.df[major_column].dropna().unique(), key=str)[:20]):
+                guess = calc.major_config.resolve_major_code(value)
+                choice = st.selectbox(f"「{value}」对应专业", options=options,
+                                      index=options.index(guess) if guess in options else 0,
+                                      key=f'batch_value_map_{i}')
+                value_map[value] = None if choice == '（不参与）' else choice
+
+        batch_col1, batch_col2 = st.columns(2)
+        with batch_col1:
+            batch_mode = st.radio("计算模式", options=['保研', '综测'], horizontal=True, key='batch_calc_mode')
+        with batch_col2:
+            batch_semesters = None
+            if '学年学期' in calc.column_mapping:
+                all_semesters = sorted(str(s) for s in calc.df[calc.column_mapping['学年学期']].dropna().unique())
+                batch_semesters = st.multiselect("学期（不选为全部学期）", options=all_semesters,
+                                                 key='batch_semesters') or None
+
+        if st.button("🚀 批量计算全部专业", key='batch_run'):
+            try:
+                if assign_method == '按学号前缀':
+                    rules = {}
+                    for line in (prefix_text or '').splitlines():
+                        if '=' in line:
+                            prefix, major = line.split('=', 1)
+                            major_code = calc.major_config.resolve_major_code(major)
+                            if prefix.strip() and major_code:
+                                rules[prefix.strip()] = major_code
+                    assignment = calc.assign_majors_by_prefix(rules)
+                elif assign_method == '按名单文件':
+                    if roster_file is None:
+                        assignment = {}
+                    elif roster_file.name.lower().endswith('.csv'):
+                        assignment = calc.assign_majors_by_roster(pd.read_csv(roster_file))
+                    else:
+                        assignment = calc.assign_majors_by_roster(pd.read_excel(roster_file))
+                else:
+                    assignment = calc.assign_majors_by_column(major_column, value_map)
+
+                if not assignment:
+                    st.error("❌ 没有学生被分配到已知专业，请检查规则、名单或专业列")
+                else:
+                    start = time.perf_counter()
+                    batch_results, unassigned = calc.calculate_batch(assignment, batch_semesters, batch_mode)
+                    output = BytesIO()
+                    calc.export_batch_to_excel(output, batch_results, unassigned, batch_semesters, batch_mode)
+                    st.session_state.batch_excel = output.getvalue()
+                    st.session_state.batch_overview = pd.DataFrame([
+                        {'专业': calc.major_config.get_major(code)['专业名称'], '人数': len(result_df),
+                         '卓越班级人数': excellent_count, '普通班级人数': normal_count}
+                        for code, (result_df, excellent_count, normal_count) in batch_results.items()
+                    ])
+                    st.success(f"✅ 已完成 {len(batch_results)} 个专业的计算"
+                               f"（用时 {time.perf_counter() - start:.2f} 秒）")
+                    if unassigned:
+                        st.warning(f"⚠️ {len(unassigned)} 名学生未分配到专业，未参与计算")
+            except Exception as e:
+                st.error(f"❌ 批量计算失败: {str(e)}")
+
+        if st.session_state.get('batch_excel') is not None:
+            st.dataframe(st.session_state.batch_overview, use_container_width=True)
+            st.download_button(
+                label="📥 下载全部专业排名",
+                data=st.session_state.batch_excel,
+                file_name=f"多专业排名_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key='batch_download'
+            )
+
     if st.session_state.major_code is None:
         st.warning("⚠️ 请先选择专业")
         st.stop()
@@ -1784,13 +4804,25 @@ def main():
     # ============ 6. 是否生成明细（对应原messagebox.askyesno） ============
     st.header("📋 第五步：明细生成设置")
 
+    st.caption("计算完成后可在结果区输入学号或姓名，即时生成单个学生的计算明细；全部学生的明细压缩包按需生成。")
+
     generate_details = st.checkbox(
-        "✅ 生成每位学生的独立计算明细",
-        value=True,
-        help="每位学生一个Excel文件，包含成绩换算、重复课程处理、选修课折算等完整逻辑"
+        "📦 计算时同时打包全部学生的独立计算明细（学生较多时耗时较长）",
+        value=False,
+        help="每位学生一个Excel文件，包含成绩换算、重复课程处理、选修课折算等完整逻辑；也可以在计算完成后到下载区单独生成"
     )
     st.session_state.generate_details = generate_details
 
+    default_workers = startup_detail_workers()
+    detail_workers = st.number_input(
+        "⚙️ 并行进程数",
+        min_value=1,
+        max_value=max(default_workers, (os.cpu_count() or 1) * 2),
+        value=default_workers,
+        step=1,
+        help="打包全部学生明细时，大于1则多进程并行生成；默认取CPU核数，可用启动参数 -- --detail-workers N 指定"
+    )
+
     st.markdown("---")
 
     # ============ 7. 开始计算（对应原计算流程） ============
@@ -1800,36 +4832,44 @@ def main():
 
         with st.spinner("正在计算成绩，请稍候..."):
 
-            # 导出汇总结果到BytesIO
+            # 上一次计算的明细压缩包与本次结果不再对应，先释放
+            release_detail_zip()
+
+            # 各计算阶段只算一次；勾选打包明细时，汇总Excel与明细压缩包并发导出
             output_buffer = BytesIO()
-            result_df, excellent_count, normal_count = calc.export_to_excel(
+            zip_buffer = tempfile.SpooledTemporaryFile(max_size=DETAIL_ZIP_SPOOL_BYTES) if generate_details else None
+            result_df, excellent_count, normal_count, detail_result = calc.export_results(
                 output_buffer,
                 st.session_state.semester_filter,
-                st.session_state.calc_mode
+                st.session_state.calc_mode,
+                zip_target=zip_buffer,
+                workers=int(detail_workers)
             )
 
             st.session_state.result_df = result_df
             st.session_state.excel_buffer = output_buffer
             st.session_state.excellent_count = excellent_count
             st.session_state.normal_count = normal_count
+            st.session_state.result_key = current_result_key(calc)
+
+            # 性能统计：面板展示；设置环境变量 GRADE_PERF_LOG=1 时每次计算另写一行JSON到服务器日志（标准错误），
+            # 与命令行的 --perf-log 相同
+            st.session_state.perf_df = calc.timings.to_frame(excellent_count + normal_count)
+            st.session_state.perf_log = calc.timings.log_line(
+                file_hash=st.session_state.file_hash, major=st.session_state.major_code,
+                mode=st.session_state.calc_mode, semesters=st.session_state.semester_filter,
+                rows=len(calc.df), students=excellent_count + normal_count, details=generate_details
+            )
+            if perf_log_enabled():
+                print(st.session_state.perf_log, file=sys.stderr, flush=True)
 
-            # 生成学生计算明细
-            if generate_details and not result_df.empty:
-                with st.spinner("正在生成学生计算明细..."):
-                    # 创建临时目录
-                    temp_dir = tempfile.mkdtemp()
-                    student_count, error_count, detail_files = calc.export_student_calculation_details(temp_dir)
-
-                    # 打包成ZIP
-                    zip_buffer = BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                        for file_path in detail_files:
-                            file_name = os.path.basename(file_path)
-                            with open(file_path, 'rb') as f:
-                                zf.writestr(file_name, f.read())
-
+            # 生成学生计算明细（可选）
+            if zip_buffer is not None:
+                if result_df.empty:
+                    zip_buffer.close()
+                else:
                     st.session_state.detail_zip = zip_buffer
-                    st.session_state.student_count = student_count
+                    st.session_state.student_count = detail_result[0]
 
             st.balloons()
             st.success("✅ 成绩计算完成！")
@@ -1837,6 +4877,24 @@ def main():
 
             st.markdown("---")
 
+    # ============ 切换模式/学期/专业后增量重新排名 ============
+    # 逐行换算、重复课程处理和课程分类的结果保存在计算器中，这里只重做筛选、折算、汇总和排名
+    if st.session_state.result_df is not None and st.session_state.get('result_key') != current_result_key(calc):
+        started = time.perf_counter()
+        release_detail_zip()
+        output_buffer = BytesIO()
+        result_df, excellent_count, normal_count, _ = calc.export_results(
+            output_buffer,
+            st.session_state.semester_filter,
+            st.session_state.calc_mode
+        )
+        st.session_state.result_df = result_df
+        st.session_state.excel_buffer = output_buffer
+        st.session_state.excellent_count = excellent_count
+        st.session_state.normal_count = normal_count
+        st.session_state.result_key = current_result_key(calc)
+        st.caption(f"⚡ 已按当前专业、学期和计算模式重新排名（用时 {(time.perf_counter() - started) * 1000:.0f} 毫秒）")
+
     # ============ 8. 显示结果（对应原print结果） ============
     if st.session_state.result_df is not None:
         result_df = st.session_state.result_df
@@ -1858,6 +4916,14 @@ def main():
             min_score = result_df['平均成绩'].min()
             st.metric("最低分", f"{min_score:.2f}")
 
+        # 性能统计（最近一次点击“开始计算”）
+        if st.session_state.perf_df is not None:
+            with st.expander("⏱️ 性能统计"):
+                perf_df = st.session_state.perf_df
+                st.caption(f"各阶段合计 {perf_df['用时(毫秒)'].sum():.1f} 毫秒；“复用缓存”表示该阶段直接使用了之前的计算结果")
+                st.dataframe(perf_df, use_container_width=True, hide_index=True)
+                st.code(st.session_state.perf_log, language='json')
+
         # 班级统计
         if '班级类型' in result_df.columns:
             st.subheader("📊 班级统计")
@@ -1892,6 +4958,107 @@ def main():
 
         st.dataframe(top10, use_container_width=True, hide_index=True)
 
+        # ============ 单个学生明细查询（按需生成） ============
+        st.subheader("🔍 查询单个学生计算明细")
+
+        query = st.text_input(
+            "输入学号或姓名",
+            key='detail_query',
+            placeholder="例如：23040031001 或 张三",
+            help="只生成该学生的明细文件，无需等待全部学生打包"
+        ).strip()
+
+        if query:
+            matches = result_df[
+                (result_df['学号'].astype(str) == query) | (result_df['姓名'].astype(str) == query)
+            ]
+            if matches.empty:
+                st.warning(f"⚠️ 未找到学号或姓名为「{query}」的学生")
+            else:
+                options = [f"{row['学号']} {row['姓名']}（{row['班级类型']}班）" for _, row in matches.iterrows()]
+                choice = 0
+                if len(options) > 1:
+                    # 重名时让用户选择
+                    choice = options.index(st.selectbox("找到多位同名学生，请选择", options))
+                student_id = matches.iloc[choice]['学号']
+
+                detail = get_student_detail(calc, student_id)
+                if detail is None:
+                    st.error(f"❌ 学生 {student_id} 的计算明细生成失败")
+                else:
+                    file_name, content = detail
+                    st.download_button(
+                        label=f"📄 下载 {options[choice]} 的计算明细",
+                        data=content,
+                        file_name=file_name,
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        key='single_detail_download'
+                    )
+
+        # ============ 假设成绩模拟（只重算一位学生） ============
+        st.subheader("🔮 成绩模拟")
+        st.caption("假设某位学生部分课程取得新成绩（或新修一门课），只重算该学生，立即给出新的平均成绩和排名")
+
+        student_options = [f"{row.学号} {row.姓名}" for row in result_df[['学号', '姓名']].itertuples()]
+        whatif_student = st.selectbox("选择学生", ['（请选择）'] + sorted(student_options), key='whatif_student')
+
+        if whatif_student != '（请选择）':
+            whatif_id = whatif_student.split(' ', 1)[0]
+            whatif_courses = st.multiselect("修改已修课程的成绩", calc.student_courses(whatif_id),
+                                            key='whatif_courses')
+            changes = []
+            for i, course in enumerate(whatif_courses):
+                score = st.text_input(f"「{course}」的假设成绩", key=f'whatif_score_{i}_{course}',
+                                      placeholder="例如：90 或 优秀").strip()
+                if score:
+                    changes.append({'课程名称': course, '总成绩': score})
+
+            col1, col2, col3 = st.columns([2, 1, 1])
+            with col1:
+                new_course = st.text_input("新增课程名称（可选）", key='whatif_new_course').strip()
+            with col2:
+                new_score = st.text_input("成绩", key='whatif_new_score', placeholder="例如：85").strip()
+            with col3:
+                new_credit = st.number_input("学分", min_value=0.0, max_value=20.0, value=2.0, step=0.5,
+                                             key='whatif_new_credit')
+            if new_course and new_score:
+                changes.append({'课程名称': new_course, '总成绩': new_score, '学分': new_credit})
+
+            if changes:
+                try:
+                    outcome = calc.simulate_student(whatif_id, changes, st.session_state.semester_filter,
+                                                    st.session_state.calc_mode)
+                except (KeyError, ValueError) as e:
+                    st.error(f"❌ {e.args[0] if e.args else e}")
+                else:
+                    total = outcome['参与排名人数']
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric(
+                            "平均成绩",
+                            f"{outcome['平均成绩']}" if outcome['平均成绩'] is not None else "—",
+                            f"{outcome['平均成绩'] - outcome['原平均成绩']:+.3f}"
+                            if None not in (outcome['平均成绩'], outcome['原平均成绩']) else None
+                        )
+                    with col2:
+                        st.metric(
+                            "排名",
+                            f"{outcome['排名']}/{total}" if outcome['排名'] is not None else "—",
+                            outcome['原排名'] - outcome['排名']
+                            if None not in (outcome['排名'], outcome['原排名']) else None
+                        )
+                    with col3:
+                        st.metric(
+                            f"班级内排名（{outcome['班级类型']}班）",
+                            outcome['班级内排名'] if outcome['班级内排名'] is not None else "—",
+                            outcome['原班级内排名'] - outcome['班级内排名']
+                            if None not in (outcome['班级内排名'], outcome['原班级内排名']) else None
+                        )
+                    st.caption(f"原平均成绩 {outcome['原平均成绩']}，原排名 {outcome['原排名']}；"
+                               f"其他学生的成绩不变")
+                    with st.expander("📋 模拟后计入的课程", expanded=False):
+                        st.dataframe(pd.DataFrame(outcome['课程']), use_container_width=True, hide_index=True)
+
         st.markdown("---")
 
         # ============ 9. 下载结果（对应原文件保存对话框） ============
@@ -1912,19 +5079,32 @@ def main():
                 )
 
         with col2:
+            # 全部学生明细压缩包：按需生成
+            if st.session_state.get('detail_zip') is None:
+                if st.button("📦 生成全部学生明细压缩包", use_container_width=True):
+                    with st.spinner("正在生成学生计算明细..."):
+                        build_detail_zip(calc, int(detail_workers))
+
             # 下载明细压缩包
-            if generate_details and hasattr(st.session_state, 'detail_zip'):
+            if st.session_state.get('detail_zip') is not None:
                 st.download_button(
                     label="📁 下载学生明细压缩包",
-                    data=st.session_state.detail_zip.getvalue(),
+                    data=read_archive(st.session_state.detail_zip),
                     file_name=f"{calc.major_name}_计算明细_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
                     mime="application/zip",
                     use_container_width=True
                 )
 
-                if hasattr(st.session_state, 'student_count'):
+                if st.session_state.get('student_count') is not None:
                     st.info(f"📋 共生成 {st.session_state.student_count} 位学生的计算明细文件")
 
 
 if __name__ == '__main__':
-    main()
+    # streamlit run web.py 时 Streamlit 已加载，进入网页；python web.py serve 启动HTTP计算服务；
+    # 其余 python web.py ... 进入命令行批量计算
+    if 'streamlit' in sys.modules:
+        main()
+    elif sys.argv[1:2] == ['serve']:
+        sys.exit(run_server(sys.argv[2:]))
+    else:
+        sys.exit(run_cli())